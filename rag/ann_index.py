@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Approximate nearest neighbor index construction and evaluation for the RAG system.
+Builds flat, HNSW, IVF-Flat, IVF-PQ or quantized FAISS indexes over normalized
+embeddings and reports recall and latency against exact search.
+
+Quantized indexes (float16, int8 or binary codes) are only used for a first-pass scan;
+their top candidates are re-ranked against the full-precision vectors in vectors.npy.
+"""
+
+import time
+from typing import Any
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf-flat", "ivf-pq", "sq-fp16", "sq-int8", "binary")
+
+# Index types whose scores are approximate and must be re-ranked with exact vectors
+QUANTIZED_INDEX_TYPES = ("sq-fp16", "sq-int8", "binary")
+
+DEFAULT_INDEX_PARAMS: dict[str, dict[str, Any]] = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 128},
+    "ivf-flat": {"nlist": None, "nprobe": 16},
+    "ivf-pq": {"nlist": None, "nprobe": 16, "pq_m": 64, "pq_bits": 8},
+    "sq-fp16": {"rerank_factor": 2},
+    "sq-int8": {"rerank_factor": 4},
+    "binary": {"rerank_factor": 10},
+}
+
+# FAISS warns below roughly this many training points per IVF centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def resolve_index_params(
+    index_type: str, num_vectors: int, overrides: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    """Fill in defaults for an index type, sizing nlist from the number of vectors."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+
+    params = {**DEFAULT_INDEX_PARAMS[index_type]}
+    params.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    if index_type.startswith("ivf") and params.get("nlist") is None:
+        # Rule of thumb: ~4 * sqrt(n) lists, but keep enough points per list to train
+        params["nlist"] = max(
+            1, min(int(4 * np.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID)
+        )
+
+    return params
+
+
+def unwrap_index(index: faiss.Index) -> faiss.Index:
+    """The index inside an ID map, or the index itself."""
+    if isinstance(index, faiss.IndexIDMap | faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def indexed_ids(index: faiss.Index) -> np.ndarray | None:
+    """
+    Ids of the vectors in an index built with ids, or None if the index numbers its
+    vectors by position and can't take new ones by id.
+    """
+    if isinstance(index, faiss.IndexIDMap | faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return None
+    invlists = ivf.invlists
+    if invlists is None:
+        return np.empty(0, dtype=np.int64)
+    ids = []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            list_ids = invlists.get_ids(list_no)
+            ids.append(faiss.rev_swig_ptr(list_ids, size).copy())
+            invlists.release_ids(list_no, list_ids)  # type: ignore[attr-defined]  # Not in stubs
+    return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+
+def build_faiss_index(
+    vectors: np.ndarray,
+    index_type: str,
+    params: dict[str, Any],
+    ids: np.ndarray | None = None,
+) -> faiss.Index:
+    """
+    Build and populate an inner-product index over L2-normalized vectors.
+
+    Args:
+        vectors: Vectors to train on and add
+        index_type: One of INDEX_TYPES
+        params: Resolved parameters (see resolve_index_params)
+        ids: Stable ids of the vectors, so vectors can later be added and removed by id
+            without a rebuild. IVF indexes store ids in their lists; other types are
+            wrapped in an IndexIDMap2.
+    """
+    num_vectors, dimension = vectors.shape
+
+    index: faiss.Index
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, int(params["m"]), faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = int(params["ef_construction"])
+        index = hnsw
+    elif index_type == "ivf-flat":
+        index = faiss.index_factory(
+            dimension, f"IVF{int(params['nlist'])},Flat", faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "ivf-pq":
+        pq_m, pq_bits = int(params["pq_m"]), int(params["pq_bits"])
+        if dimension % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dimension}")
+        if num_vectors < 2**pq_bits:
+            raise ValueError(
+                f"IVF-PQ with {pq_bits}-bit codes needs at least {2**pq_bits} vectors to train, "
+                f"got {num_vectors}"
+            )
+        index = faiss.index_factory(
+            dimension,
+            f"IVF{int(params['nlist'])},PQ{pq_m}x{pq_bits}",
+            faiss.METRIC_INNER_PRODUCT,
+        )
+    elif index_type == "sq-fp16":
+        index = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "sq-int8":
+        index = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "binary":
+        # One sign bit per dimension, compared by Hamming distance
+        index = faiss.IndexLSH(dimension, dimension, False, False)
+    else:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+
+    if not index.is_trained:
+        index.train(vectors)
+    if ids is None:
+        index.add(vectors)
+    else:
+        if not index_type.startswith("ivf"):
+            # IndexIDMap.remove_ids expects the wrapped index to renumber the vectors after
+            # a removal, which IVF lists don't do
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    apply_search_params(index, index_type, params)
+    return index
+
+
+def apply_search_params(index: faiss.Index, index_type: str, params: dict[str, Any]):
+    """Apply query-time parameters (efSearch, nprobe) to a loaded index."""
+    index = unwrap_index(index)
+    if index_type == "hnsw" and "ef_search" in params and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(params["ef_search"])
+    elif index_type.startswith("ivf") and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = int(params["nprobe"])
+
+
+def search_parameters(
+    index: faiss.Index, index_type: str, selector: faiss.IDSelector
+) -> faiss.SearchParameters | None:
+    """
+    Search parameters that restrict a scan to selector, keeping the index's query-time
+    settings. Returns None for index types that can't filter during the scan.
+    """
+    if index_type == "binary":
+        # IndexLSH rejects search parameters
+        return None
+    params: faiss.SearchParameters
+    hnsw = unwrap_index(index)
+    if index_type == "hnsw" and isinstance(hnsw, faiss.IndexHNSW):
+        hnsw_params = faiss.SearchParametersHNSW()  # type: ignore[attr-defined]  # Not in stubs
+        hnsw_params.efSearch = hnsw.hnsw.efSearch
+        params = hnsw_params
+    elif index_type.startswith("ivf"):
+        ivf_params = faiss.SearchParametersIVF()
+        ivf_params.nprobe = faiss.extract_index_ivf(index).nprobe
+        params = ivf_params
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return params
+
+
+def filtered_search(
+    index: faiss.Index,
+    queries: np.ndarray,
+    k: int,
+    params: faiss.SearchParameters | None = None,
+    mask: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Search an index, optionally restricted to the ids set in a boolean mask.
+
+    Args:
+        index: Index to search
+        queries: Normalized query matrix
+        k: Number of results per query
+        params: Search parameters with an ID selector built from the mask, if supported
+        mask: Allowed ids; only needed when params is None and results must be filtered
+    """
+    if mask is None or params is not None:
+        return index.search(queries, k, params=params)
+
+    # The index can't filter during the scan: rank everything and keep allowed ids
+    all_scores, all_ids = index.search(queries, index.ntotal)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (row_scores, row_ids) in enumerate(zip(all_scores, all_ids)):
+        keep = (row_ids >= 0) & mask[np.maximum(row_ids, 0)]
+        row_scores, row_ids = row_scores[keep][:k], row_ids[keep][:k]
+        scores[row, : len(row_ids)] = row_scores
+        ids[row, : len(row_ids)] = row_ids
+    return scores, ids
+
+
+def rerank(
+    vectors: np.ndarray, queries: np.ndarray, candidate_ids: np.ndarray, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Re-rank first-pass candidates by exact inner product.
+
+    Args:
+        vectors: Full-precision normalized vectors (may be a read-only memmap)
+        queries: Normalized query matrix, one row per query
+        candidate_ids: Candidate ids from the first-pass scan, -1 for missing entries
+        k: Number of results to keep per query
+
+    Returns:
+        (scores, ids) shaped like a FAISS search result, padded with -1 ids
+    """
+    valid = candidate_ids >= 0
+    # Only the candidate rows are read, so a memmap stays mostly unpaged
+    gathered = np.asarray(vectors[np.where(valid, candidate_ids, 0)], dtype=np.float32)
+    scores = np.einsum("qcd,qd->qc", gathered, queries)
+    scores[~valid] = -np.inf
+
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    top_scores = np.take_along_axis(scores, order, axis=1)
+    top_ids = np.where(
+        np.isfinite(top_scores), np.take_along_axis(candidate_ids, order, axis=1), -1
+    )
+    return top_scores, top_ids
+
+
+def search_with_rerank(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    rerank_factor: int,
+    params: faiss.SearchParameters | None = None,
+    mask: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Scan a quantized index for rerank_factor * k candidates and re-rank them exactly."""
+    candidates = min(k * rerank_factor, index.ntotal)
+    _, candidate_ids = filtered_search(index, queries, candidates, params, mask)
+    return rerank(vectors, queries, candidate_ids, k)
+
+
+def evaluate_index_configs(
+    vectors: np.ndarray,
+    configs: list[tuple[str, dict[str, Any]]],
+    k: int = 10,
+    queries: np.ndarray | None = None,
+    num_queries: int = 200,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    Compare index configurations against exact search.
+
+    Args:
+        vectors: L2-normalized corpus vectors
+        configs: (index_type, params) pairs to evaluate
+        k: Number of neighbors for recall@k
+        queries: Optional L2-normalized query vectors; by default a random held-out sample
+            of the corpus is removed from the indexed vectors and used as queries
+        num_queries: Size of the held-out sample when no queries are given
+        seed: Random seed for the held-out sample
+    """
+    if queries is not None:
+        base = vectors
+        query_source = "query set"
+    else:
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(vectors))
+        holdout = min(num_queries, max(1, len(vectors) // 10))
+        queries = vectors[order[:holdout]]
+        base = vectors[order[holdout:]]
+        query_source = "held-out chunks"
+
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    base = np.ascontiguousarray(base, dtype=np.float32)
+    k = min(k, len(base))
+
+    # Ground truth from exact inner-product search
+    exact = faiss.IndexFlatIP(base.shape[1])
+    exact.add(base)
+    _, ground_truth = exact.search(queries, k)
+
+    results = []
+    for index_type, params in configs:
+        resolved = resolve_index_params(index_type, len(base), params)
+
+        build_start = time.perf_counter()
+        index = build_faiss_index(base, index_type, resolved)
+        build_seconds = time.perf_counter() - build_start
+
+        factor = int(resolved["rerank_factor"]) if index_type in QUANTIZED_INDEX_TYPES else 0
+
+        def search(batch, index=index, factor=factor):
+            if factor:
+                return search_with_rerank(index, base, batch, k, factor)
+            return index.search(batch, k)
+
+        results.append(
+            {
+                "index_type": index_type,
+                "params": resolved,
+                "build_seconds": round(build_seconds, 3),
+                "index_bytes": int(faiss.serialize_index(index).nbytes),
+                **measure_recall_latency(search, queries, ground_truth, k),
+            }
+        )
+
+    return {
+        "k": k,
+        "num_queries": len(queries),
+        "num_vectors": len(base),
+        "query_source": query_source,
+        "results": results,
+    }
+
+
+def measure_recall_latency(
+    search, queries: np.ndarray, ground_truth: np.ndarray, k: int
+) -> dict[str, float]:
+    """Measure recall@k against ground truth and per-query latency of search(queries)."""
+    latencies = []
+    hits = 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = search(queries[i : i + 1])
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(found[0].tolist()) & set(ground_truth[i].tolist()))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+def format_index_report(report: dict[str, Any]) -> str:
+    """Format an evaluation report as a table for the build log."""
+    lines = [
+        f"Recall@{report['k']} over {report['num_queries']} {report['query_source']} "
+        f"({report['num_vectors']} indexed vectors)",
+        f"   {'index':<10} {'recall':>8} {'p50 ms':>9} {'p99 ms':>9} {'size':>12}  params",
+    ]
+    for row in report["results"]:
+        lines.append(
+            f"   {row['index_type']:<10} {row['recall_at_k']:>8.4f} {row['p50_ms']:>9.3f} "
+            f"{row['p99_ms']:>9.3f} {row['index_bytes']:>12,}  {row['params']}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+File-level change manifest for incremental vector database builds.
+
+The builder records, for every HTML file it split, the file's size, mtime and SHA-256
+along with the content hashes of the chunks it produced. On the next build a file whose
+size and mtime are unchanged is skipped without being read; one whose stat changed but
+whose bytes hash the same (a touch, a fresh checkout) is skipped after hashing. Skipped
+files keep the chunks already in the database, so only edited files are parsed.
+
+The manifest also records the splitter settings, since changing them changes the chunks
+of every file.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str | Path) -> str:
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """Per-file record of what the last build parsed, keyed by path."""
+
+    def __init__(self, settings: dict[str, Any], files: dict[str, dict[str, Any]] | None = None):
+        """
+        Initialize the manifest.
+
+        Args:
+            settings: Splitter settings the recorded chunks were produced with
+            files: Recorded entries: path -> {"size", "mtime_ns", "sha256", "chunk_hashes"}
+        """
+        self.settings = settings
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, db_path: str | Path, settings: dict[str, Any]) -> "BuildManifest":
+        """Read the manifest of a database, or start an empty one if it was built differently."""
+        path = Path(db_path) / MANIFEST_FILE
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(settings)
+        if data.get("version") != MANIFEST_VERSION or data.get("settings") != settings:
+            print("📋 Splitter settings changed, re-parsing every file")
+            return cls(settings)
+        return cls(settings, data.get("files", {}))
+
+    def unchanged(self, html_file: str | Path, content_hashes: dict[str, int]) -> bool:
+        """
+        Whether a file is byte-for-byte what the last build parsed and its chunks are
+        still in the database.
+
+        Args:
+            html_file: File to check
+            content_hashes: Chunk content hashes in the database being updated
+        """
+        entry = self.files.get(str(html_file))
+        if entry is None or not all(h in content_hashes for h in entry["chunk_hashes"]):
+            return False
+
+        stat = os.stat(html_file)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            if file_sha256(html_file) != entry["sha256"]:
+                return False
+            # Same bytes with a new mtime: remember it so the next build skips the read
+            entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def record(self, html_file: str | Path, chunk_hashes: list[str]):
+        """Record a file that was just split into chunks with these content hashes."""
+        stat = os.stat(html_file)
+        self.files[str(html_file)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(html_file),
+            "chunk_hashes": chunk_hashes,
+        }
+
+    def retain(self, html_files: Iterable[str | Path]):
+        """Forget files that are no longer part of the build."""
+        current = {str(html_file) for html_file in html_files}
+        self.files = {path: entry for path, entry in self.files.items() if path in current}
+
+    def save(self, path: str | Path):
+        """Write the manifest as JSON."""
+        with open(path, "w") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "settings": self.settings, "files": self.files},
+                f,
+                indent=1,
+            )
@@ -8,47 +8,55 @@ from pathlib import Path
 from bs4 import BeautifulSoup
 
 
-def extract_page_metadata(html_file_path: str) -> dict[str, str]:
+def page_metadata_from_soup(soup: BeautifulSoup) -> dict[str, str]:
     """
-    Extract citation metadata from HTML file.
+    Extract citation metadata from an already parsed HTML page.
     Returns dict with url, title, description, published, etc.
     """
-    try:
-        with open(html_file_path, encoding="utf-8") as f:
-            content = f.read()
+    metadata = {}
+
+    # Extract meta tags
+    meta_tags = soup.find_all("meta")
+    for tag in meta_tags:
+        name = tag.get("name")
+        content_val = tag.get("content")
 
-        soup = BeautifulSoup(content, "lxml")
+        if name and content_val:
+            metadata[name] = content_val
 
-        metadata = {}
+    # Get title from title tag if not in meta
+    if "title" not in metadata:
+        title_tag = soup.find("title")
+        if title_tag:
+            metadata["title"] = title_tag.get_text().strip()
 
-        # Extract meta tags
-        meta_tags = soup.find_all("meta")
-        for tag in meta_tags:
-            name = tag.get("name")
-            content_val = tag.get("content")
+    return metadata
 
-            if name and content_val:
-                metadata[name] = content_val
 
-        # Get title from title tag if not in meta
-        if "title" not in metadata:
-            title_tag = soup.find("title")
-            if title_tag:
-                metadata["title"] = title_tag.get_text().strip()
+def extract_page_metadata(html_file_path: str) -> dict[str, str]:
+    """
+    Extract citation metadata from HTML file.
+    Returns dict with url, title, description, published, etc.
+    """
+    try:
+        with open(html_file_path, encoding="utf-8") as f:
+            content = f.read()
 
-        return metadata
+        return page_metadata_from_soup(BeautifulSoup(content, "lxml"))
 
     except Exception as e:
         print(f"Warning: Could not extract metadata from {html_file_path}: {e}")
         return {}
 
 
-def get_citation_url(html_file_path: str) -> str:
+def get_citation_url(html_file_path: str, metadata: dict[str, str] | None = None) -> str:
     """
     Get the citation URL for a given HTML file.
     Returns relative URL suitable for citations.
+    Pass the page's metadata if it has already been extracted to avoid parsing it again.
     """
-    metadata = extract_page_metadata(html_file_path)
+    if metadata is None:
+        metadata = extract_page_metadata(html_file_path)
 
     # Use URL from metadata if available
     if "url" in metadata:
@@ -105,15 +113,19 @@ def format_citation(metadata: dict[str, str]) -> str:
     return " - ".join(parts) if parts else "Unknown source"
 
 
-def enrich_chunk_metadata(chunk_metadata: dict, html_file_path: str) -> dict:
+def enrich_chunk_metadata(
+    chunk_metadata: dict, html_file_path: str, page_metadata: dict[str, str] | None = None
+) -> dict:
     """
     Enrich chunk metadata with citation information.
+    Pass the page's metadata when enriching many chunks of one page, so it is parsed once.
     """
     # Get page metadata
-    page_metadata = extract_page_metadata(html_file_path)
+    if page_metadata is None:
+        page_metadata = extract_page_metadata(html_file_path)
 
     # Add citation URL
-    citation_url = get_citation_url(html_file_path)
+    citation_url = get_citation_url(html_file_path, page_metadata)
 
     # Create enriched metadata
     enriched = {
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Embedding dimension reduction for the vector database.
+Shortens normalized embeddings by truncation or a PCA projection fitted on the corpus,
+persists the projection next to the index and measures the recall it costs.
+
+Truncation keeps the leading dimensions and re-normalizes, which is what the
+embeddings API does for text-embedding-3 models when a smaller `dimensions` value is
+requested, so cached full-width embeddings can be shortened without re-embedding.
+"""
+
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import faiss
+import numpy as np
+
+REDUCTION_METHODS = ("none", "truncate", "pca")
+
+
+class DimensionReducer:
+    """Projection from full-width embeddings to a shorter, re-normalized vector."""
+
+    def __init__(
+        self,
+        method: str,
+        dimensions: int,
+        mean: np.ndarray | None = None,
+        components: np.ndarray | None = None,
+    ):
+        """
+        Initialize the reducer.
+
+        Args:
+            method: "truncate" or "pca"
+            dimensions: Output dimension
+            mean: PCA centering vector (pca only)
+            components: PCA projection matrix, one row per output dimension (pca only)
+        """
+        if method not in REDUCTION_METHODS or method == "none":
+            raise ValueError(f"Unknown reduction method: {method} (expected truncate or pca)")
+        if method == "pca" and (mean is None or components is None):
+            raise ValueError("PCA reduction needs a fitted mean and components")
+
+        self.method = method
+        self.dimensions = dimensions
+        self.mean = mean
+        self.components = components
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, method: str, dimensions: int) -> "DimensionReducer":
+        """Fit a reducer on normalized corpus vectors."""
+        source_dimension = vectors.shape[1]
+        if not 0 < dimensions < source_dimension:
+            raise ValueError(
+                f"Reduced dimension must be between 1 and {source_dimension - 1}, got {dimensions}"
+            )
+        if method != "pca":
+            return cls(method, dimensions)
+
+        # Top principal components from the covariance matrix (d x d, independent of n)
+        vectors = np.asarray(vectors, dtype=np.float64)
+        mean = vectors.mean(axis=0)
+        centered = vectors - mean
+        covariance = centered.T @ centered / max(len(vectors) - 1, 1)
+        _, eigenvectors = np.linalg.eigh(covariance)
+        components = eigenvectors[:, ::-1][:, :dimensions].T
+        return cls(
+            method,
+            dimensions,
+            mean=mean.astype(np.float32),
+            components=np.ascontiguousarray(components, dtype=np.float32),
+        )
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Project normalized vectors and re-normalize them for inner-product search."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # Only PCA reducers have a mean and components (checked in __init__)
+        if self.mean is None or self.components is None:
+            reduced = np.array(vectors[:, : self.dimensions], dtype=np.float32)
+        else:
+            reduced = np.ascontiguousarray((vectors - self.mean) @ self.components.T)
+        faiss.normalize_L2(reduced)
+        return reduced
+
+    def config(self) -> dict[str, Any]:
+        """Settings recorded in build_info.json."""
+        return {"method": self.method, "dimensions": self.dimensions}
+
+    def save(self, path: str | Path | BinaryIO):
+        """Write the reducer to an .npz file or open binary file."""
+        arrays: dict[str, Any] = {
+            "method": np.array(self.method),
+            "dimensions": np.array(self.dimensions),
+        }
+        if self.mean is not None and self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "DimensionReducer":
+        """Read a reducer written by save()."""
+        with np.load(path) as data:
+            method = str(data["method"])
+            return cls(
+                method,
+                int(data["dimensions"]),
+                mean=data["mean"] if method == "pca" else None,
+                components=data["components"] if method == "pca" else None,
+            )
+
+
+def evaluate_reduction(
+    vectors: np.ndarray,
+    reducer: DimensionReducer,
+    k: int = 10,
+    queries: np.ndarray | None = None,
+    num_queries: int = 200,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    Measure recall@k of exact search over reduced vectors against full-width search.
+
+    Args:
+        vectors: L2-normalized full-width corpus vectors
+        reducer: Fitted reducer to evaluate
+        k: Number of neighbors for recall@k
+        queries: Optional L2-normalized full-width query vectors; by default a random
+            held-out sample of the corpus is used
+        num_queries: Size of the held-out sample when no queries are given
+        seed: Random seed for the held-out sample
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(vectors))
+        holdout = min(num_queries, max(1, len(vectors) // 10))
+        queries = vectors[order[:holdout]]
+        vectors = vectors[order[holdout:]]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+
+    full = faiss.IndexFlatIP(vectors.shape[1])
+    full.add(vectors)
+    _, ground_truth = full.search(queries, k)
+
+    reduced = faiss.IndexFlatIP(reducer.dimensions)
+    reduced.add(reducer.transform(vectors))
+    _, found = reduced.search(reducer.transform(queries), k)
+
+    hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(found, ground_truth))
+    recall = hits / (len(queries) * k)
+    return {
+        **reducer.config(),
+        "source_dimension": int(vectors.shape[1]),
+        "k": k,
+        "num_queries": len(queries),
+        "recall_at_k": round(recall, 4),
+        "recall_loss": round(1 - recall, 4),
+        "bytes_per_vector": 4 * reducer.dimensions,
+        "source_bytes_per_vector": 4 * int(vectors.shape[1]),
+    }
+
+
+def format_reduction_report(report: dict[str, Any]) -> str:
+    """Format a reduction evaluation for the build log."""
+    return (
+        f"{report['method']} {report['source_dimension']} -> {report['dimensions']} dims: "
+        f"recall@{report['k']} {report['recall_at_k']:.4f} "
+        f"(loss {report['recall_loss']:.4f}) over {report['num_queries']} queries, "
+        f"{report['bytes_per_vector']:,} vs {report['source_bytes_per_vector']:,} bytes/vector"
+    )
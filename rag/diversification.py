@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Result diversification for the RAG loader.
+
+The splitter overlaps neighboring chunks by a paragraph or more, so a plain top-k often
+returns several near-duplicate chunks from one section. Maximal marginal relevance
+re-orders candidates to trade relevance against similarity to what is already selected,
+and adjacent chunks that do make it into the results can be merged into one passage.
+"""
+
+import numpy as np
+
+PARAGRAPH_SEPARATOR = "\n\n"
+
+
+def mmr_order(relevance: np.ndarray, vectors: np.ndarray, lambda_: float) -> list[int]:
+    """
+    Order candidates by maximal marginal relevance.
+
+    Args:
+        relevance: Relevance of each candidate to the query, best first or in any order
+        vectors: Normalized candidate vectors, one row per candidate
+        lambda_: Weight of relevance versus novelty; 1.0 keeps the relevance order
+
+    Returns:
+        Candidate positions in selection order
+    """
+    count = len(relevance)
+    if count == 0:
+        return []
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    # All pairwise similarities in one product; the greedy loop only takes maxima
+    similarity = vectors @ vectors.T
+
+    order = [int(np.argmax(relevance))]
+    chosen = np.zeros(count, dtype=bool)
+    chosen[order[0]] = True
+    max_similarity = similarity[order[0]].copy()
+
+    for _ in range(count - 1):
+        scores = lambda_ * relevance - (1 - lambda_) * max_similarity
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        chosen[best] = True
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return order
+
+
+def _overlap(paragraphs: list[str], incoming: list[str]) -> int:
+    """Length of the longest suffix of paragraphs that is a prefix of incoming."""
+    for size in range(min(len(paragraphs), len(incoming)), 0, -1):
+        if paragraphs[-size:] == incoming[:size]:
+            return size
+    return 0
+
+
+def paragraph_overlap(previous: str, following: str) -> int:
+    """Number of paragraphs that end the previous chunk text and start the following one."""
+    return _overlap(previous.split(PARAGRAPH_SEPARATOR), following.split(PARAGRAPH_SEPARATOR))
+
+
+def merge_overlapping_texts(texts: list[str]) -> str:
+    """Join consecutive chunk texts, dropping paragraphs repeated by the chunk overlap."""
+    paragraphs: list[str] = []
+    for text in texts:
+        incoming = text.split(PARAGRAPH_SEPARATOR)
+        paragraphs.extend(incoming[_overlap(paragraphs, incoming) :])
+    return PARAGRAPH_SEPARATOR.join(paragraphs)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Compact binary document store for the vector database.
+
+Chunk texts and metadata are written to a single file as an offsets table plus
+UTF-8 blobs. The loader memory-maps the file and only decodes a chunk's text and
+metadata when that chunk is actually returned from a search.
+
+Layout (all integers little-endian):
+    magic      8 bytes   b"RAGDOCS1"
+    count      uint64    number of chunks
+    text_offs  uint64 * (count + 1)   offsets into the text blob
+    meta_offs  uint64 * (count + 1)   offsets into the metadata blob
+    text blob  UTF-8 chunk texts, concatenated
+    meta blob  compact JSON metadata records, concatenated
+"""
+
+import json
+import mmap
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+MAGIC = b"RAGDOCS1"
+HEADER_SIZE = len(MAGIC) + 8
+
+
+def write_document_store(path: str | Path, texts: list[str], metadata: list[dict]):
+    """Write chunk texts and metadata to a binary document store."""
+    if len(texts) != len(metadata):
+        raise ValueError(f"Got {len(texts)} texts but {len(metadata)} metadata records")
+
+    encoded_texts = [text.encode("utf-8") for text in texts]
+    encoded_meta = [
+        json.dumps(meta, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        for meta in metadata
+    ]
+
+    text_offsets = np.zeros(len(texts) + 1, dtype="<u8")
+    text_offsets[1:] = np.cumsum([len(b) for b in encoded_texts])
+    meta_offsets = np.zeros(len(metadata) + 1, dtype="<u8")
+    meta_offsets[1:] = np.cumsum([len(b) for b in encoded_meta])
+
+    # Write to a temporary file first so readers never see a partial store
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(texts)).astype("<u8").tobytes())
+        f.write(text_offsets.tobytes())
+        f.write(meta_offsets.tobytes())
+        for chunk in encoded_texts:
+            f.write(chunk)
+        for chunk in encoded_meta:
+            f.write(chunk)
+    tmp_path.replace(path)
+
+
+class _LazyColumn(Sequence):
+    """Read-only sequence view that decodes entries on access."""
+
+    def __init__(self, store: "DocumentStore", decode):
+        self._store = store
+        self._decode = decode
+
+    def __len__(self) -> int:
+        return self._store.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Document index {i} out of range")
+        return self._decode(int(i))
+
+
+class DocumentStore:
+    """Memory-mapped reader for a binary document store."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a document store: {self.path}")
+
+        self.count = int(np.frombuffer(self._mmap, dtype="<u8", count=1, offset=len(MAGIC))[0])
+        self._text_offsets = np.frombuffer(
+            self._mmap, dtype="<u8", count=self.count + 1, offset=HEADER_SIZE
+        )
+        self._meta_offsets = np.frombuffer(
+            self._mmap, dtype="<u8", count=self.count + 1, offset=HEADER_SIZE + 8 * (self.count + 1)
+        )
+        self._text_base = HEADER_SIZE + 16 * (self.count + 1)
+        self._meta_base = self._text_base + int(self._text_offsets[-1])
+
+        self.texts = _LazyColumn(self, self.text)
+        self.metadata = _LazyColumn(self, self.meta)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def text(self, i: int) -> str:
+        """Decode the text of chunk i."""
+        start = self._text_base + int(self._text_offsets[i])
+        end = self._text_base + int(self._text_offsets[i + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def meta(self, i: int) -> dict[str, Any]:
+        """Decode the metadata of chunk i."""
+        start = self._meta_base + int(self._meta_offsets[i])
+        end = self._meta_base + int(self._meta_offsets[i + 1])
+        meta: dict[str, Any] = json.loads(self._mmap[start:end])
+        return meta
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._mmap)
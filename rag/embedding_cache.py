@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Query embedding cache for the RAG loader.
+Keeps recent query embeddings in a bounded in-memory LRU with a TTL, optionally
+backed by a SQLite file that all workers on the host share.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings with an optional persistent tier."""
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int = 1024,
+        ttl_seconds: float = 24 * 60 * 60,
+        persist_path: str | None = None,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            namespace: Embedding deployment and API version; entries from other namespaces never match
+            max_entries: Maximum number of embeddings held in memory
+            ttl_seconds: Entries older than this are treated as misses
+            persist_path: Optional SQLite file shared across workers
+        """
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+        if persist_path:
+            Path(persist_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(persist_path, check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(key TEXT PRIMARY KEY, created REAL NOT NULL, vector BLOB NOT NULL)"
+            )
+            # Drop expired entries so the shared file doesn't grow without bound
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE created < ?", (time.time() - ttl_seconds,)
+            )
+            self._db.commit()
+
+    def _key(self, query: str) -> str:
+        payload = f"{self.namespace}\n{normalize_query(query)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, query: str) -> np.ndarray | None:
+        """Return the cached embedding for a query, or None on a miss."""
+        key = self._key(query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, vector = entry
+                if now - created < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, vector FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[0] < self.ttl_seconds:
+                    vector = np.frombuffer(row[1], dtype=np.float32)
+                    self._remember(key, row[0], vector)
+                    self.hits += 1
+                    self.persistent_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector) -> np.ndarray:
+        """Store an embedding for a query and return it as a float32 array."""
+        key = self._key(query)
+        embedding: np.ndarray = np.asarray(vector, dtype=np.float32)
+        embedding.setflags(write=False)
+        created = time.time()
+
+        with self._lock:
+            self._remember(key, created, embedding)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (key, created, vector) "
+                        "VALUES (?, ?, ?)",
+                        (key, created, embedding.tobytes()),
+                    )
+                    self._db.commit()
+                except sqlite3.OperationalError as e:
+                    # Another worker holding the write lock should never fail a search
+                    print(f"Warning: Could not persist query embedding: {e}")
+        return embedding
+
+    def _remember(self, key: str, created: float, vector: np.ndarray):
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        """Close the persistent tier; the cache keeps working from memory."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "query_cache_entries": len(self._entries),
+            "query_cache_hits": self.hits,
+            "query_cache_persistent_hits": self.persistent_hits,
+            "query_cache_misses": self.misses,
+            "query_cache_hit_rate": self.hits / lookups if lookups else 0.0,
+        }
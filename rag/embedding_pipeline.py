@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Concurrent embedding requests for the vector database builder.
+
+Texts are packed into batches of up to a token budget per request and sent with several
+requests in flight at once, so a clean build is bounded by the embeddings quota instead
+of by round-trip latency. Texts longer than the model's input limit are split on token
+boundaries and their pieces' embeddings averaged, weighted by tokens (or truncated, if
+asked), with a warning, instead of failing the request. The number of
+requests in flight is adjusted AIMD-style: each successful batch raises the limit by
+about one request per window of successes, up to the configured maximum; a rate-limited
+(429) batch halves it and pauses every new request for the Retry-After the service asked
+for. All requests that fail in the same congestion event share one decrease.
+
+Batches that are rate limited, or fail with a server error (5xx), timeout or connection
+error, are retried with backoff; other errors fail the build. Transient failures don't
+change the limit.
+"""
+
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import numpy as np
+
+DEFAULT_BATCH_TOKENS = 16384
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_MAX_RETRIES = 8
+
+# Input limits of the text-embedding-3 and ada-002 models
+MAX_INPUT_TOKENS = 8191
+MAX_BATCH_INPUTS = 2048
+
+OVERSIZE_POLICIES = ("split", "truncate")
+
+# Encoding of the text-embedding-3 and ada-002 models
+TOKEN_ENCODING = "cl100k_base"
+
+# Estimate used when the encoding isn't available
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """The tiktoken encoding, or None when tiktoken or its encoding files aren't available."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            print(
+                f"⚠️  Token counts are estimated ({TOKEN_ENCODING} unavailable: {type(e).__name__})"
+            )
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in a text under TOKEN_ENCODING, or an estimate of about four characters per
+    token when the encoding isn't available (offline builds).
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_by_tokens(text: str, max_tokens: int) -> list[str]:
+    """Consecutive pieces of a text of at most max_tokens tokens each."""
+    encoding = _get_encoding()
+    if encoding is None:
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[i : i + size] for i in range(0, len(text), size)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i : i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def fit_inputs(
+    texts: list[str], max_input_tokens: int = MAX_INPUT_TOKENS, oversize: str = "split"
+) -> tuple[list[str], list[int], list[int]]:
+    """
+    Fit texts to the model's input limit.
+
+    Args:
+        texts: Texts to embed
+        max_input_tokens: Most tokens the model accepts in one input
+        oversize: "split" longer texts into pieces whose embeddings are averaged, or
+            "truncate" them to their first max_input_tokens tokens
+
+    Returns:
+        (inputs, index of the text each input came from, tokens per input)
+    """
+    if oversize not in OVERSIZE_POLICIES:
+        raise ValueError(
+            f"Unknown oversize policy: {oversize} (expected one of {OVERSIZE_POLICIES})"
+        )
+
+    inputs, owners, token_counts = [], [], []
+    for i, text in enumerate(texts):
+        count = count_tokens(text)
+        pieces = [text]
+        oversized = count > max_input_tokens
+        if oversized:
+            pieces = split_by_tokens(text, max_input_tokens)
+            if oversize == "truncate":
+                pieces = pieces[:1]
+                action = f"truncated to {max_input_tokens:,}"
+            else:
+                action = f"split into {len(pieces)} pieces"
+            print(f"⚠️  Input {i} has {count:,} tokens (limit {max_input_tokens:,}), {action}")
+        for piece in pieces:
+            inputs.append(piece)
+            owners.append(i)
+            token_counts.append(count_tokens(piece) if oversized else count)
+    return inputs, owners, token_counts
+
+
+def pack_batches(
+    token_counts: list[int],
+    max_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_inputs: int = MAX_BATCH_INPUTS,
+) -> list[tuple[int, int]]:
+    """
+    Group consecutive inputs into requests of at most max_tokens tokens and max_inputs
+    inputs; an input larger than max_tokens gets a request of its own.
+
+    Returns:
+        (start, end) ranges of the inputs in each request
+    """
+    batches = []
+    start = total = 0
+    for i, count in enumerate(token_counts):
+        if i > start and (total + count > max_tokens or i - start == max_inputs):
+            batches.append((start, i))
+            start, total = i, 0
+        total += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def combine_pieces(
+    vectors: list[list[float]], owners: list[int], token_counts: list[int]
+) -> list[list[float]]:
+    """One embedding per text: the token-weighted, renormalized mean of its pieces' vectors."""
+    combined = []
+    for _, group in itertools.groupby(range(len(owners)), key=owners.__getitem__):
+        rows = list(group)
+        if len(rows) == 1:
+            combined.append(vectors[rows[0]])
+            continue
+        mean = np.average(
+            np.array([vectors[row] for row in rows], dtype=np.float64),
+            axis=0,
+            weights=[token_counts[row] for row in rows],
+        )
+        norm = np.linalg.norm(mean)
+        combined.append((mean / norm if norm else mean).tolist())
+    return combined
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether an embeddings error is a 429 from the service."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether an embeddings error is worth retrying: a 5xx, timeout or connection error."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    # openai's APITimeoutError and APIConnectionError, httpx's transport errors
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & {"APIConnectionError", "APITimeoutError", "TimeoutException", "NetworkError"}:
+        return True
+    return isinstance(error, TimeoutError | ConnectionError)
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """
+    Delay requested by a rate-limited response: Azure's retry-after-ms, or Retry-After in
+    seconds or as an HTTP date. None if the response didn't say.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class AIMDLimiter:
+    """Additive-increase, multiplicative-decrease limit on concurrent requests."""
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        min_in_flight: int = 1,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Initialize the limiter at its maximum.
+
+        Args:
+            max_in_flight: Most requests allowed in flight
+            min_in_flight: The limit never drops below this
+            decrease_factor: Multiplier applied to the limit on a rate-limit response
+        """
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_in_flight)
+        self.lowest_limit = self.limit
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.rate_limited = 0
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Wait for a free slot outside any pause; returns the request's start time."""
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            async with self._condition:
+                if time.monotonic() < self._paused_until:
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                    return time.monotonic()
+                await self._condition.wait()
+
+    async def release(
+        self, started: float, rate_limited: bool = False, delay: float = 0.0, failed: bool = False
+    ):
+        """
+        Free a slot and adjust the limit.
+
+        Args:
+            started: Start time returned by acquire()
+            rate_limited: Whether the request got a 429
+            delay: Seconds to pause new requests after a 429
+            failed: Whether the request failed some other way; leaves the limit alone
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if rate_limited:
+                self.rate_limited += 1
+                # Requests sent before the last decrease saw the old limit; don't count them twice
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_in_flight, self.limit * self.decrease_factor)
+                    self.lowest_limit = min(self.lowest_limit, self.limit)
+                    self._last_decrease = now
+                self._paused_until = max(self._paused_until, now + delay)
+            elif not failed:
+                self.limit = min(self.max_in_flight, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class EmbeddingStats:
+    """Throughput of one embedding run."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.tokens = 0
+        self.requests = 0
+        self.seconds = 0.0
+        self.rate_limited = 0
+        self.peak_in_flight = 0
+        self.lowest_limit = 0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "requests": self.requests,
+            "seconds": round(self.seconds, 3),
+            "chunks_per_second": round(self.chunks_per_second, 2),
+            "tokens_per_second": round(self.tokens_per_second, 1),
+            "rate_limited": self.rate_limited,
+            "peak_in_flight": self.peak_in_flight,
+            "lowest_limit": self.lowest_limit,
+        }
+
+    def summary(self) -> str:
+        """One-line report for the build log."""
+        line = (
+            f"{self.chunks} chunks, {self.tokens:,} tokens in {self.seconds:.1f}s "
+            f"({self.chunks_per_second:.1f} chunks/s, {self.tokens_per_second:,.0f} tokens/s)"
+        )
+        if self.rate_limited:
+            line += (
+                f", {self.rate_limited} rate-limited requests, limit fell to {self.lowest_limit}"
+            )
+        return line
+
+
+async def embed_concurrently(
+    embeddings_model,
+    texts: list[str],
+    batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff: float = 1.0,
+    max_input_tokens: int = MAX_INPUT_TOKENS,
+    oversize: str = "split",
+) -> tuple[list[list[float]], EmbeddingStats]:
+    """
+    Embed texts in token-budgeted batches with up to max_in_flight concurrent requests.
+
+    Args:
+        embeddings_model: Client with aembed_documents
+        texts: Texts to embed
+        batch_tokens: Token budget per request
+        max_in_flight: Most concurrent requests; 429s lower the limit below this
+        max_retries: Retries allowed per batch after 429s and transient errors
+        backoff: Pause after a 429 without Retry-After or a transient error, doubled on each
+            retry of a batch
+        max_input_tokens: Most tokens the model accepts in one input
+        oversize: How to fit longer texts (see fit_inputs)
+
+    Returns:
+        (embeddings in the order of texts, throughput stats)
+    """
+    stats = EmbeddingStats()
+    limiter = AIMDLimiter(max_in_flight)
+    inputs, owners, token_counts = fit_inputs(texts, max_input_tokens, oversize)
+    batches = [inputs[start:end] for start, end in pack_batches(token_counts, batch_tokens)]
+    results: list[list[list[float]]] = [[] for _ in batches]
+    completed = 0
+
+    async def embed_batch(number: int, batch: list[str]):
+        nonlocal completed
+        for attempt in range(max_retries + 1):
+            started = await limiter.acquire()
+            stats.requests += 1
+            try:
+                results[number] = await embeddings_model.aembed_documents(batch)
+            except Exception as e:
+                if attempt == max_retries or not (is_rate_limited(e) or is_transient_error(e)):
+                    await limiter.release(started, failed=True)
+                    raise
+                if is_rate_limited(e):
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = backoff * 2**attempt
+                    await limiter.release(started, rate_limited=True, delay=delay)
+                else:
+                    await limiter.release(started, failed=True)
+                    print(f"   ⚠️ Embedding batch failed ({e}), retrying")
+                    await asyncio.sleep(backoff * 2**attempt)
+                continue
+            await limiter.release(started)
+            completed += 1
+            print(f"   Embedded batch {completed}/{len(batches)} ({int(limiter.limit)} in flight)")
+            return
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(embed_batch(n, batch)) for n, batch in enumerate(batches)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    stats.seconds = time.perf_counter() - start
+
+    stats.chunks = len(texts)
+    stats.tokens = sum(token_counts)
+    stats.rate_limited = limiter.rate_limited
+    stats.peak_in_flight = limiter.peak_in_flight
+    stats.lowest_limit = int(limiter.lowest_limit)
+    vectors = [vector for batch in results for vector in batch]
+    return combine_pieces(vectors, owners, token_counts), stats
+
+
+def embed_texts(
+    embeddings_model, texts: list[str], **options: Any
+) -> tuple[list[list[float]], EmbeddingStats]:
+    """
+    Synchronous embed_concurrently(). Runs on a separate thread's event loop when called
+    from one that is already running (an async caller using the builder).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(embed_concurrently(embeddings_model, texts, **options))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(
+            asyncio.run, embed_concurrently(embeddings_model, texts, **options)
+        ).result()
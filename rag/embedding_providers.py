@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Embedding providers for the RAG system.
+
+The builder, the loader and essay_similarity.py get their embeddings client from
+get_embedding_provider(), selected by EMBEDDINGS_PROVIDER:
+
+    azure    Azure OpenAI deployment in AZURE_OPENAI_EMBEDDINGS_ENDPOINT (default)
+    hashed   Deterministic hashed word and character n-gram vectors computed locally, so
+             builds, benchmarks and load tests run without credentials or network access
+
+EMBEDDINGS_DIMENSIONS sets the vector width: the hashed width (default 3072, the width of
+text-embedding-3-large), or a shortened output for text-embedding-3 Azure deployments.
+"""
+
+import os
+import re
+import threading
+import zlib
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from lexical_index import tokenize
+
+EMBEDDING_PROVIDERS = ("azure", "hashed")
+
+# Same width as text-embedding-3-large, so offline benchmarks scan realistic vectors
+DEFAULT_HASHED_DIMENSIONS = 3072
+
+
+class HashedEmbeddings:
+    """
+    Local embeddings from hashed word and character n-gram features.
+
+    Texts that share words or word fragments get similar vectors, so retrieval behaves
+    plausibly without any real semantics. The hash is stable across processes and
+    machines, so the same text always gets the same vector.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_HASHED_DIMENSIONS, ngram_sizes=(3, 4)):
+        """
+        Initialize the hasher.
+
+        Args:
+            dimensions: Vector width
+            ngram_sizes: Character n-gram lengths hashed alongside whole words
+        """
+        self.dimensions = dimensions
+        self.ngram_sizes = tuple(ngram_sizes)
+
+    def _features(self, text: str) -> list[str]:
+        words = tokenize(text)
+        features = list(words)
+        for word in words:
+            padded = f"<{word}>"
+            for n in self.ngram_sizes:
+                features.extend(padded[i : i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed one text as a normalized float32 vector."""
+        features = self._features(text)
+        hashes = np.fromiter(
+            (zlib.crc32(feature.encode("utf-8")) for feature in features),
+            dtype=np.uint32,
+            count=len(features),
+        )
+        # Low bits pick the dimension, the top bit the sign, so collisions tend to cancel
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        vector: np.ndarray = np.bincount(
+            hashes % self.dimensions, weights=signs, minlength=self.dimensions
+        )
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self.embed_query(text)
+
+
+class EmbeddingProvider:
+    """A configured embeddings backend: how to build its client and what names its vectors."""
+
+    def __init__(self, name: str, namespace: str, description: str, factory: Callable[[], Any]):
+        """
+        Initialize the provider.
+
+        Args:
+            name: Backend name, one of EMBEDDING_PROVIDERS
+            namespace: Identifies the vector space (model, version, width). Vectors from
+                different namespaces can't be compared, so caches and builds record it.
+            description: Human-readable summary for logs
+            factory: Builds the LangChain-style client (embed_documents, embed_query and
+                their async versions)
+        """
+        self.name = name
+        self.namespace = namespace
+        self.description = description
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Embeddings client, built on first use (the Azure client imports the OpenAI SDK)."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+
+def parse_azure_endpoint(endpoint_url: str) -> tuple[str, str, str]:
+    """Split an Azure OpenAI deployment URL into (base URL, deployment, API version)."""
+    match = re.search(r"/deployments/([^/]+)/", endpoint_url)
+    deployment = match.group(1) if match else "text-embedding-3-large"
+    base_url = endpoint_url.split("/openai/")[0]
+    api_version_match = re.search(r"api-version=([^&]+)", endpoint_url)
+    api_version = api_version_match.group(1) if api_version_match else "2023-05-15"
+    return base_url, deployment, api_version
+
+
+def azure_embedding_provider(
+    dimensions: int | None = None, max_retries: int | None = None
+) -> EmbeddingProvider:
+    """Azure OpenAI embeddings configured by AZURE_OPENAI_EMBEDDINGS_ENDPOINT and _API_KEY."""
+    endpoint = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
+    api_key = os.getenv("AZURE_OPENAI_EMBEDDINGS_API_KEY")
+    if not endpoint or not api_key:
+        raise ValueError("Missing Azure OpenAI embeddings credentials")
+
+    base_url, deployment, api_version = parse_azure_endpoint(endpoint)
+    settings: dict[str, Any] = {
+        "azure_endpoint": base_url,
+        "azure_deployment": deployment,
+        "api_key": api_key,
+        "api_version": api_version,
+    }
+    if dimensions:
+        settings["dimensions"] = dimensions
+    if max_retries is not None:
+        settings["max_retries"] = max_retries
+
+    def build():
+        from langchain_openai import AzureOpenAIEmbeddings
+
+        return AzureOpenAIEmbeddings(**settings)
+
+    namespace = f"{deployment}:{api_version}" + (f":{dimensions}" if dimensions else "")
+    return EmbeddingProvider("azure", namespace, f"Azure OpenAI {deployment}", build)
+
+
+def hashed_embedding_provider(dimensions: int | None = None) -> EmbeddingProvider:
+    """Deterministic local hashed n-gram embeddings."""
+    dimensions = dimensions or DEFAULT_HASHED_DIMENSIONS
+    return EmbeddingProvider(
+        "hashed",
+        f"hashed:{dimensions}",
+        f"hashed n-grams ({dimensions} dims, offline)",
+        lambda: HashedEmbeddings(dimensions),
+    )
+
+
+def get_embedding_provider(
+    name: str | None = None, dimensions: int | None = None, max_retries: int | None = None
+) -> EmbeddingProvider:
+    """
+    Return the embeddings provider selected by configuration.
+
+    Args:
+        name: Provider name; defaults to EMBEDDINGS_PROVIDER, then "azure"
+        dimensions: Vector width; defaults to EMBEDDINGS_DIMENSIONS, then the provider's own
+        max_retries: Retries the Azure client makes on its own after errors and 429s;
+            defaults to the SDK's. The builder sets 0 and retries in embedding_pipeline.
+    """
+    name = (name or os.getenv("EMBEDDINGS_PROVIDER") or "azure").strip().lower()
+    dimensions = dimensions or int(os.getenv("EMBEDDINGS_DIMENSIONS") or 0) or None
+
+    if name == "azure":
+        return azure_embedding_provider(dimensions, max_retries)
+    if name == "hashed":
+        return hashed_embedding_provider(dimensions)
+    raise ValueError(f"Unknown embeddings provider: {name} (expected one of {EMBEDDING_PROVIDERS})")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store of document embeddings, shared by the vector database builder
+and essay_similarity.py.
+
+Embeddings are keyed by (embeddings namespace, dimension, SHA-256 of the text), so a text
+that was ever embedded with the same model and width is never sent again: a clean
+rebuild, a change of chunking parameters or an essay both tools embed reuses what is
+stored.
+
+Each namespace and dimension is a shard of three files in the store directory:
+
+    <name>.json   The shard's namespace and dimension
+    <name>.keys   Index: SHA-256 digests of the texts, 32 bytes per row
+    <name>.f32    Embeddings as float32 rows, in the same order as the keys
+
+Shards are only appended to, vectors before keys, under an exclusive lock, so readers
+never see a key without its vector and an interrupted write loses only its own rows.
+"""
+
+import fcntl
+import hashlib
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_EMBEDDING_STORE = "embedding_store"
+DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    """SHA-256 of a text, the key of its embedding."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class _Shard:
+    """Embeddings of one namespace and dimension."""
+
+    def __init__(self, path: Path, namespace: str, dimension: int):
+        self.namespace = namespace
+        self.dimension = dimension
+        slug = re.sub(r"[^A-Za-z0-9.-]+", "_", namespace).strip("_")
+        name = f"{slug}-{hashlib.sha256(namespace.encode('utf-8')).hexdigest()[:8]}-{dimension}"
+        self.meta_path = path / f"{name}.json"
+        self.keys_path = path / f"{name}.keys"
+        self.vectors_path = path / f"{name}.f32"
+        self._rows: dict[bytes, int] | None = None
+        self._vectors: np.ndarray | None = None
+
+    def _complete_rows(self) -> int:
+        """Rows present in both files."""
+        keys = self.keys_path.stat().st_size // DIGEST_SIZE if self.keys_path.exists() else 0
+        row_bytes = 4 * self.dimension
+        vectors = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        return min(keys, vectors)
+
+    def _load(self) -> tuple[dict[bytes, int], np.ndarray]:
+        """The shard's row numbers by digest and its vectors, read on first use."""
+        if self._rows is not None and self._vectors is not None:
+            return self._rows, self._vectors
+        count = self._complete_rows()
+        keys = self.keys_path.read_bytes()[: count * DIGEST_SIZE] if count else b""
+        self._rows = {
+            keys[i : i + DIGEST_SIZE]: i // DIGEST_SIZE for i in range(0, len(keys), DIGEST_SIZE)
+        }
+        self._vectors = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dimension))
+            if count
+            else np.empty((0, self.dimension), dtype=np.float32)
+        )
+        return self._rows, self._vectors
+
+    def get(self, digest: bytes) -> np.ndarray | None:
+        rows, vectors = self._load()
+        row = rows.get(digest)
+        return None if row is None else np.array(vectors[row])
+
+    def __contains__(self, digest: bytes) -> bool:
+        rows, _ = self._load()
+        return digest in rows
+
+    def append(self, digests: list[bytes], vectors: np.ndarray):
+        self.meta_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.meta_path.exists():
+            with open(self.meta_path, "w") as f:
+                json.dump({"namespace": self.namespace, "dimension": self.dimension}, f)
+
+        with open(self.keys_path, "ab") as keys:
+            fcntl.flock(keys, fcntl.LOCK_EX)
+            # Drop the tail of an interrupted append so keys and rows line up
+            count = self._complete_rows()
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(count * 4 * self.dimension)
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            keys.truncate(count * DIGEST_SIZE)
+            keys.write(b"".join(digests))
+        # Reload on the next read, with any rows other processes appended
+        self._rows = None
+        self._vectors = None
+
+
+class EmbeddingStore:
+    """Embeddings on disk, looked up by namespace and text."""
+
+    def __init__(self, path: str | Path = DEFAULT_EMBEDDING_STORE):
+        """
+        Initialize the store.
+
+        Args:
+            path: Store directory, created on the first write
+        """
+        self.path = Path(path)
+        self._shards: dict[tuple[str, int], _Shard] = {}
+
+    def _namespace_shards(self, namespace: str) -> list[_Shard]:
+        """Shards of a namespace, including ones other processes created."""
+        if self.path.exists():
+            for meta_path in sorted(self.path.glob("*.json")):
+                try:
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                key = (meta.get("namespace"), meta.get("dimension"))
+                if key not in self._shards and isinstance(key[1], int):
+                    self._shards[key] = _Shard(self.path, *key)
+        return [shard for (name, _), shard in self._shards.items() if name == namespace]
+
+    def get(
+        self, namespace: str, texts: list[str], dimension: int | None = None
+    ) -> list[np.ndarray | None]:
+        """
+        Stored embeddings of texts, None for texts not embedded yet.
+
+        Args:
+            namespace: Embeddings namespace (model, version and requested width)
+            texts: Texts to look up
+            dimension: Only return vectors of this width; by default any stored width
+        """
+        return self.get_digests(namespace, [text_digest(text) for text in texts], dimension)
+
+    def get_digests(
+        self, namespace: str, digests: list[bytes], dimension: int | None = None
+    ) -> list[np.ndarray | None]:
+        """Stored embeddings by text digest (see get)."""
+        shards = [
+            shard
+            for shard in self._namespace_shards(namespace)
+            if dimension is None or shard.dimension == dimension
+        ]
+        results = []
+        for digest in digests:
+            vector = None
+            for shard in shards:
+                vector = shard.get(digest)
+                if vector is not None:
+                    break
+            results.append(vector)
+        return results
+
+    def put(self, namespace: str, texts: list[str], vectors):
+        """Store the embeddings of texts; texts already stored are skipped."""
+        self.put_digests(namespace, [text_digest(text) for text in texts], vectors)
+
+    def put_digests(self, namespace: str, digests: list[bytes], vectors):
+        """Store embeddings by text digest (see put)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(digests):
+            return
+        dimension = vectors.shape[1]
+        self._namespace_shards(namespace)
+        shard = self._shards.setdefault(
+            (namespace, dimension), _Shard(self.path, namespace, dimension)
+        )
+        new_rows = {}
+        for digest, vector in zip(digests, vectors):
+            if digest not in shard and digest not in new_rows:
+                new_rows[digest] = vector
+        if new_rows:
+            shard.append(list(new_rows), np.array(list(new_rows.values())))
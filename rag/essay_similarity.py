@@ -15,13 +15,17 @@ import numpy as np
 from bs4 import BeautifulSoup
 from dateutil import parser as dateparser
 from dotenv import load_dotenv
-from langchain_openai import AzureOpenAIEmbeddings
 
 from citation_utils import extract_page_metadata
+from dimension_reduction import DimensionReducer
+from embedding_pipeline import embed_texts
+from embedding_providers import get_embedding_provider
+from embedding_store import DEFAULT_EMBEDDING_STORE, EmbeddingStore
 
 load_dotenv()
 
-CACHE_FILE = "essay_embeddings_cache.json"
+EMBEDDING_STORE = os.getenv("EMBEDDING_STORE", DEFAULT_EMBEDDING_STORE)
+LEGACY_CACHE_FILE = "essay_embeddings_cache.json"
 OUTPUT_FILE = "../output/essay-navigation.json"
 HTML_DIR = "html/essays"
 
@@ -41,6 +45,30 @@ def content_hash(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
+def import_legacy_cache(store: EmbeddingStore, provider) -> int:
+    """
+    Copy the provider's embeddings from the JSON cache this script kept before the shared
+    embedding store. Its keys are the same SHA-256 text hashes: bare for Azure, prefixed
+    with the namespace for other providers. Returns the number of embeddings found.
+    """
+    path = Path(LEGACY_CACHE_FILE)
+    if not path.exists():
+        return 0
+    with open(path) as f:
+        cache = json.load(f)
+
+    prefix = "" if provider.name == "azure" else f"{provider.namespace}:"
+    by_width: dict[int, list[tuple[bytes, list[float]]]] = {}
+    for key, vector in cache.items():
+        text_hash = key[len(prefix) :]
+        if key.startswith(prefix) and re.fullmatch(r"[0-9a-f]{64}", text_hash):
+            by_width.setdefault(len(vector), []).append((bytes.fromhex(text_hash), vector))
+    for entries in by_width.values():
+        digests, vectors = zip(*entries)
+        store.put_digests(provider.namespace, list(digests), list(vectors))
+    return sum(len(entries) for entries in by_width.values())
+
+
 def main():
     html_dir = Path(HTML_DIR)
     html_files = sorted(html_dir.rglob("*.html"))
@@ -96,81 +124,42 @@ def main():
 
     essays.sort(key=lambda e: parse_date(e["published"]))
 
-    # Load embedding cache
-    cache = {}
-    if Path(CACHE_FILE).exists():
-        with open(CACHE_FILE) as f:
-            cache = json.load(f)
-
-    # Set up embeddings model
-    embeddings_endpoint = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
-    embeddings_api_key = os.getenv("AZURE_OPENAI_EMBEDDINGS_API_KEY")
-    if not embeddings_endpoint or not embeddings_api_key:
-        raise ValueError("Missing Azure OpenAI embeddings credentials in .env")
-
-    match = re.search(r"/deployments/([^/]+)/", embeddings_endpoint)
-    deployment_name = match.group(1) if match else "text-embedding-3-large"
-    base_url = embeddings_endpoint.split("/openai/")[0]
-    api_version_match = re.search(r"api-version=([^&]+)", embeddings_endpoint)
-    api_version = api_version_match.group(1) if api_version_match else "2023-05-15"
-
-    embeddings_model = AzureOpenAIEmbeddings(
-        azure_endpoint=base_url,
-        azure_deployment=deployment_name,
-        api_key=embeddings_api_key,
-        api_version=api_version,
-    )
-
-    # Compute embeddings, using cache where possible
-    vectors = []
-    texts_to_embed = []
-    embed_indices = []
+    # Embeddings are shared with the vector database builder, keyed by text hash
+    provider = get_embedding_provider(max_retries=0)
+    store = EmbeddingStore(EMBEDDING_STORE)
+    imported = import_legacy_cache(store, provider)
+    if imported:
+        print(f"Found {imported} embeddings in {LEGACY_CACHE_FILE}; it can be deleted")
 
-    for i, essay in enumerate(essays):
-        if essay["hash"] in cache:
-            vectors.append(np.array(cache[essay["hash"]], dtype=np.float32))
-        else:
-            vectors.append(None)
-            texts_to_embed.append(essay["text"])
-            embed_indices.append(i)
-
-    if texts_to_embed:
+    # Compute embeddings, reusing stored ones where possible
+    digests = [bytes.fromhex(essay["hash"]) for essay in essays]
+    vectors = store.get_digests(provider.namespace, digests)
+    embed_indices = [i for i, vector in enumerate(vectors) if vector is None]
+
+    if embed_indices:
         print(
-            f"Embedding {len(texts_to_embed)} new essays (cached: {len(essays) - len(texts_to_embed)})"
+            f"Embedding {len(embed_indices)} new essays (stored: {len(essays) - len(embed_indices)})"
         )
-        import time
-
-        batch_size = 5
-        new_embeddings = []
-        for batch_start in range(0, len(texts_to_embed), batch_size):
-            batch = texts_to_embed[batch_start : batch_start + batch_size]
-            for attempt in range(5):
-                try:
-                    batch_embeddings = embeddings_model.embed_documents(batch)
-                    new_embeddings.extend(batch_embeddings)
-                    break
-                except Exception as e:
-                    if "429" in str(e) and attempt < 4:
-                        wait = 60 * (attempt + 1)
-                        print(f"Rate limited, waiting {wait}s...")
-                        time.sleep(wait)
-                    else:
-                        raise
+        # Essays can exceed the model's input limit; long ones are split and averaged
+        texts_to_embed = [essays[i]["text"] for i in embed_indices]
+        new_embeddings, stats = embed_texts(provider.client, texts_to_embed)
+        print(f"Embedded {stats.summary()}")
+        store.put(provider.namespace, texts_to_embed, new_embeddings)
         for idx, embedding in zip(embed_indices, new_embeddings):
             vectors[idx] = np.array(embedding, dtype=np.float32)
-            cache[essays[idx]["hash"]] = embedding
     else:
-        print("All essays cached, no new embeddings needed")
-
-    # Save updated cache
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f)
+        print("All essays stored, no new embeddings needed")
 
     # Normalize vectors for cosine similarity
     matrix = np.array(vectors, dtype=np.float32)
     norms = np.linalg.norm(matrix, axis=1, keepdims=True)
     normalized = matrix / norms
 
+    # Optionally compare shortened vectors (text-embedding-3 embeddings truncate cleanly)
+    dimensions = int(os.getenv("ESSAY_EMBEDDING_DIMENSIONS", "0"))
+    if 0 < dimensions < normalized.shape[1]:
+        normalized = DimensionReducer("truncate", dimensions).transform(normalized)
+
     # Pairwise cosine similarity
     similarity = normalized @ normalized.T
 
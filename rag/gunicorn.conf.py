@@ -50,6 +50,13 @@ max_requests = 1000
 max_requests_jitter = 100
 
 
+def on_starting(server):
+    """Called just before the master process is initialized."""
+    # rag_server defers the OpenAI SDK import to keep cold starts fast. Import it once in
+    # the master so workers, including ones recycled after max_requests, inherit it on fork.
+    import langchain_openai  # noqa: F401
+
+
 def post_fork(server, worker):
     """Called after a worker has been forked."""
     server.log.info(f"Worker spawned (pid: {worker.pid})")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+BM25 inverted index for lexical retrieval in the RAG system.
+
+The builder writes a postings file next to vector.index with one precomputed BM25
+weight per (term, chunk) pair, so scoring a query is a sum over the postings of its
+terms. The loader memory-maps the file the same way as the document store.
+
+Layout (all integers little-endian):
+    magic       8 bytes   b"RAGLEX01"
+    docs        uint64    number of chunks
+    terms       uint64    number of distinct terms
+    term_offs   uint64 * (terms + 1)   offsets into the term blob
+    post_offs   uint64 * (terms + 1)   offsets into the postings arrays
+    doc_ids     uint32 * postings      chunk index of each posting
+    weights     float32 * postings     BM25 weight of each posting
+    term blob   UTF-8 terms, sorted and concatenated
+"""
+
+import mmap
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"RAGLEX01"
+HEADER_SIZE = len(MAGIC) + 16
+
+# Letters and digits form separate tokens so "CS124" and "CS 124" match each other
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word and number tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def write_lexical_index(path: str | Path, texts: list[str], k1: float = 1.2, b: float = 0.75):
+    """
+    Build a BM25 index over chunk texts and write it to disk.
+
+    Args:
+        path: Output file
+        texts: Chunk texts, in index order
+        k1: BM25 term frequency saturation
+        b: BM25 document length normalization
+    """
+    doc_terms = [Counter(tokenize(text)) for text in texts]
+    doc_lengths = np.array([sum(terms.values()) for terms in doc_terms], dtype=np.float64)
+    average_length = (float(doc_lengths.mean()) if len(texts) else 0.0) or 1.0
+
+    postings: dict[str, list[tuple[int, int]]] = {}
+    for doc_id, terms in enumerate(doc_terms):
+        for term, frequency in terms.items():
+            postings.setdefault(term, []).append((doc_id, frequency))
+
+    vocabulary = sorted(postings)
+    encoded_terms = [term.encode("utf-8") for term in vocabulary]
+    term_offsets = np.zeros(len(vocabulary) + 1, dtype="<u8")
+    term_offsets[1:] = np.cumsum([len(term) for term in encoded_terms])
+    post_offsets = np.zeros(len(vocabulary) + 1, dtype="<u8")
+    post_offsets[1:] = np.cumsum([len(postings[term]) for term in vocabulary])
+
+    doc_ids = np.empty(int(post_offsets[-1]), dtype="<u4")
+    weights = np.empty(int(post_offsets[-1]), dtype="<f4")
+    for i, term in enumerate(vocabulary):
+        ids, frequencies = np.array(postings[term], dtype=np.float64).T
+        ids = ids.astype(np.int64)
+        idf = np.log(1 + (len(texts) - len(ids) + 0.5) / (len(ids) + 0.5))
+        norm = k1 * (1 - b + b * doc_lengths[ids] / average_length)
+        start, end = post_offsets[i], post_offsets[i + 1]
+        doc_ids[start:end] = ids
+        weights[start:end] = idf * frequencies * (k1 + 1) / (frequencies + norm)
+
+    # Write to a temporary file first so readers never see a partial index
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([len(texts), len(vocabulary)], dtype="<u8").tobytes())
+        f.write(term_offsets.tobytes())
+        f.write(post_offsets.tobytes())
+        f.write(doc_ids.tobytes())
+        f.write(weights.tobytes())
+        for encoded in encoded_terms:
+            f.write(encoded)
+    tmp_path.replace(path)
+
+
+class LexicalIndex:
+    """Memory-mapped reader for a BM25 index written by write_lexical_index()."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a lexical index: {self.path}")
+
+        self.count, self.term_count = (
+            int(n) for n in np.frombuffer(self._mmap, dtype="<u8", count=2, offset=len(MAGIC))
+        )
+        offset = HEADER_SIZE
+        term_offsets = np.frombuffer(
+            self._mmap, dtype="<u8", count=self.term_count + 1, offset=offset
+        )
+        offset += 8 * (self.term_count + 1)
+        self._post_offsets = np.frombuffer(
+            self._mmap, dtype="<u8", count=self.term_count + 1, offset=offset
+        )
+        offset += 8 * (self.term_count + 1)
+        postings = int(self._post_offsets[-1])
+        self._doc_ids = np.frombuffer(self._mmap, dtype="<u4", count=postings, offset=offset)
+        offset += 4 * postings
+        self._weights = np.frombuffer(self._mmap, dtype="<f4", count=postings, offset=offset)
+        offset += 4 * postings
+
+        # The vocabulary is small next to the postings; decode it once for O(1) lookups
+        blob = self._mmap[offset : offset + int(term_offsets[-1])]
+        self._terms = {
+            blob[int(start) : int(end)].decode("utf-8"): i
+            for i, (start, end) in enumerate(zip(term_offsets[:-1], term_offsets[1:]))
+        }
+
+    def __len__(self) -> int:
+        return self.count
+
+    def search(self, query: str, k: int, mask: np.ndarray | None = None) -> list[tuple[float, int]]:
+        """
+        Return up to k (BM25 score, chunk index) pairs matching the query, best first.
+
+        Args:
+            query: Query text
+            k: Maximum number of results
+            mask: Optional boolean mask of chunks allowed in the results
+        """
+        term_ids = [self._terms[term] for term in set(tokenize(query)) if term in self._terms]
+        if not term_ids or k <= 0:
+            return []
+
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = int(self._post_offsets[term_id]), int(self._post_offsets[term_id + 1])
+            # Each chunk appears at most once per term, so fancy-index addition is safe
+            scores[self._doc_ids[start:end]] += self._weights[start:end]
+
+        if mask is not None:
+            scores[~mask] = 0
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(float(scores[i]), int(i)) for i in matches]
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._mmap)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Metadata filters for vector and lexical search.
+
+The builder writes the filterable fields of every chunk as columns next to vector.index,
+which the loader memory-maps, so loading never decodes the chunk metadata. A filter is
+resolved to a bitmap over chunk ids, which FAISS checks during the scan through an
+IDSelectorBitmap, so filtered searches scan no more than unfiltered ones. Resolved
+filters are cached, so repeated filters cost nothing to rebuild.
+
+Chunks the builder has tombstoned as stale (metadata "stale": true) are excluded from every
+selection, filtered or not, until a compaction removes them.
+
+Supported filters:
+    citation_url_prefix   only chunks whose citation_url starts with this prefix
+    section_level         heading tag ("h2", ..., or "none") or list of tags of the section
+    published_after       only chunks published on or after this date
+    published_before      only chunks published before this date
+
+Column file layout (all integers little-endian):
+    magic       8 bytes   b"RAGFLT01"
+    chunks      uint64    number of chunks
+    vocab_len   uint64    length of the vocabulary, padded to a multiple of 8
+    vocabulary  UTF-8 JSON {"urls": [...], "levels": [...]}, each sorted
+    published   float64 * chunks   UTC timestamp, NaN when undated
+    urls        uint32 * chunks    position of the citation_url in the vocabulary
+    levels      uint16 * chunks    position of the section level in the vocabulary
+    live        uint8 * chunks     0 for chunks tombstoned as stale
+"""
+
+import bisect
+import json
+import mmap
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import faiss
+import numpy as np
+
+FILTER_FIELDS = ("citation_url_prefix", "section_level", "published_after", "published_before")
+
+MAGIC = b"RAGFLT01"
+HEADER_SIZE = len(MAGIC) + 16
+
+
+def parse_published(value: Any) -> float | None:
+    """
+    Convert a published date to a UTC timestamp.
+
+    Accepts ISO dates and the JavaScript Date strings the site writes into its meta tags,
+    e.g. "Mon Jan 15 2024 00:00:00 GMT-0600 (Central Standard Time)".
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, int | float):
+        return float(value)
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = re.sub(r"\s*\([^)]*\)\s*$", "", str(value).strip())
+        try:
+            parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            try:
+                parsed = datetime.strptime(text, "%a %b %d %Y %H:%M:%S GMT%z")
+            except ValueError:
+                return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed.timestamp()
+
+
+class FilterSelection:
+    """Chunk ids allowed by a filter, as a sorted array, a mask and a FAISS selector."""
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = mask
+        self.ids = np.flatnonzero(mask)
+        self.count = len(self.ids)
+        # The selector reads the bitmap in place, so keep the array alive with it
+        self._bitmap = np.packbits(mask, bitorder="little")
+        self.selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(self._bitmap))
+
+
+class FilterColumns:
+    """
+    The filterable fields of every chunk as arrays, with citation URLs and section levels
+    stored as positions in sorted vocabularies.
+    """
+
+    def __init__(
+        self,
+        live: np.ndarray,
+        url_codes: np.ndarray,
+        urls: list[str],
+        level_codes: np.ndarray,
+        levels: list[str],
+        published: np.ndarray,
+    ):
+        self.live = live
+        self.url_codes = url_codes
+        self.urls = urls
+        self.level_codes = level_codes
+        self.levels = levels
+        self.published = published
+
+    def __len__(self) -> int:
+        return len(self.live)
+
+    @classmethod
+    def from_metadata(cls, metadata: Sequence[dict[str, Any]]) -> "FilterColumns":
+        """Encode the filterable fields of chunk metadata, in index order."""
+        chunk_urls = [meta.get("citation_url", "") for meta in metadata]
+        chunk_levels = [str(meta.get("section_level", "none")) for meta in metadata]
+        urls = sorted(set(chunk_urls))
+        levels = sorted(set(chunk_levels))
+        url_positions = {url: i for i, url in enumerate(urls)}
+        level_positions = {level: i for i, level in enumerate(levels)}
+
+        published = np.full(len(metadata), np.nan)
+        parsed_dates: dict[str, float | None] = {}
+        for i, meta in enumerate(metadata):
+            raw_date = meta.get("published")
+            if raw_date:
+                if raw_date not in parsed_dates:
+                    parsed_dates[raw_date] = parse_published(raw_date)
+                if parsed_dates[raw_date] is not None:
+                    published[i] = parsed_dates[raw_date]
+
+        return cls(
+            live=np.array([not meta.get("stale") for meta in metadata], dtype=bool),
+            url_codes=np.array([url_positions[url] for url in chunk_urls], dtype="<u4"),
+            urls=urls,
+            level_codes=np.array([level_positions[lvl] for lvl in chunk_levels], dtype="<u2"),
+            levels=levels,
+            published=published,
+        )
+
+
+def write_filter_columns(path: str | Path, metadata: Sequence[dict[str, Any]]):
+    """
+    Encode the filterable fields of chunk metadata and write them to disk.
+
+    Args:
+        path: Output file
+        metadata: Chunk metadata, in index order
+    """
+    columns = FilterColumns.from_metadata(metadata)
+    vocabulary = json.dumps({"urls": columns.urls, "levels": columns.levels}).encode("utf-8")
+    # Pad with JSON whitespace so the columns after it are aligned
+    vocabulary += b" " * (-len(vocabulary) % 8)
+
+    # Write to a temporary file first so readers never see partial columns
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([len(columns), len(vocabulary)], dtype="<u8").tobytes())
+        f.write(vocabulary)
+        f.write(columns.published.astype("<f8").tobytes())
+        f.write(columns.url_codes.tobytes())
+        f.write(columns.level_codes.tobytes())
+        f.write(columns.live.astype(np.uint8).tobytes())
+    tmp_path.replace(path)
+
+
+def read_filter_columns(path: str | Path) -> FilterColumns:
+    """Memory-map columns written by write_filter_columns(); the arrays keep the mapping open."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"Not a filter column file: {path}")
+
+    count, vocab_len = (
+        int(n) for n in np.frombuffer(mapped, dtype="<u8", count=2, offset=len(MAGIC))
+    )
+    vocabulary = json.loads(mapped[HEADER_SIZE : HEADER_SIZE + vocab_len])
+    offset = HEADER_SIZE + vocab_len
+    published = np.frombuffer(mapped, dtype="<f8", count=count, offset=offset)
+    offset += 8 * count
+    url_codes = np.frombuffer(mapped, dtype="<u4", count=count, offset=offset)
+    offset += 4 * count
+    level_codes = np.frombuffer(mapped, dtype="<u2", count=count, offset=offset)
+    offset += 2 * count
+    live = np.frombuffer(mapped, dtype=bool, count=count, offset=offset)
+
+    return FilterColumns(
+        live=live,
+        url_codes=url_codes,
+        urls=vocabulary["urls"],
+        level_codes=level_codes,
+        levels=vocabulary["levels"],
+        published=published,
+    )
+
+
+class MetadataFilterIndex:
+    """Filterable chunk fields as columns, resolved to FilterSelections on demand."""
+
+    def __init__(self, metadata: Sequence[dict[str, Any]] | FilterColumns, cache_size: int = 256):
+        """
+        Set up the field indexes.
+
+        Args:
+            metadata: Chunk metadata in index order, or its columns from read_filter_columns()
+            cache_size: Number of resolved filters to keep
+        """
+        if isinstance(metadata, FilterColumns):
+            self.columns = metadata
+        else:
+            self.columns = FilterColumns.from_metadata(metadata)
+        self.count = len(self.columns)
+        self.live = self.columns.live
+        self._level_positions = {level: i for i, level in enumerate(self.columns.levels)}
+
+        self.stale_count = self.count - int(np.count_nonzero(self.live))
+        # Unfiltered searches still skip tombstoned chunks
+        self.live_selection = FilterSelection(self.live) if self.stale_count else None
+
+        self._cache: OrderedDict[tuple, FilterSelection] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def select(self, filters: dict[str, Any] | None) -> FilterSelection | None:
+        """Resolve filters to the allowed chunk ids, or None when every chunk is allowed."""
+        filters = {key: value for key, value in (filters or {}).items() if value is not None}
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filters: {sorted(unknown)} (expected {FILTER_FIELDS})")
+        if not filters:
+            return self.live_selection
+
+        levels = filters.get("section_level")
+        if levels is not None:
+            levels = levels if isinstance(levels, list | tuple | set) else [levels]
+            levels = tuple(sorted({str(level) for level in levels}))
+        key = (
+            filters.get("citation_url_prefix"),
+            levels,
+            self._date_bound(filters, "published_after"),
+            self._date_bound(filters, "published_before"),
+        )
+
+        with self._lock:
+            selection = self._cache.get(key)
+            if selection is not None:
+                self._cache.move_to_end(key)
+                return selection
+
+        selection = FilterSelection(self._resolve(*key))
+        with self._lock:
+            self._cache[key] = selection
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return selection
+
+    @staticmethod
+    def _date_bound(filters: dict[str, Any], name: str) -> float | None:
+        if name not in filters:
+            return None
+        bound = parse_published(filters[name])
+        if bound is None:
+            raise ValueError(f"Could not parse {name}: {filters[name]!r}")
+        return bound
+
+    def _resolve(
+        self,
+        url_prefix: str | None,
+        levels: tuple[str, ...] | None,
+        published_after: float | None,
+        published_before: float | None,
+    ) -> np.ndarray:
+        """Intersect the per-field conditions into a boolean mask over all live chunks."""
+        columns = self.columns
+        mask = np.array(self.live, dtype=bool)
+
+        if url_prefix is not None:
+            # URLs with the prefix are a contiguous range of the sorted vocabulary: every
+            # one sorts before prefix + the highest code point
+            start = bisect.bisect_left(columns.urls, url_prefix)
+            end = bisect.bisect_left(columns.urls, url_prefix + "\U0010ffff")
+            mask &= (columns.url_codes >= start) & (columns.url_codes < end)
+
+        if levels is not None:
+            codes = [
+                self._level_positions[level] for level in levels if level in self._level_positions
+            ]
+            mask &= np.isin(columns.level_codes, codes)
+
+        # Undated chunks are NaN, which never compares true
+        if published_after is not None:
+            mask &= columns.published >= published_after
+        if published_before is not None:
+            mask &= columns.published < published_before
+
+        return mask
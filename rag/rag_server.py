@@ -6,32 +6,40 @@ RAG Server with semantic search and conversational capabilities.
 Provides two main endpoints:
 1. /search - Semantic search over the vector database
 2. /chat - Conversational RAG with memory and context awareness
+
+New builds of the vector database are picked up without a restart: the server polls
+build_info.json (or POST /admin/reload asks it to check now), loads the new build in the
+background and swaps it in. Searches already running finish on the old copy.
 """
 
 import asyncio
+import inspect
 import json
 import logging
 import os
+import secrets
 import threading
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Literal
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
-from vector_db_loader import ProductionVectorLoader
+from metadata_filters import parse_published
+from vector_db_loader import ProductionVectorLoader, read_build_version
+
+if TYPE_CHECKING:
+    # The OpenAI SDK takes seconds to import; it is loaded when the chat client is built
+    from langchain_openai import AzureChatOpenAI
 
 
 def load_topics() -> list[str]:
@@ -50,9 +58,48 @@ WEBSITE_TOPICS: list[str] = []
 
 
 # Request/Response models
+SearchMode = Literal["vector", "hybrid", "lexical"]
+
+
+class SearchFilters(BaseModel):
+    citation_url_prefix: str | None = None  # e.g. "/essays/"
+    section_level: str | list[str] | None = None  # e.g. "h2" (or 2), or "none"
+    published_after: str | None = None  # ISO date, inclusive
+    published_before: str | None = None  # ISO date, exclusive
+
+    @field_validator("section_level", mode="before")
+    @classmethod
+    def level_tags(cls, value: Any) -> Any:
+        # Sections are indexed by heading tag, so a level number 2 means "h2"
+        def tag(level: Any) -> Any:
+            if isinstance(level, int) and not isinstance(level, bool):
+                if not 1 <= level <= 6:
+                    raise ValueError(f"Section level must be between 1 and 6: {level}")
+                return f"h{level}"
+            return level
+
+        return [tag(level) for level in value] if isinstance(value, list) else tag(value)
+
+    @field_validator("published_after", "published_before")
+    @classmethod
+    def check_date(cls, value: str | None) -> str | None:
+        if value is not None and parse_published(value) is None:
+            raise ValueError(f"Could not parse date: {value!r}")
+        return value
+
+
+def filter_dict(filters: SearchFilters | None) -> dict[str, Any] | None:
+    """Convert request filters to the loader's filters argument."""
+    return filters.model_dump(exclude_none=True) if filters else None
+
+
 class SearchRequest(BaseModel):
     query: str
     k: int | None = 5
+    mode: SearchMode | None = None  # Defaults to SEARCH_MODE
+    filters: SearchFilters | None = None
+    mmr_lambda: float | None = Field(default=None, ge=0.0, le=1.0)  # Diversify results
+    merge_adjacent: bool = False  # Merge neighboring chunks of the same section
 
 
 class SearchResponse(BaseModel):
@@ -61,6 +108,19 @@ class SearchResponse(BaseModel):
     timestamp: str
 
 
+class BatchSearchRequest(BaseModel):
+    queries: list[str]
+    k: int | None = 5
+    mode: SearchMode | None = None  # Defaults to SEARCH_MODE
+    filters: SearchFilters | None = None  # Applied to every query
+
+
+class BatchSearchResponse(BaseModel):
+    results: list[list[dict[str, Any]]]
+    queries: list[str]
+    timestamp: str
+
+
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
     content: str
@@ -117,16 +177,49 @@ logger = logging.getLogger(__name__)
 
 # Global instances
 vector_loader: ProductionVectorLoader | None = None
-chat_model: AzureChatOpenAI | None = None
-embeddings: AzureOpenAIEmbeddings | None = None
+chat_model: "AzureChatOpenAI | None" = None
 conversation_histories: dict[str, list[HumanMessage | AIMessage]] = {}
 session_timestamps: dict[str, datetime] = {}  # Track when sessions were last accessed
 cleanup_lock = threading.Lock()
 
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean flag from the environment."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_float(name: str) -> float | None:
+    """Read an optional number from the environment (None when unset or empty)."""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
 # Configuration
 MAX_CONVERSATION_HISTORY = 20  # Max messages per session
 SESSION_TIMEOUT_HOURS = 24  # Clean up sessions after 24 hours
 CLEANUP_INTERVAL_MINUTES = 60  # Run cleanup every hour
+MAX_BATCH_QUERIES = 200  # Max queries per /search/batch request
+# Retrieval mode for /chat and for searches that don't specify one: vector, hybrid or lexical
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Chat retrieval: MMR relevance weight (unset disables) and merging of neighboring chunks
+CHAT_MMR_LAMBDA = env_float("CHAT_MMR_LAMBDA")
+CHAT_MERGE_ADJACENT = env_flag("CHAT_MERGE_ADJACENT")
+# Seconds between checks of build_info.json for a new build (0 disables polling)
+VECTOR_DB_RELOAD_SECONDS = float(os.getenv("VECTOR_DB_RELOAD_SECONDS", "30"))
+# Token for POST /admin/reload, sent as X-Admin-Token (unset disables the endpoint)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# Load the database and build the Azure clients in the background after startup, so the
+# worker accepts connections (and health checks) at once; requests wait until it is done
+LAZY_STARTUP = env_flag("LAZY_STARTUP")
+services_task: asyncio.Task | None = None
+
+# Serializes reloads; the swap itself is a single assignment on the event loop
+reload_lock = asyncio.Lock()
+reload_task: asyncio.Task | None = None
 
 
 def extract_azure_config(endpoint_url: str):
@@ -152,33 +245,43 @@ def extract_azure_config(endpoint_url: str):
     return base_endpoint, deployment, api_version
 
 
+def create_vector_loader() -> ProductionVectorLoader:
+    """Load the vector database configured by the environment."""
+    # Memory-mapped (VECTOR_DB_MMAP) so gunicorn workers share one copy
+    return ProductionVectorLoader(
+        os.getenv("VECTOR_DB_PATH", "vector_db"),
+        use_mmap=env_flag("VECTOR_DB_MMAP"),
+        prefault=env_flag("VECTOR_DB_PREFAULT"),
+        query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+        query_cache_ttl=float(os.getenv("QUERY_CACHE_TTL_SECONDS", str(24 * 60 * 60))),
+        query_cache_path=os.getenv("QUERY_CACHE_PATH") or None,
+        search_threads=int(os.getenv("SEARCH_THREADS", "4")),
+        result_cache_size=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+        result_cache_distance=float(os.getenv("RESULT_CACHE_DISTANCE", "0.05")),
+    )
+
+
 def initialize_services():
     """Initialize RAG services on startup."""
-    global vector_loader, chat_model, embeddings
+    global vector_loader, chat_model
 
-    # Load vector database
-    vector_db_path = os.getenv("VECTOR_DB_PATH", "vector_db")
-    vector_loader = ProductionVectorLoader(vector_db_path)
+    vector_loader = create_vector_loader()
     print("✅ Vector database loaded")
 
     # Extract Azure OpenAI configuration from URLs
     chat_endpoint = os.getenv("AZURE_OPENAI_CHAT_ENDPOINT")
     chat_api_key = os.getenv("AZURE_OPENAI_CHAT_API_KEY")
-    embeddings_endpoint = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
-    embeddings_api_key = os.getenv("AZURE_OPENAI_EMBEDDINGS_API_KEY")
 
-    if not all([chat_endpoint, chat_api_key, embeddings_endpoint, embeddings_api_key]):
+    # The loader's embedding provider validated its own configuration
+    if not all([chat_endpoint, chat_api_key]):
         raise ValueError("Missing required Azure OpenAI environment variables")
 
     # Parse chat configuration
     chat_base_endpoint, chat_deployment, chat_api_version = extract_azure_config(chat_endpoint)
 
-    # Parse embeddings configuration
-    embeddings_base_endpoint, embeddings_deployment, embeddings_api_version = extract_azure_config(
-        embeddings_endpoint
-    )
-
     # Initialize Azure OpenAI services
+    from langchain_openai import AzureChatOpenAI
+
     chat_model = AzureChatOpenAI(
         azure_endpoint=chat_base_endpoint,
         api_key=chat_api_key,
@@ -188,15 +291,96 @@ def initialize_services():
         max_tokens=1000,
     )
 
-    embeddings = AzureOpenAIEmbeddings(
-        azure_endpoint=embeddings_base_endpoint,
-        api_key=embeddings_api_key,
-        api_version=embeddings_api_version,
-        azure_deployment=embeddings_deployment,
-    )
+    # The loader builds its embeddings client on first use; do it now, not in a request
+    vector_loader.embeddings_model  # noqa: B018
     print("✅ Azure OpenAI services initialized")
 
 
+async def initialize_services_in_background():
+    """Run initialize_services() in a thread, logging instead of raising on failure."""
+    start_time = time.time()
+    try:
+        await asyncio.to_thread(initialize_services)
+        logger.info(f"Services initialized in the background in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        # Requests see the services as uninitialized and fail with a 500
+        logger.error(f"Failed to initialize services: {e}", exc_info=True)
+
+
+async def wait_for_services():
+    """Hold a request until background initialization (LAZY_STARTUP) has finished."""
+    if services_task is not None and not services_task.done():
+        await asyncio.shield(services_task)
+
+
+async def reload_vector_database(force: bool = False) -> bool:
+    """
+    Load a new build of the vector database in the background and swap it in.
+
+    The old loader keeps serving while the new one loads. Requests that already called
+    into the old loader finish there; it is closed once the last of them returns. Waits for
+    background initialization (LAZY_STARTUP) first, so the loader it creates is never
+    replaced while it is still loading.
+
+    Args:
+        force: Reload even if build_info.json still has the loaded build_timestamp
+
+    Returns:
+        True if a new loader was swapped in
+    """
+    global vector_loader
+
+    await wait_for_services()
+    async with reload_lock:
+        current = vector_loader
+        db_path = os.getenv("VECTOR_DB_PATH", "vector_db")
+        version = read_build_version(db_path)
+        if version is None:
+            # No build_info.json yet, or a build is still being saved
+            return False
+        if not force and current is not None and version == current.build_version:
+            return False
+
+        load_start = time.time()
+        loop = asyncio.get_running_loop()
+        new_loader = await loop.run_in_executor(None, create_vector_loader)
+
+        # A build saved while we were loading could have mixed old and new files
+        if new_loader.build_version != version or read_build_version(db_path) != version:
+            new_loader.close()
+            if new_loader.query_cache is not None:
+                new_loader.query_cache.close()
+            logger.warning("Vector database changed while reloading; will retry on next check")
+            return False
+
+        # Query embeddings don't depend on the build, so keep the warm cache and close the
+        # one the new loader opened (or the old one, if the embeddings changed)
+        old_cache = current.query_cache if current is not None else None
+        if old_cache is not None and new_loader.query_cache is not None:
+            if old_cache.namespace == new_loader.query_cache.namespace:
+                new_loader.query_cache.close()
+                new_loader.query_cache = old_cache
+            else:
+                old_cache.close()
+
+        vector_loader = new_loader
+        if current is not None:
+            current.retire()
+
+    logger.info(f"Reloaded vector database build {version} in {time.time() - load_start:.2f}s")
+    return True
+
+
+async def watch_vector_database():
+    """Check build_info.json periodically and hot-swap new builds."""
+    while True:
+        await asyncio.sleep(VECTOR_DB_RELOAD_SECONDS)
+        try:
+            await reload_vector_database()
+        except Exception as e:
+            logger.error(f"Vector database reload failed, still serving the previous build: {e}")
+
+
 def cleanup_old_sessions():
     """Clean up old conversation sessions to prevent memory leaks."""
     with cleanup_lock:
@@ -289,13 +473,17 @@ def create_context_aware_query(message: str, history: list[ChatMessage]) -> str:
 
 
 async def retry_with_backoff(func, max_retries=3, base_delay=1.0, max_delay=30.0):
-    """Retry a function with exponential backoff for transient failures."""
+    """Retry a function with exponential backoff for transient failures.
+
+    Coroutine functions are awaited, so slow calls yield to the event loop instead of
+    blocking every other request in the worker.
+    """
     for attempt in range(max_retries):
         try:
-            if asyncio.iscoroutinefunction(func):
-                return await func()
-            else:
-                return func()
+            result = func()
+            if inspect.isawaitable(result):
+                result = await result
+            return result
         except Exception as e:
             error_str = str(e).lower()
 
@@ -347,10 +535,18 @@ def start_cleanup_task():
 @app.on_event("startup")
 async def startup_event():
     """Initialize services when the server starts."""
-    global WEBSITE_TOPICS
+    global WEBSITE_TOPICS, reload_task, services_task
     try:
-        initialize_services()
+        if LAZY_STARTUP:
+            services_task = asyncio.create_task(initialize_services_in_background())
+        else:
+            initialize_services()
         start_cleanup_task()
+        if VECTOR_DB_RELOAD_SECONDS > 0:
+            reload_task = asyncio.create_task(watch_vector_database())
+            logger.info(
+                f"Watching for new vector database builds every {VECTOR_DB_RELOAD_SECONDS}s"
+            )
         WEBSITE_TOPICS = load_topics()
         print(f"✅ Loaded {len(WEBSITE_TOPICS)} topics for prompt context")
     except Exception as e:
@@ -370,6 +566,33 @@ async def root(request: Request):
     }
 
 
+@app.post("/admin/reload")
+async def admin_reload(request: Request, force: bool = False):
+    """
+    Check for a new vector database build now instead of waiting for the next poll.
+
+    Only reloads the worker that handles the request; other workers pick the build up on
+    their next check of build_info.json.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("X-Admin-Token", "")
+    if not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    await wait_for_services()
+    try:
+        reloaded = await reload_vector_database(force=force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {str(e)}") from e
+
+    return {
+        "reloaded": reloaded,
+        "build_timestamp": vector_loader.build_version if vector_loader else None,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
 @app.post("/search", response_model=SearchResponse)
 @limiter.limit("30/minute")  # Allow 30 searches per minute per IP
 async def semantic_search(request: Request, search_request: SearchRequest):
@@ -379,13 +602,20 @@ async def semantic_search(request: Request, search_request: SearchRequest):
     Returns the most relevant documents without conversational context.
     Uses intelligent filtering based on similarity scores.
     """
+    await wait_for_services()
     if not vector_loader:
         raise HTTPException(status_code=500, detail="Vector database not initialized")
 
     try:
         # Use adaptive search filtering
-        results = vector_loader.search(
-            search_request.query, k=search_request.k or 5, use_adaptive_threshold=True
+        results = await vector_loader.asearch(
+            search_request.query,
+            k=search_request.k or 5,
+            use_adaptive_threshold=True,
+            mode=search_request.mode or SEARCH_MODE,
+            filters=filter_dict(search_request.filters),
+            mmr_lambda=search_request.mmr_lambda,
+            merge_adjacent=search_request.merge_adjacent,
         )
 
         return SearchResponse(
@@ -397,75 +627,117 @@ async def semantic_search(request: Request, search_request: SearchRequest):
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}") from e
 
 
-@app.post("/chat", response_model=ChatResponse)
-@limiter.limit(
-    "10/minute"
-)  # Allow 10 chat messages per minute per IP (reduced due to Azure rate limits)
-async def conversational_rag(request: Request, chat_request: ChatRequest):
+@app.post("/search/batch", response_model=BatchSearchResponse)
+@limiter.limit("10/minute")  # Each request may carry up to MAX_BATCH_QUERIES queries
+async def batch_semantic_search(request: Request, batch_request: BatchSearchRequest):
     """
-    Conversational RAG with memory and context awareness.
+    Perform semantic search for many queries in one request.
 
-    Maintains conversation history and provides contextually relevant responses.
+    Embeds all queries in one API call and scans the index once. Intended for offline
+    evaluation jobs and prefetching, where per-query round trips dominate.
     """
-    start_time = time.time()
-    logger.info(
-        f"Chat request received - Session: {chat_request.session_id}, Message length: {len(chat_request.message)}"
-    )
+    await wait_for_services()
+    if not vector_loader:
+        raise HTTPException(status_code=500, detail="Vector database not initialized")
 
-    if not vector_loader or not chat_model:
-        logger.error("RAG services not initialized")
-        raise HTTPException(status_code=500, detail="RAG services not initialized")
+    if len(batch_request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries: {len(batch_request.queries)} (max {MAX_BATCH_QUERIES})",
+        )
 
     try:
-        # Get conversation history for this session
-        history_messages = get_conversation_history(chat_request.session_id)
-
-        # Add history if provided (for session restoration)
-        if chat_request.history:
-            conversation_histories[chat_request.session_id] = []  # Clear existing history
-            for msg in chat_request.history:
-                if msg.role == "user":
-                    add_to_conversation_history(
-                        chat_request.session_id, HumanMessage(content=msg.content)
-                    )
-                elif msg.role == "assistant":
-                    add_to_conversation_history(
-                        chat_request.session_id, AIMessage(content=msg.content)
-                    )
-            # Refresh history after adding
-            history_messages = get_conversation_history(chat_request.session_id)
-
-        # Create context-aware search query
-        search_query = create_context_aware_query(chat_request.message, chat_request.history)
-        search_start = time.time()
-        logger.info(f"Starting vector search for query: {search_query[:100]}...")
-
-        # Retrieve relevant documents with adaptive filtering
-        retrieved_docs = vector_loader.search(search_query, k=5, use_adaptive_threshold=True)
-        search_time = time.time() - search_start
-        logger.info(
-            f"Vector search completed in {search_time:.2f}s, found {len(retrieved_docs)} documents"
+        results = await vector_loader.asearch_batch(
+            batch_request.queries,
+            k=batch_request.k or 5,
+            use_adaptive_threshold=True,
+            mode=batch_request.mode or SEARCH_MODE,
+            filters=filter_dict(batch_request.filters),
         )
 
-        # Build context from retrieved documents
-        context_parts = []
-        for doc in retrieved_docs:
-            context_parts.append(f"From {doc['citation_url']}: {doc['content']}")
-        context = "\n\n".join(context_parts) if context_parts else "(No relevant content found)"
-
-        # Build topics list for prompt
-        topics_for_prompt = (
-            ", ".join(WEBSITE_TOPICS[:15])
-            if WEBSITE_TOPICS
-            else "CS education, teaching, University of Illinois"
+        return BatchSearchResponse(
+            results=results,
+            queries=batch_request.queries,
+            timestamp=datetime.now().isoformat(),
         )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch search failed: {str(e)}") from e
+
+
+def restore_session_history(chat_request: ChatRequest) -> list[HumanMessage | AIMessage]:
+    """Get conversation history for a chat request, restoring it from the client if provided."""
+    # Get conversation history for this session
+    history_messages = get_conversation_history(chat_request.session_id)
+
+    # Add history if provided (for session restoration)
+    if chat_request.history:
+        conversation_histories[chat_request.session_id] = []  # Clear existing history
+        for msg in chat_request.history:
+            if msg.role == "user":
+                add_to_conversation_history(
+                    chat_request.session_id, HumanMessage(content=msg.content)
+                )
+            elif msg.role == "assistant":
+                add_to_conversation_history(chat_request.session_id, AIMessage(content=msg.content))
+        # Refresh history after adding
+        history_messages = get_conversation_history(chat_request.session_id)
+
+    return history_messages
+
+
+async def retrieve_chat_documents(
+    chat_request: ChatRequest, loader: ProductionVectorLoader
+) -> tuple[list[dict[str, Any]], float]:
+    """Retrieve documents for a chat message. Returns (documents, search_time)."""
+    # Create context-aware search query
+    search_query = create_context_aware_query(chat_request.message, chat_request.history)
+    search_start = time.time()
+    logger.info(f"Starting vector search for query: {search_query[:100]}...")
+
+    # Retrieve relevant documents with adaptive filtering
+    retrieved_docs = await loader.asearch(
+        search_query,
+        k=5,
+        use_adaptive_threshold=True,
+        mode=SEARCH_MODE,
+        mmr_lambda=CHAT_MMR_LAMBDA,
+        merge_adjacent=CHAT_MERGE_ADJACENT,
+    )
+    search_time = time.time() - search_start
+    logger.info(
+        f"Vector search completed in {search_time:.2f}s, found {len(retrieved_docs)} documents"
+    )
+    return retrieved_docs, search_time
+
+
+def build_chat_chain(
+    retrieved_docs: list[dict[str, Any]], history_messages, model: "AzureChatOpenAI"
+):
+    """Build the prompt | model | parser chain for a chat turn."""
+    # Build context from retrieved documents
+    context_parts = []
+    for doc in retrieved_docs:
+        context_parts.append(f"From {doc['citation_url']}: {doc['content']}")
+    context = "\n\n".join(context_parts) if context_parts else "(No relevant content found)"
+
+    # Build topics list for prompt
+    topics_for_prompt = (
+        ", ".join(WEBSITE_TOPICS[:15])
+        if WEBSITE_TOPICS
+        else "CS education, teaching, University of Illinois"
+    )
+
+    # Imported here rather than at startup; they're only needed once a chat arrives
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain_core.runnables import RunnablePassthrough
 
-        # Create the prompt template
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    f"""You are Geoffrey Challen, a Teaching Professor at the University of Illinois. You're answering questions about your work, teaching, and thoughts based on your website content.
+    # Create the prompt template
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                f"""You are Geoffrey Challen, a Teaching Professor at the University of Illinois. You're answering questions about your work, teaching, and thoughts based on your website content.
 
 INSTRUCTIONS:
 1. For greetings and pleasantries (like "hi", "hello", "how are you"): Respond warmly and briefly introduce yourself. Mention that you can answer questions about topics like {topics_for_prompt}.
@@ -477,32 +749,101 @@ Be conversational and engaging, as if you're speaking directly to the person ask
 
 Context from your website:
 {{context}}""",
-                ),
-                MessagesPlaceholder(variable_name="history"),
-                ("human", "{question}"),
-            ]
-        )
+            ),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "{question}"),
+        ]
+    )
+
+    # Create the chain
+    return (
+        {
+            "context": lambda x: context,
+            "question": RunnablePassthrough(),
+            "history": lambda x: history_messages,
+        }
+        | prompt
+        | model
+        | StrOutputParser()
+    )
+
 
-        # Use the conversation history we already retrieved
+def build_sources(retrieved_docs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Extract source information for the client from retrieved documents."""
+    sources = []
+    for doc in retrieved_docs:
+        # Use page_title from the enhanced search results
+        title = doc.get("page_title", "").strip()
+        if not title:
+            title = doc.get("title", "Website Content").strip()
 
-        # Create the chain
-        chain = (
+        sources.append(
             {
-                "context": lambda x: context,
-                "question": RunnablePassthrough(),
-                "history": lambda x: history_messages,
+                "url": doc["citation_url"],
+                "title": title,
+                "content_preview": doc["content"][:200] + "..."
+                if len(doc["content"]) > 200
+                else doc["content"],
+                "content_full": doc["content"],  # Full content for text fragments
+                "similarity_score": doc.get("score", 0.0),  # Include similarity score for debugging
             }
-            | prompt
-            | chat_model
-            | StrOutputParser()
         )
+    return sources
+
+
+def chat_http_exception(e: Exception) -> HTTPException:
+    """Map a chat failure to the HTTP error returned to the client."""
+    # Check for specific Azure OpenAI errors
+    error_message = str(e)
+    if "429" in error_message or "rate limit" in error_message.lower():
+        logger.warning(f"Rate limit detected: {error_message}")
+        return HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded. Please try again in a moment.",
+        )
+    elif "timeout" in error_message.lower():
+        logger.warning(f"Timeout detected: {error_message}")
+        return HTTPException(status_code=504, detail="Request timed out. Please try again.")
+    else:
+        return HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+
+def sse_event(event: str, data: dict[str, Any]) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat", response_model=ChatResponse)
+@limiter.limit(
+    "10/minute"
+)  # Allow 10 chat messages per minute per IP (reduced due to Azure rate limits)
+async def conversational_rag(request: Request, chat_request: ChatRequest):
+    """
+    Conversational RAG with memory and context awareness.
+
+    Maintains conversation history and provides contextually relevant responses.
+    """
+    start_time = time.time()
+    logger.info(
+        f"Chat request received - Session: {chat_request.session_id}, Message length: {len(chat_request.message)}"
+    )
+
+    await wait_for_services()
+    if not vector_loader or not chat_model:
+        logger.error("RAG services not initialized")
+        raise HTTPException(status_code=500, detail="RAG services not initialized")
+
+    try:
+        history_messages = restore_session_history(chat_request)
+        retrieved_docs, search_time = await retrieve_chat_documents(chat_request, vector_loader)
+        chain = build_chat_chain(retrieved_docs, history_messages, chat_model)
 
         # Generate response with retry logic
         llm_start = time.time()
         logger.info("Starting LLM generation...")
 
         async def llm_call():
-            return chain.invoke(chat_request.message)
+            return await chain.ainvoke(chat_request.message)
 
         response = await retry_with_backoff(llm_call, max_retries=3, base_delay=2.0)
         llm_time = time.time() - llm_start
@@ -516,27 +857,7 @@ Context from your website:
         )
         add_to_conversation_history(chat_request.session_id, AIMessage(content=response))
 
-        # Extract source information
-        sources = []
-        for doc in retrieved_docs:
-            # Use page_title from the enhanced search results
-            title = doc.get("page_title", "").strip()
-            if not title:
-                title = doc.get("title", "Website Content").strip()
-
-            sources.append(
-                {
-                    "url": doc["citation_url"],
-                    "title": title,
-                    "content_preview": doc["content"][:200] + "..."
-                    if len(doc["content"]) > 200
-                    else doc["content"],
-                    "content_full": doc["content"],  # Full content for text fragments
-                    "similarity_score": doc.get(
-                        "score", 0.0
-                    ),  # Include similarity score for debugging
-                }
-            )
+        sources = build_sources(retrieved_docs)
 
         total_time = time.time() - start_time
         logger.info(
@@ -556,22 +877,92 @@ Context from your website:
             f"Chat request failed after {total_time:.2f}s - Session: {chat_request.session_id}, Error: {str(e)}",
             exc_info=True,
         )
+        raise chat_http_exception(e) from e
 
-        # Check for specific Azure OpenAI errors
-        error_message = str(e)
-        if "429" in error_message or "rate limit" in error_message.lower():
-            logger.warning(f"Rate limit detected: {error_message}")
-            raise HTTPException(
-                status_code=429,
-                detail="Rate limit exceeded. Please try again in a moment.",
-            ) from e
-        elif "timeout" in error_message.lower():
-            logger.warning(f"Timeout detected: {error_message}")
-            raise HTTPException(
-                status_code=504, detail="Request timed out. Please try again."
-            ) from e
-        else:
-            raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}") from e
+
+@app.post("/chat/stream")
+@limiter.limit("10/minute")  # Same budget as /chat
+async def conversational_rag_stream(request: Request, chat_request: ChatRequest):
+    """
+    Streaming version of /chat using server-sent events.
+
+    Sends a "sources" event first, then "token" events as the answer is generated, then a
+    "done" event. Conversation history is only updated once the stream completes.
+    """
+    start_time = time.time()
+    logger.info(
+        f"Chat stream request received - Session: {chat_request.session_id}, Message length: {len(chat_request.message)}"
+    )
+
+    await wait_for_services()
+    if not vector_loader or not chat_model:
+        logger.error("RAG services not initialized")
+        raise HTTPException(status_code=500, detail="RAG services not initialized")
+
+    try:
+        history_messages = restore_session_history(chat_request)
+        retrieved_docs, search_time = await retrieve_chat_documents(chat_request, vector_loader)
+        chain = build_chat_chain(retrieved_docs, history_messages, chat_model)
+    except Exception as e:
+        total_time = time.time() - start_time
+        logger.error(
+            f"Chat stream failed after {total_time:.2f}s - Session: {chat_request.session_id}, Error: {str(e)}",
+            exc_info=True,
+        )
+        raise chat_http_exception(e) from e
+
+    async def event_stream():
+        yield sse_event("sources", {"sources": build_sources(retrieved_docs)})
+
+        llm_start = time.time()
+        first_token_time = None
+        response_parts = []
+        logger.info("Starting streaming LLM generation...")
+
+        try:
+            async for token in chain.astream(chat_request.message):
+                if not token:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time() - llm_start
+                    logger.info(f"First token received after {first_token_time:.2f}s")
+                response_parts.append(token)
+                yield sse_event("token", {"content": token})
+        except Exception as e:
+            total_time = time.time() - start_time
+            logger.error(
+                f"Chat stream failed after {total_time:.2f}s - Session: {chat_request.session_id}, Error: {str(e)}",
+                exc_info=True,
+            )
+            error = chat_http_exception(e)
+            yield sse_event("error", {"status_code": error.status_code, "detail": error.detail})
+            return
+
+        response = "".join(response_parts)
+        llm_time = time.time() - llm_start
+
+        # Only commit the turn once the full answer has been delivered
+        add_to_conversation_history(
+            chat_request.session_id, HumanMessage(content=chat_request.message)
+        )
+        add_to_conversation_history(chat_request.session_id, AIMessage(content=response))
+
+        total_time = time.time() - start_time
+        ttft = first_token_time if first_token_time is not None else llm_time
+        logger.info(
+            f"Chat stream completed in {total_time:.2f}s total (search: {search_time:.2f}s, first token: {ttft:.2f}s, LLM: {llm_time:.2f}s)"
+        )
+
+        yield sse_event(
+            "done",
+            {"session_id": chat_request.session_id, "timestamp": datetime.now().isoformat()},
+        )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/sessions/{session_id}/history")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Semantic result cache for the RAG loader.
+
+Questions on the site cluster heavily ("what do you teach", "what courses do you teach"),
+so the loader keeps the final ranked results of recent queries next to their normalized
+query vectors. A new query whose vector is within a small cosine distance of a cached one,
+searched with the same options, gets the cached results without a scan of the database.
+Lexical searches don't embed the query and are not cached. Hybrid results also depend
+on the query's BM25 terms, so their key includes the tokenized query: a hybrid search
+reuses the fused ranking of a near-duplicate query only if it has the same terms.
+
+The cached vectors live in a tiny flat index: a fixed-size matrix scanned with one
+matrix-vector product, replaced oldest first. Entries belong to one database build and
+are dropped as soon as the cache is used with a different build.
+"""
+
+import copy
+import json
+import threading
+from typing import Any
+
+import numpy as np
+
+
+def search_key(**options: Any) -> str:
+    """Canonical form of the search options that must match for a cached result to apply."""
+    return json.dumps(options, sort_keys=True, default=str)
+
+
+class SemanticResultCache:
+    """Bounded cache of ranked results, looked up by near-duplicate query vectors."""
+
+    def __init__(self, max_entries: int = 256, max_distance: float = 0.05):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Number of cached queries; the oldest is replaced when full
+            max_distance: Largest cosine distance (1 - cosine similarity) between a new
+                query and a cached one for the cached results to be returned
+        """
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.version: str | None = None  # Build the cached results came from
+        self._vectors: np.ndarray | None = None  # max_entries x dimension, allocated on first put
+        self._keys: list[str | None] = [None] * max_entries
+        self._results: list[list[dict[str, Any]] | None] = [None] * max_entries
+        self._count = 0
+        self._next = 0  # Slot replaced by the next put
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version: str | None):
+        """Drop every entry when the database build changes. Call with the lock held."""
+        if version != self.version:
+            self.version = version
+            self._count = 0
+            self._next = 0
+            self._keys = [None] * self.max_entries
+            self._results = [None] * self.max_entries
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        query: np.ndarray = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def get(self, vector, key: str, version: str | None) -> list[dict[str, Any]] | None:
+        """
+        Return cached results for a near-duplicate query, or None on a miss.
+
+        Args:
+            vector: Query embedding
+            key: search_key() of the search options
+            version: Build version of the database being searched
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            results: list[dict[str, Any]] | None = None
+            if self._count and self._vectors is not None and self._vectors.shape[1] == len(query):
+                similarity = self._vectors[: self._count] @ query
+                # Closest first, stopping at the distance limit
+                for slot in np.argsort(-similarity, kind="stable"):
+                    if similarity[slot] < 1 - self.max_distance:
+                        break
+                    if self._keys[slot] == key:
+                        results = self._results[slot]
+                        break
+            if results is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Callers may annotate their results, so never hand out the cached objects
+        return copy.deepcopy(results)
+
+    def put(self, vector, key: str, version: str | None, results: list[dict[str, Any]]):
+        """Cache the results of a search that missed."""
+        query = self._normalize(vector)
+        results = copy.deepcopy(results)
+        with self._lock:
+            self._check_version(version)
+            vectors = self._vectors
+            if vectors is None or vectors.shape[1] != len(query):
+                vectors = self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+                self._count = 0
+                self._next = 0
+            slot = self._next
+            vectors[slot] = query
+            self._keys[slot] = key
+            self._results[slot] = results
+            self._next = (slot + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "result_cache_entries": self._count,
+            "result_cache_hits": self.hits,
+            "result_cache_misses": self.misses,
+            "result_cache_hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -22,9 +22,10 @@ def check_production_requirements():
     required_vars = [
         "AZURE_OPENAI_CHAT_ENDPOINT",
         "AZURE_OPENAI_CHAT_API_KEY",
-        "AZURE_OPENAI_EMBEDDINGS_ENDPOINT",
-        "AZURE_OPENAI_EMBEDDINGS_API_KEY",
     ]
+    # Other embedding providers (see embedding_providers.py) need no credentials
+    if os.getenv("EMBEDDINGS_PROVIDER", "azure").strip().lower() == "azure":
+        required_vars += ["AZURE_OPENAI_EMBEDDINGS_ENDPOINT", "AZURE_OPENAI_EMBEDDINGS_API_KEY"]
 
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     if missing_vars:
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Tests for approximate index construction and the recall/latency report."""
+
+import sys
+
+sys.path.insert(0, ".")
+
+import faiss
+import numpy as np
+import pytest
+
+from ann_index import (
+    build_faiss_index,
+    evaluate_index_configs,
+    format_index_report,
+    indexed_ids,
+    rerank,
+    resolve_index_params,
+    search_with_rerank,
+    unwrap_index,
+)
+
+
+def clustered_vectors(n: int = 2000, d: int = 64, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    """Normalized vectors drawn around a handful of centers, like real embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, d))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, d))
+    vectors = vectors.astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def test_resolve_index_params():
+    params = resolve_index_params("ivf-flat", 10000, {"nprobe": 4})
+    assert params["nprobe"] == 4
+    assert params["nlist"] == 256  # min(4 * sqrt(n), n / 39)
+
+    assert resolve_index_params("hnsw", 100, {"m": None})["m"] == 32
+    with pytest.raises(ValueError):
+        resolve_index_params("lsh", 100)
+
+
+@pytest.mark.parametrize(
+    "index_type", ["flat", "hnsw", "ivf-flat", "ivf-pq", "sq-fp16", "sq-int8", "binary"]
+)
+def test_build_faiss_index(index_type):
+    vectors = clustered_vectors()
+    # 4-bit codes keep PQ training fast enough for a unit test
+    params = resolve_index_params(index_type, len(vectors), {"pq_m": 16, "pq_bits": 4})
+    index = build_faiss_index(vectors, index_type, params)
+    assert index.ntotal == len(vectors)
+
+    # Each vector should find itself; PQ codes are lossy so allow more misses
+    _, found = index.search(vectors[:20], 1)
+    minimum = 0.5 if index_type == "ivf-pq" else 0.9
+    assert (found[:, 0] == np.arange(20)).mean() >= minimum
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf-flat", "sq-int8", "binary"])
+def test_index_keyed_by_ids(index_type):
+    vectors = clustered_vectors(n=500)
+    ids = np.arange(500, dtype=np.int64) * 3
+    params = resolve_index_params(index_type, len(vectors), {"ef_search": 48, "nprobe": 5})
+    index = build_faiss_index(vectors, index_type, params, ids=ids)
+
+    _, found = index.search(vectors[:20], 1)
+    assert (found[:, 0] == ids[:20]).mean() >= 0.9
+    inner = unwrap_index(index)
+    if index_type == "hnsw":
+        assert inner.hnsw.efSearch == 48
+    elif index_type == "ivf-flat":
+        assert inner.nprobe == 5
+
+    # Vectors come and go by id without retraining
+    index.add_with_ids(vectors[:1], np.array([10_000], dtype=np.int64))
+    assert index.search(vectors[:1], 2)[1][0].tolist().count(10_000) == 1
+    if index_type != "hnsw":
+        assert index.remove_ids(np.array([10_000, ids[0]], dtype=np.int64)) == 2
+        assert sorted(indexed_ids(index)) == sorted(ids[1:])
+        # The remaining vectors keep their ids
+        _, found = index.search(vectors[1:20], 1)
+        assert (found[:, 0] == ids[1:20]).mean() >= 0.9
+
+
+def test_ivf_pq_rejects_small_corpus():
+    vectors = clustered_vectors(n=100)
+    params = resolve_index_params("ivf-pq", len(vectors), {"pq_m": 16})
+    with pytest.raises(ValueError):
+        build_faiss_index(vectors, "ivf-pq", params)
+
+
+def test_evaluate_index_configs():
+    vectors = clustered_vectors()
+    report = evaluate_index_configs(
+        vectors, [("flat", {}), ("hnsw", {}), ("ivf-flat", {"nprobe": 1})], k=10, num_queries=50
+    )
+
+    assert report["num_queries"] == 50
+    assert report["num_vectors"] == len(vectors) - 50
+    assert report["query_source"] == "held-out chunks"
+
+    by_type = {row["index_type"]: row for row in report["results"]}
+    assert by_type["flat"]["recall_at_k"] == 1.0
+    assert by_type["hnsw"]["recall_at_k"] > 0.9
+    assert by_type["ivf-flat"]["recall_at_k"] < 1.0
+    for row in report["results"]:
+        assert 0 < row["p50_ms"] <= row["p99_ms"]
+        assert row["index_bytes"] > 0
+
+    assert "hnsw" in format_index_report(report)
+
+
+@pytest.mark.parametrize(("index_type", "ratio"), [("sq-fp16", 2), ("sq-int8", 4), ("binary", 32)])
+def test_quantized_index_rerank(index_type, ratio):
+    vectors = clustered_vectors()
+    flat = build_faiss_index(vectors, "flat", {})
+    params = resolve_index_params(index_type, len(vectors))
+    index = build_faiss_index(vectors, index_type, params)
+
+    # Codes shrink by the expected factor relative to float32 storage
+    assert index.sa_code_size() * ratio == vectors.shape[1] * 4
+
+    # Queries near corpus points, like real questions about an indexed essay
+    rng = np.random.default_rng(1)
+    queries = (vectors[:50] + 0.2 * rng.standard_normal((50, vectors.shape[1]))).astype(np.float32)
+    faiss.normalize_L2(queries)
+    exact_scores, exact_ids = flat.search(queries, 10)
+    scores, ids = search_with_rerank(index, vectors, queries, 10, params["rerank_factor"])
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(ids, exact_ids)])
+    assert recall >= (0.85 if index_type == "binary" else 0.99)
+    # Re-ranked scores are exact inner products, not quantized approximations
+    assert np.allclose(scores, np.einsum("qkd,qd->qk", vectors[ids], queries), atol=1e-5)
+    assert (scores <= exact_scores[:, :1] + 1e-5).all()
+
+
+def test_rerank_pads_missing_candidates():
+    vectors = clustered_vectors(n=10)
+    candidates = np.array([[3, 1, -1, -1]])
+    scores, ids = rerank(vectors, vectors[1:2], candidates, 3)
+    assert ids[0].tolist() == [1, 3, -1]
+    assert scores[0, 0] == pytest.approx(1.0)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Tests for the build manifest that lets incremental builds skip unchanged HTML files,
+and for removing the chunks of edited or deleted pages.
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, ".")
+
+import pytest
+
+import ann_index
+import vector_db_builder
+import vector_db_loader
+from ann_index import indexed_ids
+from build_manifest import MANIFEST_FILE, BuildManifest
+from vector_db_builder import ProductionVectorDB, build_production_database
+from vector_db_loader import ProductionVectorLoader
+
+SETTINGS = {"min_paragraph_length": 10, "max_paragraphs_per_chunk": 2, "overlap_paragraphs": 1}
+
+
+def write_page(path, name, paragraphs=3):
+    body = "".join(f"<p>{name} paragraph {i} about teaching large courses.</p>" for i in range(paragraphs))
+    path.write_text(
+        f'<html><head><title>{name}</title><meta name="url" content="{name}"></head>'
+        f"<body><h2>{name}</h2>{body}</body></html>"
+    )
+
+
+@pytest.fixture
+def site(tmp_path):
+    html_dir = tmp_path / "html"
+    html_dir.mkdir()
+    for name in ("alpha", "beta", "gamma"):
+        write_page(html_dir / f"{name}.html", name)
+    return html_dir
+
+
+def build(site, tmp_path, **kwargs):
+    build_production_database(
+        str(site),
+        str(tmp_path / "vector_db"),
+        min_paragraph_length=SETTINGS["min_paragraph_length"],
+        max_paragraphs_per_chunk=SETTINGS["max_paragraphs_per_chunk"],
+        overlap_paragraphs=SETTINGS["overlap_paragraphs"],
+        embeddings_provider="hashed",
+        **kwargs,
+    )
+    with open(tmp_path / "vector_db" / "build_info.json") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def split_files(monkeypatch):
+    """Record which files each build parses."""
+    calls = []
+    split = vector_db_builder.split_html_files
+
+    def recording_split(html_files, splitter, jobs=1):
+        calls.append(sorted(path.name for path in html_files))
+        return split(html_files, splitter, jobs)
+
+    monkeypatch.setattr(vector_db_builder, "split_html_files", recording_split)
+    return calls
+
+
+def test_manifest_detects_changes(site, tmp_path):
+    page = site / "alpha.html"
+    manifest = BuildManifest(SETTINGS)
+    manifest.record(page, ["h1", "h2"])
+    manifest.save(tmp_path / MANIFEST_FILE)
+
+    loaded = BuildManifest.load(tmp_path, SETTINGS)
+    assert loaded.unchanged(page, {"h1": 0, "h2": 1})
+    # Chunks missing from the database force a re-parse
+    assert not loaded.unchanged(page, {"h1": 0})
+
+    # A touch changes the mtime but not the bytes
+    stat = os.stat(page)
+    os.utime(page, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert loaded.unchanged(page, {"h1": 0, "h2": 1})
+    assert loaded.files[str(page)]["mtime_ns"] == stat.st_mtime_ns + 10**9
+
+    write_page(page, "alpha", paragraphs=4)
+    assert not loaded.unchanged(page, {"h1": 0, "h2": 1})
+
+    # Different splitter settings invalidate every entry
+    assert BuildManifest.load(tmp_path, {**SETTINGS, "overlap_paragraphs": 0}).files == {}
+
+
+def test_noop_rebuild_parses_nothing(site, tmp_path, split_files):
+    first = build(site, tmp_path)
+    assert split_files[-1] == ["alpha.html", "beta.html", "gamma.html"]
+
+    second = build(site, tmp_path)
+    assert split_files[-1] == []
+    # Nothing was saved, so running servers see no new build
+    assert second["build_timestamp"] == first["build_timestamp"]
+
+    write_page(site / "beta.html", "beta", paragraphs=5)
+    (site / "gamma.html").unlink()
+    third = build(site, tmp_path)
+    assert split_files[-1] == ["beta.html"]
+    assert third["build_timestamp"] != first["build_timestamp"]
+
+    manifest = json.loads((tmp_path / "vector_db" / MANIFEST_FILE).read_text())
+    assert sorted(os.path.basename(path) for path in manifest["files"]) == ["alpha.html", "beta.html"]
+
+
+def test_edited_and_deleted_pages_leave_no_searchable_chunks(site, tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDINGS_PROVIDER", "hashed")
+    build(site, tmp_path)
+    write_page(site / "beta.html", "beta", paragraphs=2)
+    (site / "gamma.html").unlink()
+    info = build(site, tmp_path, compact_threshold=1.0)
+
+    # Below the threshold the stale chunks are tombstoned but kept
+    builder = ProductionVectorDB()
+    builder.load_existing_database(str(tmp_path / "vector_db"))
+    stale_sources = {meta["citation_url"] for meta in builder.metadata if meta.get("stale")}
+    assert stale_sources == {"/beta", "/gamma"}
+    assert info["stale_chunks"] == builder.stale_count
+
+    loader = ProductionVectorLoader(str(tmp_path / "vector_db"))
+    for mode in ("vector", "hybrid", "lexical"):
+        results = loader.search("gamma paragraph", k=10, use_adaptive_threshold=False, mode=mode)
+        assert results and all(r["metadata"]["citation_url"] != "/gamma" for r in results)
+    assert loader.get_stats()["stale_chunks"] == builder.stale_count
+
+    # Past the threshold the next build drops them and renumbers the rest
+    total = len(builder.metadata)
+    info = build(site, tmp_path, compact_threshold=0.0)
+    assert info["stale_chunks"] == 0
+    assert info["total_chunks"] == total - builder.stale_count
+
+    compacted = ProductionVectorDB()
+    compacted.load_existing_database(str(tmp_path / "vector_db"))
+    assert [meta["chunk_id"] for meta in compacted.metadata] == list(range(len(compacted.metadata)))
+    assert compacted.index.ntotal == len(compacted.documents) == len(compacted.embeddings)
+
+
+def test_restored_paragraph_is_revived(site, tmp_path):
+    build(site, tmp_path)
+    original = (site / "beta.html").read_text()
+    write_page(site / "beta.html", "beta", paragraphs=1)
+    edited = build(site, tmp_path, compact_threshold=1.0)["stale_chunks"]
+    assert edited > 0
+
+    # The original chunks come back; only the edit's own single-paragraph chunk goes stale
+    (site / "beta.html").write_text(original)
+    assert build(site, tmp_path, compact_threshold=1.0)["stale_chunks"] == 1
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf-flat", "hnsw"])
+def test_incremental_build_updates_index_in_place(site, tmp_path, monkeypatch, index_type):
+    monkeypatch.setenv("EMBEDDINGS_PROVIDER", "hashed")
+    for i in range(30):
+        write_page(site / f"page{i:02}.html", f"page{i:02}", paragraphs=4)
+    # Probing every list makes IVF exact, since new chunks join lists trained without them
+    options = {"index_type": index_type, "index_params": {"nprobe": 64}}
+    build(site, tmp_path, **options)
+
+    rebuilds = []
+    rebuild = ProductionVectorDB.rebuild_faiss_index
+
+    def recording_rebuild(self):
+        rebuilds.append(len(self.embeddings))
+        rebuild(self)
+
+    monkeypatch.setattr(ProductionVectorDB, "rebuild_faiss_index", recording_rebuild)
+    write_page(site / "beta.html", "beta", paragraphs=5)
+    write_page(site / "delta.html", "delta")
+    build(site, tmp_path, compact_threshold=1.0, **options)
+    assert rebuilds == []
+
+    updated = ProductionVectorDB()
+    updated.load_existing_database(str(tmp_path / "vector_db"))
+    indexed = set(indexed_ids(updated.index).tolist())
+    live = set(updated.live_ids().tolist())
+    if index_type == "hnsw":
+        # HNSW can't delete, so its tombstoned chunks stay in the index behind the live mask
+        assert live < indexed
+    else:
+        assert indexed == live
+
+    # Searches over the updated index agree with a clean build of the same pages
+    fresh = tmp_path / "fresh"
+    fresh.mkdir()
+    build(site, fresh, **options)
+    loader = ProductionVectorLoader(str(tmp_path / "vector_db"))
+    clean = ProductionVectorLoader(str(fresh / "vector_db"))
+    for query in ("beta paragraph 4", "delta paragraph", "page07 paragraph 2", "gamma teaching"):
+        ours = loader.search(query, k=3, use_adaptive_threshold=False)
+        theirs = clean.search(query, k=3, use_adaptive_threshold=False)
+        assert [r["content"] for r in ours] == [r["content"] for r in theirs]
+
+
+@pytest.mark.parametrize("index_type", ["binary", "hnsw"])
+def test_unfiltered_search_skips_live_mask_once_index_is_clean(
+    site, tmp_path, monkeypatch, index_type
+):
+    monkeypatch.setenv("EMBEDDINGS_PROVIDER", "hashed")
+    build(site, tmp_path, index_type=index_type)
+    (site / "gamma.html").unlink()
+    build(site, tmp_path, index_type=index_type, compact_threshold=1.0)
+
+    searches = []
+    filtered_search = ann_index.filtered_search
+
+    def recording_filtered_search(index, queries, k, params=None, mask=None):
+        searches.append(mask is not None)
+        return filtered_search(index, queries, k, params, mask)
+
+    # Quantized indexes reach it through ann_index.search_with_rerank
+    monkeypatch.setattr(ann_index, "filtered_search", recording_filtered_search)
+    monkeypatch.setattr(vector_db_loader, "filtered_search", recording_filtered_search)
+    loader = ProductionVectorLoader(str(tmp_path / "vector_db"))
+    assert loader.get_stats()["stale_chunks"] > 0
+    results = loader.search("gamma paragraph", k=10, use_adaptive_threshold=False)
+    assert results and all(r["metadata"]["citation_url"] != "/gamma" for r in results)
+
+    # The binary index dropped its stale chunks, so it isn't made to rank every vector;
+    # HNSW still holds them and needs the mask
+    assert loader.index_holds_stale is (index_type == "hnsw")
+    assert searches == [index_type == "hnsw"]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Tests for embedding dimension reduction and its recall report."""
+
+import sys
+
+sys.path.insert(0, ".")
+
+import faiss
+import numpy as np
+import pytest
+
+from dimension_reduction import DimensionReducer, evaluate_reduction, format_reduction_report
+
+
+def low_rank_vectors(n: int = 1000, d: int = 64, rank: int = 8, seed: int = 0) -> np.ndarray:
+    """Normalized vectors that mostly vary along a few directions, like real embeddings."""
+    rng = np.random.default_rng(seed)
+    latent = rng.standard_normal((n, rank)) @ rng.standard_normal((rank, d))
+    vectors = (latent + 0.05 * rng.standard_normal((n, d))).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def test_truncate_keeps_leading_dimensions():
+    vectors = low_rank_vectors()
+    reducer = DimensionReducer.fit(vectors, "truncate", 16)
+    reduced = reducer.transform(vectors)
+
+    assert reduced.shape == (len(vectors), 16)
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-5)
+    expected = vectors[:, :16] / np.linalg.norm(vectors[:, :16], axis=1, keepdims=True)
+    assert np.allclose(reduced, expected, atol=1e-6)
+
+
+def test_pca_preserves_neighbors_better_than_truncation():
+    vectors = low_rank_vectors()
+    pca = evaluate_reduction(vectors, DimensionReducer.fit(vectors, "pca", 8), k=10)
+    truncate = evaluate_reduction(vectors, DimensionReducer.fit(vectors, "truncate", 8), k=10)
+
+    assert pca["recall_at_k"] > 0.8
+    assert pca["recall_at_k"] > truncate["recall_at_k"]
+    assert pca["recall_loss"] == pytest.approx(1 - pca["recall_at_k"])
+    assert pca["bytes_per_vector"] * 8 == pca["source_bytes_per_vector"]
+    assert "pca 64 -> 8 dims" in format_reduction_report(pca)
+
+
+def test_save_and_load(tmp_path):
+    vectors = low_rank_vectors()
+    for method in ("truncate", "pca"):
+        reducer = DimensionReducer.fit(vectors, method, 8)
+        reducer.save(tmp_path / f"{method}.npz")
+        loaded = DimensionReducer.load(tmp_path / f"{method}.npz")
+        assert loaded.config() == {"method": method, "dimensions": 8}
+        assert np.allclose(loaded.transform(vectors[:10]), reducer.transform(vectors[:10]))
+
+
+def test_rejects_invalid_dimensions():
+    vectors = low_rank_vectors()
+    with pytest.raises(ValueError):
+        DimensionReducer.fit(vectors, "pca", 64)
+    with pytest.raises(ValueError):
+        DimensionReducer.fit(vectors, "none", 8)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""Tests for MMR ordering and merging of overlapping chunks."""
+
+import sys
+
+sys.path.insert(0, ".")
+
+import numpy as np
+
+from diversification import merge_overlapping_texts, mmr_order
+
+
+def test_mmr_pushes_near_duplicates_down():
+    vectors = np.array([[1.0, 0.0], [0.99, 0.141], [0.0, 1.0]], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    relevance = np.array([1.0, 0.95, 0.6], dtype=np.float32)
+
+    assert mmr_order(relevance, vectors, 1.0) == [0, 1, 2]
+    assert mmr_order(relevance, vectors, 0.5) == [0, 2, 1]
+    assert mmr_order(np.array([]), np.zeros((0, 2)), 0.5) == []
+
+
+def test_merge_overlapping_texts():
+    assert merge_overlapping_texts(["a\n\nb\n\nc", "c\n\nd\n\ne", "e\n\nf"]) == "a\n\nb\n\nc\n\nd\n\ne\n\nf"
+    assert merge_overlapping_texts(["a\n\nb", "c"]) == "a\n\nb\n\nc"
+    assert merge_overlapping_texts(["a"]) == "a"
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Tests for concurrent, token-budgeted embedding with AIMD rate control.
+"""
+
+import asyncio
+import sys
+from email.utils import format_datetime
+from datetime import UTC, datetime, timedelta
+
+sys.path.insert(0, ".")
+
+import numpy as np
+import pytest
+
+import embedding_pipeline
+from embedding_pipeline import (
+    AIMDLimiter,
+    embed_concurrently,
+    embed_texts,
+    fit_inputs,
+    is_transient_error,
+    pack_batches,
+    retry_after_seconds,
+    split_by_tokens,
+)
+
+TEXTS = [f"chunk {i}" for i in range(40)]  # Two tokens each
+
+
+class WordEncoding:
+    """Stands in for tiktoken, whose encoding files may not be downloadable: one token per word."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(embedding_pipeline, "_encoding", WordEncoding())
+    monkeypatch.setattr(embedding_pipeline, "_encoding_loaded", True)
+
+
+class Response:
+    def __init__(self, headers):
+        self.status_code = 429
+        self.headers = headers
+
+
+class RateLimitError(Exception):
+    def __init__(self, headers=None):
+        super().__init__("Error code: 429 - rate limit exceeded")
+        self.status_code = 429
+        self.response = Response(headers or {})
+
+
+class QuotaEmbeddings:
+    """Returns each text's number after a short delay; 429s past `capacity` requests in flight."""
+
+    def __init__(self, capacity=None, headers=None):
+        self.capacity = capacity
+        self.headers = headers or {"retry-after-ms": "5"}
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    async def aembed_documents(self, texts):
+        self.in_flight += 1
+        try:
+            self.peak = max(self.peak, self.in_flight)
+            if self.capacity is not None and self.in_flight > self.capacity:
+                self.rejected += 1
+                raise RateLimitError(self.headers)
+            await asyncio.sleep(0.01)
+            return [[float(text.split()[-1])] for text in texts]
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_requests_run_concurrently_in_order():
+    client = QuotaEmbeddings()
+    vectors, stats = await embed_concurrently(client, TEXTS, batch_tokens=8, max_in_flight=5)
+
+    assert vectors == [[float(i)] for i in range(40)]
+    assert client.peak == 5
+    assert stats.requests == 10
+    assert stats.chunks == 40 and stats.tokens == 80
+    assert stats.chunks_per_second > 0 and stats.tokens_per_second > 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limits_lower_the_limit():
+    client = QuotaEmbeddings(capacity=2)
+    vectors, stats = await embed_concurrently(client, TEXTS, batch_tokens=4, max_in_flight=8)
+
+    assert vectors == [[float(i)] for i in range(40)]
+    assert stats.rate_limited == client.rejected > 0
+    assert stats.lowest_limit <= 2
+    assert stats.requests == 20 + client.rejected
+
+
+@pytest.mark.asyncio
+async def test_one_decrease_per_congestion_event():
+    limiter = AIMDLimiter(max_in_flight=8)
+    started = [await limiter.acquire() for _ in range(6)]
+    # Requests in flight together when the service pushed back share one decrease
+    for start in started:
+        await limiter.release(start, rate_limited=True)
+    assert limiter.limit == 4
+
+    await limiter.release(await limiter.acquire(), rate_limited=True)
+    assert limiter.limit == 2
+
+    # Successes add about one request per window of successes
+    for _ in range(2):
+        await limiter.release(await limiter.acquire())
+    assert 2.8 < limiter.limit < 3
+
+
+@pytest.mark.asyncio
+async def test_other_errors_fail_the_run():
+    class BrokenEmbeddings:
+        async def aembed_documents(self, texts):
+            raise ValueError("bad input")
+
+    with pytest.raises(ValueError, match="bad input"):
+        await embed_concurrently(BrokenEmbeddings(), TEXTS)
+
+
+@pytest.mark.asyncio
+async def test_retries_are_bounded():
+    client = QuotaEmbeddings(capacity=0, headers={"retry-after": "0"})
+    with pytest.raises(RateLimitError):
+        await embed_concurrently(client, TEXTS[:2], max_retries=3)
+    assert client.rejected == 4
+
+
+class ServerError(Exception):
+    def __init__(self, status_code=503):
+        super().__init__(f"Error code: {status_code} - service unavailable")
+        self.status_code = status_code
+
+
+class APITimeoutError(Exception):
+    """Named like openai's, which is matched by name so openai needn't be imported."""
+
+
+class FlakyEmbeddings(QuotaEmbeddings):
+    """Fails the first request with `error`, then answers normally."""
+
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+        self.calls = 0
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        if self.calls == 1:
+            raise self.error
+        return await super().aembed_documents(texts)
+
+
+@pytest.mark.asyncio
+async def test_server_error_is_retried():
+    client = FlakyEmbeddings(ServerError(503))
+    vectors, stats = await embed_concurrently(client, TEXTS[:3], backoff=0.001)
+
+    assert vectors == [[0.0], [1.0], [2.0]]
+    assert client.calls == 2 and stats.requests == 2
+    assert stats.rate_limited == 0 and stats.lowest_limit == 8
+
+
+def test_transient_errors():
+    assert is_transient_error(ServerError(503)) and is_transient_error(ServerError(500))
+    assert is_transient_error(APITimeoutError("Request timed out."))
+    assert is_transient_error(ConnectionResetError())
+    assert not is_transient_error(ServerError(400))
+    assert not is_transient_error(RateLimitError())
+    assert not is_transient_error(ValueError("bad input"))
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(RateLimitError({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(RateLimitError({"retry-after": "3"})) == 3.0
+    retry_at = format_datetime(datetime.now(UTC) + timedelta(seconds=30), usegmt=True)
+    assert 25 < retry_after_seconds(RateLimitError({"retry-after": retry_at})) <= 30
+    assert retry_after_seconds(RateLimitError()) is None
+    assert retry_after_seconds(ValueError("no response")) is None
+
+
+@pytest.mark.asyncio
+async def test_sync_entry_point_works_under_a_running_loop():
+    vectors, _ = embed_texts(QuotaEmbeddings(), TEXTS[:3])
+    assert vectors == [[0.0], [1.0], [2.0]]
+
+
+def test_batches_packed_to_token_budget():
+    assert pack_batches([3, 3, 3, 1, 4, 2], max_tokens=6) == [(0, 2), (2, 4), (4, 6)]
+    # An input over the budget goes alone; max_inputs caps tiny inputs
+    assert pack_batches([1, 9, 1], max_tokens=6) == [(0, 1), (1, 2), (2, 3)]
+    assert pack_batches([1] * 5, max_tokens=100, max_inputs=2) == [(0, 2), (2, 4), (4, 5)]
+
+
+@pytest.mark.asyncio
+async def test_short_chunks_share_requests():
+    _, stats = await embed_concurrently(QuotaEmbeddings(), TEXTS)
+    assert stats.requests == 1
+
+
+class RecordingEmbeddings:
+    """Embeds a text as [number of words, 1], remembering every input."""
+
+    def __init__(self):
+        self.inputs = []
+
+    async def aembed_documents(self, texts):
+        self.inputs.extend(texts)
+        return [[float(len(text.split())), 1.0] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_oversized_input_is_split_and_averaged(capsys):
+    client = RecordingEmbeddings()
+    long_text = " ".join(f"w{i}" for i in range(7))
+    vectors, stats = await embed_concurrently(client, ["short", long_text], max_input_tokens=3)
+
+    assert client.inputs == ["short", "w0 w1 w2", "w3 w4 w5", "w6"]
+    assert "Input 1 has 7 tokens (limit 3), split into 3 pieces" in capsys.readouterr().out
+    assert vectors[0] == [1.0, 1.0]
+    expected = np.average([[3, 1], [3, 1], [1, 1]], axis=0, weights=[3, 3, 1])
+    assert np.allclose(vectors[1], expected / np.linalg.norm(expected))
+    assert stats.chunks == 2 and stats.tokens == 8
+
+
+def test_oversized_input_can_be_truncated(capsys):
+    inputs, owners, tokens = fit_inputs(["a b c d e"], max_input_tokens=2, oversize="truncate")
+    assert (inputs, owners, tokens) == (["a b"], [0], [2])
+    assert "truncated to 2" in capsys.readouterr().out
+    with pytest.raises(ValueError, match="oversize"):
+        fit_inputs(["a"], oversize="drop")
+
+
+def test_split_without_encoding_uses_characters(monkeypatch):
+    monkeypatch.setattr(embedding_pipeline, "_encoding", None)
+    assert split_by_tokens("x" * 10, 1) == ["xxxx", "xxxx", "xx"]
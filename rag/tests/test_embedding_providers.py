@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the embedding providers, including an offline build with hashed embeddings.
+"""
+
+import json
+import sys
+
+sys.path.insert(0, ".")
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from embedding_providers import HashedEmbeddings, get_embedding_provider, parse_azure_endpoint
+from test_vector_db_loader import TEXTS
+from vector_db_builder import ProductionVectorDB
+from vector_db_loader import ProductionVectorLoader
+
+AZURE_ENDPOINT = (
+    "https://example.invalid/openai/deployments/embed-large/embeddings?api-version=2024-02-01"
+)
+
+
+def test_hashed_embeddings_are_deterministic_unit_vectors():
+    embeddings = HashedEmbeddings(dimensions=512)
+    first = np.array(embeddings.embed_query(TEXTS[0]))
+    second = np.array(HashedEmbeddings(dimensions=512).embed_documents([TEXTS[0]])[0])
+
+    assert first.shape == (512,)
+    assert np.array_equal(first, second)
+    assert np.linalg.norm(first) == pytest.approx(1.0, abs=1e-5)
+
+
+def test_hashed_embeddings_rank_similar_texts_closer():
+    embeddings = HashedEmbeddings(dimensions=1024)
+    query = embeddings.embed("introductory programming course")
+    vectors = np.array(embeddings.embed_documents(TEXTS))
+    assert int(np.argmax(vectors @ query)) == 0
+
+
+def test_provider_selected_by_environment(monkeypatch):
+    monkeypatch.setenv("EMBEDDINGS_PROVIDER", "hashed")
+    monkeypatch.setenv("EMBEDDINGS_DIMENSIONS", "256")
+    provider = get_embedding_provider()
+
+    assert provider.name == "hashed"
+    assert provider.namespace == "hashed:256"
+    assert len(provider.client.embed_query("hello")) == 256
+    assert provider.client is provider.client
+
+
+def test_azure_provider_namespace_and_errors(monkeypatch):
+    assert parse_azure_endpoint(AZURE_ENDPOINT) == (
+        "https://example.invalid",
+        "embed-large",
+        "2024-02-01",
+    )
+
+    monkeypatch.delenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT", raising=False)
+    monkeypatch.delenv("AZURE_OPENAI_EMBEDDINGS_API_KEY", raising=False)
+    with pytest.raises(ValueError, match="credentials"):
+        get_embedding_provider("azure")
+    with pytest.raises(ValueError, match="Unknown embeddings provider"):
+        get_embedding_provider("word2vec")
+
+    monkeypatch.setenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT", AZURE_ENDPOINT)
+    monkeypatch.setenv("AZURE_OPENAI_EMBEDDINGS_API_KEY", "test")
+    # Building the provider doesn't construct the client
+    assert get_embedding_provider("azure").namespace == "embed-large:2024-02-01"
+
+
+def test_offline_build_and_search(tmp_path, monkeypatch):
+    """A hashed build needs no credentials and records its embeddings in build_info."""
+    monkeypatch.delenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT", raising=False)
+    monkeypatch.delenv("AZURE_OPENAI_EMBEDDINGS_API_KEY", raising=False)
+    provider = get_embedding_provider("hashed", dimensions=512)
+
+    html_path = tmp_path / "page.html"
+    html_path.write_text('<html><head><meta name="url" content="essays/test"></head></html>')
+
+    builder = ProductionVectorDB(provider.client, embedding_provider=provider)
+    builder.add_documents_incremental(
+        [(Document(page_content=text, metadata={}), {"source_file": str(html_path)}) for text in TEXTS]
+    )
+    builder.build_embeddings_incremental()
+    builder.rebuild_faiss_index()
+    builder.save_to_disk(str(tmp_path / "vector_db"))
+
+    build_info = json.loads((tmp_path / "vector_db" / "build_info.json").read_text())
+    assert build_info["embeddings"] == "hashed:512"
+    assert build_info["embedding_throughput"]["chunks"] == len(TEXTS)
+
+    loader = ProductionVectorLoader(str(tmp_path / "vector_db"), embedding_provider=provider)
+    results = loader.search("Kotlin and Java", k=1, use_adaptive_threshold=False)
+    assert results[0]["content"] == TEXTS[3]
+
+    # A database built with other embeddings is not extended incrementally
+    other = get_embedding_provider("hashed", dimensions=256)
+    rebuild = ProductionVectorDB(other.client, embedding_provider=other)
+    assert not rebuild.load_existing_database(str(tmp_path / "vector_db"))
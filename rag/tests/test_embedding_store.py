@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed embedding store and its reuse across builds.
+"""
+
+import json
+import shutil
+import sys
+
+sys.path.insert(0, ".")
+
+import numpy as np
+
+import essay_similarity
+import vector_db_builder
+from embedding_providers import get_embedding_provider
+from embedding_store import EmbeddingStore, text_digest
+from test_build_manifest import SETTINGS, write_page
+from vector_db_builder import build_production_database
+
+
+def test_store_round_trip(tmp_path):
+    store = EmbeddingStore(tmp_path / "store")
+    assert store.get("model-a", ["one"]) == [None]
+
+    store.put("model-a", ["one", "two"], [[1.0, 0.0], [0.0, 1.0]])
+    store.put("model-a", ["two", "three"], [[9.0, 9.0], [0.5, 0.5]])  # "two" is kept
+
+    # A new instance reads what the first one wrote
+    reopened = EmbeddingStore(tmp_path / "store")
+    one, two, three, four = reopened.get("model-a", ["one", "two", "three", "four"])
+    assert one.tolist() == [1.0, 0.0] and two.tolist() == [0.0, 1.0]
+    assert three.tolist() == [0.5, 0.5] and four is None
+    assert reopened.get_digests("model-a", [text_digest("one")])[0].tolist() == [1.0, 0.0]
+
+
+def test_namespaces_and_dimensions_are_separate(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.put("model-a", ["text"], [[1.0, 2.0]])
+    store.put("model-a", ["text"], [[1.0, 2.0, 3.0]])
+
+    assert store.get("model-b", ["text"]) == [None]
+    assert store.get("model-a", ["text"], dimension=3)[0].tolist() == [1.0, 2.0, 3.0]
+    assert store.get("model-a", ["text"], dimension=4) == [None]
+    assert len(list(tmp_path.glob("*.keys"))) == 2
+
+
+def test_interrupted_append_is_discarded(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.put("model-a", ["one"], [[1.0, 0.0]])
+    # Vectors are written before keys, so a crash can only leave extra vector bytes
+    (vectors_path,) = tmp_path.glob("*.f32")
+    with open(vectors_path, "ab") as f:
+        f.write(b"\0" * 6)
+
+    store = EmbeddingStore(tmp_path)
+    assert store.get("model-a", ["one"])[0].tolist() == [1.0, 0.0]
+    store.put("model-a", ["two"], [[0.0, 1.0]])
+    assert [v.tolist() for v in EmbeddingStore(tmp_path).get("model-a", ["one", "two"])] == [
+        [1.0, 0.0],
+        [0.0, 1.0],
+    ]
+
+
+def test_clean_rebuild_and_new_chunking_reuse_stored_embeddings(tmp_path, monkeypatch):
+    site = tmp_path / "html"
+    site.mkdir()
+    for name in ("alpha", "beta", "gamma"):
+        write_page(site / f"{name}.html", name, paragraphs=4)
+
+    embedded = []
+    embed_texts = vector_db_builder.embed_texts
+
+    def recording_embed_texts(model, texts, **options):
+        embedded.append(list(texts))
+        return embed_texts(model, texts, **options)
+
+    monkeypatch.setattr(vector_db_builder, "embed_texts", recording_embed_texts)
+
+    def build(**settings):
+        build_production_database(
+            str(site),
+            str(tmp_path / "vector_db"),
+            embeddings_provider="hashed",
+            embedding_store=str(tmp_path / "store"),
+            **{**SETTINGS, **settings},
+        )
+
+    build()
+    first = embedded[-1]
+    assert first
+
+    # --clean removes the database, not the store
+    shutil.rmtree(tmp_path / "vector_db")
+    build()
+    assert len(embedded) == 1
+
+    # New chunking: only chunks whose text is new are embedded
+    build(max_paragraphs_per_chunk=1)
+    assert embedded[-1] and not set(embedded[-1]) & set(first)
+
+    stored = EmbeddingStore(tmp_path / "store").get("hashed:3072", first)
+    assert all(vector is not None for vector in stored)
+    assert np.allclose(np.linalg.norm(np.array(stored), axis=1), 1.0)
+
+
+def test_essay_cache_is_imported(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    hashed = get_embedding_provider("hashed", dimensions=2)
+    text_hash = essay_similarity.content_hash("An essay")
+    with open(essay_similarity.LEGACY_CACHE_FILE, "w") as f:
+        json.dump({f"hashed:2:{text_hash}": [0.6, 0.8], "f" * 64: [1.0, 0.0]}, f)
+
+    store = EmbeddingStore(tmp_path / "store")
+    assert essay_similarity.import_legacy_cache(store, hashed) == 1
+    assert np.allclose(store.get("hashed:2", ["An essay"])[0], [0.6, 0.8])
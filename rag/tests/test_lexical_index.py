@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Tests for the BM25 inverted index used by lexical and hybrid search."""
+
+import sys
+
+sys.path.insert(0, ".")
+
+import pytest
+
+from lexical_index import LexicalIndex, tokenize, write_lexical_index
+
+TEXTS = [
+    "CS 124 is the introductory programming course at Illinois.",
+    "The course uses Kotlin and Java for programming assignments.",
+    "Students take weekly quizzes in the computer-based testing facility.",
+    "CS124 staff hold office hours every day of the week.",
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "lexical.bin"
+    write_lexical_index(path, TEXTS)
+    return LexicalIndex(path)
+
+
+def test_tokenize_splits_letters_and_digits():
+    assert tokenize("CS124 and CS 124!") == ["cs", "124", "and", "cs", "124"]
+    assert tokenize("computer-based") == ["computer", "based"]
+
+
+def test_search_ranks_rare_terms_first(index):
+    assert len(index) == len(TEXTS)
+
+    results = index.search("Kotlin", k=10)
+    assert [idx for _, idx in results] == [1]
+
+    # Both spellings of the course number match, and scores are best first
+    results = index.search("CS 124", k=10)
+    assert sorted(idx for _, idx in results) == [0, 3]
+    assert results[0][0] >= results[1][0] > 0
+
+
+def test_search_handles_misses_and_k(index):
+    assert index.search("haskell", k=10) == []
+    assert index.search("", k=10) == []
+    assert len(index.search("the course programming", k=1)) == 1
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_lexical.bin"
+    path.write_bytes(b"RAGDOCS1" + bytes(16))
+    with pytest.raises(ValueError):
+        LexicalIndex(path)
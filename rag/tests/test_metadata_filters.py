@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Tests for metadata filter indexes and published-date parsing."""
+
+import sys
+
+sys.path.insert(0, ".")
+
+from datetime import UTC, datetime
+
+import numpy as np
+import pytest
+
+from metadata_filters import (
+    MetadataFilterIndex,
+    parse_published,
+    read_filter_columns,
+    write_filter_columns,
+)
+
+METADATA = [
+    {"citation_url": "/essays/2024-testing", "section_level": 2, "published": "2024-03-01"},
+    {"citation_url": "/essays/2024-testing", "section_level": 3, "published": "2024-03-01"},
+    {"citation_url": "/essays/2020-lectures", "section_level": 2, "published": "2020-09-15"},
+    {"citation_url": "/teaching", "section_level": "none"},
+    {"citation_url": "/essaysmith", "section_level": 1},
+]
+
+
+def test_parse_published():
+    expected = datetime(2024, 1, 15, 6, tzinfo=UTC).timestamp()
+    assert parse_published("Mon Jan 15 2024 00:00:00 GMT-0600 (Central Standard Time)") == expected
+    assert parse_published("2024-01-15T06:00:00Z") == expected
+    assert parse_published("2024-01-15") == datetime(2024, 1, 15, tzinfo=UTC).timestamp()
+    assert parse_published("last spring") is None
+    assert parse_published("") is None
+
+
+def test_select_by_field():
+    index = MetadataFilterIndex(METADATA)
+
+    assert index.select(None) is None
+    assert index.select({"section_level": None}) is None
+    assert index.select({"citation_url_prefix": "/essays/"}).ids.tolist() == [0, 1, 2]
+    assert index.select({"section_level": 2}).ids.tolist() == [0, 2]
+    assert index.select({"section_level": [1, "none"]}).ids.tolist() == [3, 4]
+    assert index.select({"published_after": "2021-01-01"}).ids.tolist() == [0, 1]
+    assert index.select({"published_before": "2024-03-01"}).ids.tolist() == [2]
+
+    combined = index.select({"citation_url_prefix": "/essays/", "section_level": 3})
+    assert combined.ids.tolist() == [1]
+    assert combined.mask.tolist() == [False, True, False, False, False]
+    assert index.select({"citation_url_prefix": "/talks/"}).count == 0
+
+
+def test_selector_matches_mask():
+    index = MetadataFilterIndex(METADATA)
+    selection = index.select({"citation_url_prefix": "/essays/"})
+    assert [selection.selector.is_member(i) for i in range(len(METADATA))] == selection.mask.tolist()
+
+
+def test_selections_are_cached():
+    index = MetadataFilterIndex(METADATA, cache_size=1)
+    first = index.select({"section_level": [2, 3]})
+    assert index.select({"section_level": [3, 2]}) is first
+    index.select({"section_level": 1})
+    assert index.select({"section_level": [2, 3]}) is not first
+
+
+def test_rejects_bad_filters():
+    index = MetadataFilterIndex(METADATA)
+    with pytest.raises(ValueError):
+        index.select({"author": "me"})
+    with pytest.raises(ValueError):
+        index.select({"published_after": "last spring"})
+    assert np.array_equal(index.select({"section_level": 7}).ids, [])
+
+
+def test_stale_chunks_are_never_selected():
+    metadata = [dict(meta) for meta in METADATA]
+    metadata[0]["stale"] = True
+    metadata[3]["stale"] = True
+    index = MetadataFilterIndex(metadata)
+
+    assert index.stale_count == 2
+    assert index.select(None).ids.tolist() == [1, 2, 4]
+    assert index.select({"citation_url_prefix": "/essays/"}).ids.tolist() == [1, 2]
+
+
+def test_columns_round_trip(tmp_path):
+    metadata = [dict(meta) for meta in METADATA]
+    metadata[1]["stale"] = True
+    path = tmp_path / "filters.bin"
+    write_filter_columns(path, metadata)
+
+    mapped = MetadataFilterIndex(read_filter_columns(path))
+    index = MetadataFilterIndex(metadata)
+    assert mapped.stale_count == 1
+    for filters in [
+        None,
+        {"citation_url_prefix": "/essays/"},
+        {"section_level": [2, "none"]},
+        {"published_after": "2021-01-01"},
+        {"published_before": "2024-03-01", "section_level": 2},
+    ]:
+        assert mapped.select(filters).ids.tolist() == index.select(filters).ids.tolist()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "filters.bin"
+    path.write_bytes(b"not a filter column file")
+    with pytest.raises(ValueError):
+        read_filter_columns(path)
@@ -6,20 +6,31 @@ Tests for the RAG server endpoints.
 Tests both semantic search and conversational RAG functionality.
 """
 
+import asyncio
+import json
 import os
 import shutil
 import sys
 import tempfile
+import time
 from pathlib import Path
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
 
 # Add the parent directory to the path so we can import the modules
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+from embedding_providers import hashed_embedding_provider
 from rag_server import app
+from test_vector_db_loader import TEXTS, FakeEmbeddings, build_db
 from vector_db_builder import ProductionVectorDB
+from vector_db_loader import ProductionVectorLoader
 
 
 class TestRAGServer:
@@ -305,6 +316,359 @@ class TestRAGServer:
             assert response.status_code == 500  # Service not initialized
 
 
+class StubVectorLoader:
+    """Vector loader stand-in that returns a fixed document without any API calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def asearch(
+        self,
+        query,
+        k=10,
+        use_adaptive_threshold=True,
+        min_threshold=0.3,
+        mode="vector",
+        filters=None,
+        mmr_lambda=None,
+        merge_adjacent=False,
+    ):
+        self.calls.append({"query": query, "k": k, "mode": mode, "filters": filters})
+        return [
+            {
+                "score": 0.9,
+                "content": "Geoffrey Challen teaches CS 124 at the University of Illinois.",
+                "metadata": {},
+                "citation_url": "/bio",
+                "page_title": "Bio",
+                "citation": "Bio (/bio)",
+            }
+        ]
+
+
+class SlowChatModel(BaseChatModel):
+    """Chat model that takes a fixed amount of time to answer."""
+
+    delay: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="I teach CS 124."))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="I teach CS 124."))])
+
+
+@pytest.fixture
+def stub_services(monkeypatch):
+    """Point the server at stub services so endpoint tests run offline."""
+    import rag_server
+
+    monkeypatch.setattr(rag_server, "vector_loader", StubVectorLoader())
+    monkeypatch.setattr(rag_server, "chat_model", SlowChatModel())
+    monkeypatch.setattr(rag_server.limiter, "enabled", False)
+    yield rag_server
+
+
+class TestConcurrentChat:
+    """Chat requests in one worker overlap instead of running one after another."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_chats_overlap(self, stub_services):
+        concurrency = 5
+        delay = stub_services.chat_model.delay
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(
+                *(
+                    client.post(
+                        "/chat", json={"message": "What do you teach?", "session_id": f"concurrent_{i}"}
+                    )
+                    for i in range(concurrency)
+                )
+            )
+            elapsed = time.perf_counter() - start
+
+        assert all(response.status_code == 200 for response in responses)
+        assert all(response.json()["response"] == "I teach CS 124." for response in responses)
+
+        # Serialized calls would take concurrency * delay
+        assert elapsed < delay * 2
+
+
+class TestChatStream:
+    """Server-sent-events streaming for /chat/stream."""
+
+    @staticmethod
+    def parse_events(body: str) -> list[tuple[str, dict]]:
+        events = []
+        for block in body.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines())
+            events.append((lines["event"], json.loads(lines["data"])))
+        return events
+
+    def test_stream_sends_sources_then_tokens(self, stub_services, monkeypatch):
+        monkeypatch.setattr(
+            stub_services, "chat_model", FakeListChatModel(responses=["I teach CS 124."])
+        )
+        session_id = "stream_session_1"
+
+        # No context manager: the startup event would try to connect to Azure
+        response = TestClient(app).post(
+            "/chat/stream", json={"message": "What do you teach?", "session_id": session_id}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = self.parse_events(response.text)
+        names = [name for name, _ in events]
+        assert names[0] == "sources"
+        assert names[-1] == "done"
+        assert set(names[1:-1]) == {"token"}
+        assert events[0][1]["sources"][0]["url"] == "/bio"
+        assert "".join(data["content"] for name, data in events if name == "token") == (
+            "I teach CS 124."
+        )
+
+        # History is committed once the stream completes
+        history = stub_services.conversation_histories[session_id]
+        assert [message.content for message in history] == [
+            "What do you teach?",
+            "I teach CS 124.",
+        ]
+
+    def test_stream_error_skips_history(self, stub_services, monkeypatch):
+        monkeypatch.setattr(
+            stub_services,
+            "chat_model",
+            FakeListChatModel(responses=["I teach CS 124."], error_on_chunk_number=3),
+        )
+        session_id = "stream_session_2"
+
+        # No context manager: the startup event would try to connect to Azure
+        response = TestClient(app).post(
+            "/chat/stream", json={"message": "What do you teach?", "session_id": session_id}
+        )
+
+        events = self.parse_events(response.text)
+        assert events[-1][0] == "error"
+        assert stub_services.conversation_histories.get(session_id, []) == []
+
+
+class TestSearchFilters:
+    """Metadata filters on /search are validated and passed through to the loader."""
+
+    def test_filters_forwarded(self, stub_services):
+        response = TestClient(app).post(
+            "/search",
+            json={
+                "query": "testing",
+                "filters": {"citation_url_prefix": "/essays/", "published_after": "2024-01-01"},
+            },
+        )
+        assert response.status_code == 200
+        assert stub_services.vector_loader.calls[-1]["filters"] == {
+            "citation_url_prefix": "/essays/",
+            "published_after": "2024-01-01",
+        }
+
+        response = TestClient(app).post("/search", json={"query": "testing"})
+        assert response.status_code == 200
+        assert stub_services.vector_loader.calls[-1]["filters"] is None
+
+    def test_invalid_date_rejected(self, stub_services):
+        response = TestClient(app).post(
+            "/search", json={"query": "testing", "filters": {"published_after": "last spring"}}
+        )
+        assert response.status_code == 422
+        assert stub_services.vector_loader.calls == []
+
+    def test_section_level_numbers_are_heading_tags(self, stub_services):
+        for level, expected in ((2, "h2"), ([2, "h3", "none"], ["h2", "h3", "none"])):
+            response = TestClient(app).post(
+                "/search", json={"query": "teaching", "filters": {"section_level": level}}
+            )
+            assert response.status_code == 200
+            assert stub_services.vector_loader.calls[-1]["filters"] == {"section_level": expected}
+
+        response = TestClient(app).post(
+            "/search", json={"query": "teaching", "filters": {"section_level": 7}}
+        )
+        assert response.status_code == 422
+
+
+class GatedEmbeddings(FakeEmbeddings):
+    """Fake embeddings whose async queries wait until the test opens the gate."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = asyncio.Event()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await self.gate.wait()
+        return self.embed_query(text)
+
+
+class TestHotReload:
+    """New vector database builds are swapped in without a restart."""
+
+    NEW_TEXTS = [
+        "Office hours moved to the new building this semester.",
+        "The course forum is the fastest way to reach the staff.",
+        "Machine projects are graded automatically on every submission.",
+        "Students can retake quizzes during the following week.",
+    ]
+
+    @pytest.fixture
+    def served_db(self, tmp_path, monkeypatch):
+        """Serve a fake-embeddings database from tmp_path through the real loader."""
+        import rag_server
+
+        path = build_db(tmp_path)
+        monkeypatch.setenv("VECTOR_DB_PATH", str(path))
+
+        def create_vector_loader():
+            loader = ProductionVectorLoader(str(path), embedding_provider=hashed_embedding_provider())
+            loader.embeddings_model = FakeEmbeddings()
+            return loader
+
+        monkeypatch.setattr(rag_server, "create_vector_loader", create_vector_loader)
+        monkeypatch.setattr(rag_server, "vector_loader", create_vector_loader())
+        monkeypatch.setattr(rag_server.limiter, "enabled", False)
+        yield rag_server
+
+    @pytest.mark.asyncio
+    async def test_reload_swaps_after_in_flight_search(self, served_db, tmp_path):
+        old_loader = served_db.vector_loader
+        old_loader.embeddings_model = GatedEmbeddings()
+        assert await served_db.reload_vector_database() is False
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            in_flight = asyncio.create_task(
+                client.post("/search", json={"query": TEXTS[0], "k": 1})
+            )
+            while not old_loader._active_searches:
+                await asyncio.sleep(0.01)
+
+            build_db(tmp_path, texts=self.NEW_TEXTS)
+            assert await served_db.reload_vector_database() is True
+            assert served_db.vector_loader is not old_loader
+            assert not old_loader.closed
+
+            # The search that started before the swap finishes on the old build
+            old_loader.embeddings_model.gate.set()
+            response = await in_flight
+            assert response.json()["results"][0]["content"] == TEXTS[0]
+            assert old_loader.closed
+
+            response = await client.post("/search", json={"query": self.NEW_TEXTS[0], "k": 1})
+            assert response.json()["results"][0]["content"] == self.NEW_TEXTS[0]
+
+        assert await served_db.reload_vector_database() is False
+
+    def test_admin_reload(self, served_db, monkeypatch):
+        client = TestClient(app)
+        assert client.post("/admin/reload").status_code == 404
+
+        monkeypatch.setattr(served_db, "ADMIN_TOKEN", "secret")
+        response = client.post("/admin/reload", headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 403
+
+        old_loader = served_db.vector_loader
+        response = client.post("/admin/reload?force=true", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.json()["reloaded"] is True
+        assert response.json()["build_timestamp"] == old_loader.build_version
+        assert served_db.vector_loader is not old_loader and old_loader.closed
+
+    @pytest.mark.asyncio
+    async def test_reload_waits_for_background_initialization(self, served_db, monkeypatch):
+        create_vector_loader = served_db.create_vector_loader
+        initialized = []
+
+        def initialize_services():
+            time.sleep(0.2)
+            served_db.vector_loader = create_vector_loader()
+            initialized.append(served_db.vector_loader)
+
+        monkeypatch.setattr(served_db, "vector_loader", None)
+        monkeypatch.setattr(
+            served_db, "services_task", asyncio.create_task(asyncio.to_thread(initialize_services))
+        )
+        assert await served_db.reload_vector_database(force=True) is True
+
+        # The loader from startup was replaced and closed, not left behind
+        assert served_db.vector_loader is not initialized[0]
+        assert initialized[0].closed
+
+    @pytest.mark.asyncio
+    async def test_reload_closes_discarded_query_cache(self, served_db, tmp_path, monkeypatch):
+        caches = []
+
+        def create_vector_loader():
+            loader = ProductionVectorLoader(
+                os.environ["VECTOR_DB_PATH"],
+                query_cache_path=str(tmp_path / "queries.sqlite"),
+                embedding_provider=hashed_embedding_provider(),
+            )
+            loader.embeddings_model = FakeEmbeddings()
+            caches.append(loader.query_cache)
+            return loader
+
+        monkeypatch.setattr(served_db, "create_vector_loader", create_vector_loader)
+        monkeypatch.setattr(served_db, "vector_loader", create_vector_loader())
+        assert await served_db.reload_vector_database(force=True) is True
+
+        # The warm cache moves to the new loader; the one the new loader opened is closed
+        warm, discarded = caches
+        assert served_db.vector_loader.query_cache is warm and warm._db is not None
+        assert discarded._db is None
+
+
+class TestLazyStartup:
+    """With LAZY_STARTUP, services load in the background and requests wait for them."""
+
+    @pytest.mark.asyncio
+    async def test_requests_wait_for_background_initialization(self, monkeypatch):
+        import rag_server
+
+        def initialize_services():
+            time.sleep(0.3)
+            rag_server.vector_loader = StubVectorLoader()
+
+        monkeypatch.setattr(rag_server, "LAZY_STARTUP", True)
+        monkeypatch.setattr(rag_server, "VECTOR_DB_RELOAD_SECONDS", 0)
+        monkeypatch.setattr(rag_server, "initialize_services", initialize_services)
+        monkeypatch.setattr(rag_server, "start_cleanup_task", lambda: None)
+        monkeypatch.setattr(rag_server, "vector_loader", None)
+        monkeypatch.setattr(rag_server, "services_task", None)
+        monkeypatch.setattr(rag_server, "WEBSITE_TOPICS", [])
+        monkeypatch.setattr(rag_server.limiter, "enabled", False)
+
+        start = time.perf_counter()
+        await rag_server.startup_event()
+        assert time.perf_counter() - start < 0.2
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/")).status_code == 200
+            assert rag_server.vector_loader is None
+
+            response = await client.post("/search", json={"query": "CS 124"})
+
+        assert response.status_code == 200
+        assert response.json()["results"][0]["citation_url"] == "/bio"
+
+
 # Test running
 if __name__ == "__main__":
     # Install dependencies if running directly
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic result cache and its use in the vector database loader.
+"""
+
+import sys
+
+sys.path.insert(0, ".")
+
+import numpy as np
+import pytest
+
+from embedding_providers import hashed_embedding_provider
+from result_cache import SemanticResultCache, search_key
+from test_vector_db_loader import TEXTS, FakeEmbeddings, build_db
+from vector_db_loader import ProductionVectorLoader
+
+KEY = search_key(k=5, mode="vector")
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_near_duplicate_vectors_share_results():
+    rng = np.random.default_rng(0)
+    base = unit(rng.normal(size=64))
+    cache = SemanticResultCache(max_entries=4, max_distance=0.05)
+    cache.put(base, KEY, "v1", [{"content": "cached"}])
+
+    close = unit(base + 0.02 * rng.normal(size=64))
+    far = unit(rng.normal(size=64))
+    assert cache.get(close, KEY, "v1") == [{"content": "cached"}]
+    assert cache.get(far, KEY, "v1") is None
+    # Different search options never share results
+    assert cache.get(base, search_key(k=10, mode="vector"), "v1") is None
+    assert cache.get_stats()["result_cache_hits"] == 1
+
+
+def test_returned_results_are_copies():
+    cache = SemanticResultCache()
+    cache.put([1.0, 0.0], KEY, "v1", [{"content": "cached"}])
+    cache.get([1.0, 0.0], KEY, "v1")[0]["content"] = "changed"
+    assert cache.get([1.0, 0.0], KEY, "v1") == [{"content": "cached"}]
+
+
+def test_new_build_invalidates_entries():
+    cache = SemanticResultCache()
+    cache.put([1.0, 0.0], KEY, "v1", [{"content": "old build"}])
+    assert cache.get([1.0, 0.0], KEY, "v2") is None
+    assert cache.get([1.0, 0.0], KEY, "v1") is None
+    assert cache.get_stats()["result_cache_entries"] == 0
+
+
+def test_oldest_entry_is_replaced():
+    cache = SemanticResultCache(max_entries=2)
+    for i, vector in enumerate(np.eye(3)):
+        cache.put(vector, KEY, "v1", [{"content": str(i)}])
+    assert cache.get(np.eye(3)[0], KEY, "v1") is None
+    assert cache.get(np.eye(3)[2], KEY, "v1") == [{"content": "2"}]
+
+
+class NearDuplicateEmbeddings(FakeEmbeddings):
+    """Queries that differ only in case and punctuation embed to nearly the same vector."""
+
+    def _embed(self, text: str) -> list[float]:
+        base = np.array(super()._embed(text.lower().strip("?!. ")))
+        noise = np.random.default_rng(len(text)).normal(scale=0.01, size=len(base))
+        return (base + noise).tolist()
+
+
+def test_loader_skips_scan_for_near_duplicate_query(tmp_path, monkeypatch):
+    loader = ProductionVectorLoader(
+        str(build_db(tmp_path)), result_cache_size=16, embedding_provider=hashed_embedding_provider()
+    )
+    loader.embeddings_model = NearDuplicateEmbeddings()
+
+    scans = []
+    rank_rows = loader._rank_rows
+
+    def counting_rank_rows(queries, *args, **kwargs):
+        scans.append(list(queries))
+        return rank_rows(queries, *args, **kwargs)
+
+    monkeypatch.setattr(loader, "_rank_rows", counting_rank_rows)
+
+    first = loader.search("Kotlin and Java", k=2, use_adaptive_threshold=False)
+    second = loader.search("kotlin and java?", k=2, use_adaptive_threshold=False)
+    assert second == first
+    assert len(scans) == 1
+
+    # Batches only scan the queries that missed
+    batch = loader.search_batch(
+        ["KOTLIN AND JAVA", TEXTS[0]], k=2, use_adaptive_threshold=False
+    )
+    assert batch[0] == first
+    assert scans[-1] == [TEXTS[0]]
+
+    # Lexical searches are never served from the cache
+    loader.search("Kotlin and Java", k=2, mode="lexical")
+    assert len(scans) == 3
+
+    stats = loader.get_stats()
+    assert stats["result_cache_hits"] == 2
+    assert stats["result_cache_entries"] == 2
+
+
+class SameVectorEmbeddings(FakeEmbeddings):
+    """Embeds every query to the same vector, like near-duplicates such as "CS 124" and "CS 125"."""
+
+    def _embed(self, text: str) -> list[float]:
+        return super()._embed(TEXTS[0])
+
+
+def test_hybrid_results_keyed_by_query_terms(tmp_path):
+    db_path = str(build_db(tmp_path))
+    loader = ProductionVectorLoader(
+        db_path, result_cache_size=16, embedding_provider=hashed_embedding_provider()
+    )
+    loader.embeddings_model = SameVectorEmbeddings()
+    uncached = ProductionVectorLoader(db_path, embedding_provider=hashed_embedding_provider())
+    uncached.embeddings_model = SameVectorEmbeddings()
+
+    options = {"k": 3, "mode": "hybrid", "use_adaptive_threshold": False}
+    loader.search(TEXTS[1], **options)
+    results = loader.search(TEXTS[2], **options)
+    assert results == uncached.search(TEXTS[2], **options)
+    assert loader.result_cache.hits == 0
+
+    # The same terms, differently cased and punctuated, still hit
+    loader.search(TEXTS[2].upper() + "?", **options)
+    assert loader.result_cache.hits == 1
+
+
+def test_loader_result_cache_follows_build(tmp_path):
+    loader = ProductionVectorLoader(
+        str(build_db(tmp_path)), result_cache_size=16, embedding_provider=hashed_embedding_provider()
+    )
+    loader.embeddings_model = FakeEmbeddings()
+    loader.search(TEXTS[1], k=1, use_adaptive_threshold=False)
+
+    loader.build_info = {**loader.build_info, "build_timestamp": "rebuilt"}
+    loader.search(TEXTS[1], k=1, use_adaptive_threshold=False)
+    assert loader.get_stats()["result_cache_hits"] == 0
+
+
+@pytest.mark.asyncio
+async def test_async_search_uses_result_cache(tmp_path):
+    loader = ProductionVectorLoader(
+        str(build_db(tmp_path)), result_cache_size=16, embedding_provider=hashed_embedding_provider()
+    )
+    loader.embeddings_model = NearDuplicateEmbeddings()
+
+    first = await loader.asearch("Kotlin and Java", k=2, use_adaptive_threshold=False)
+    second = await loader.asearch("Kotlin and Java!", k=2, use_adaptive_threshold=False)
+    assert second == first
+    assert loader.result_cache.hits == 1
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the RAG server.
+
+Imports rag_server in a fresh interpreter with `python -X importtime` and checks that the
+OpenAI SDK and LangChain chain modules stay off the import path and that the import fits
+a time budget. Run directly to print the slowest imports:
+
+    python tests/test_startup.py [module]
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+RAG_DIR = Path(__file__).parent.parent
+
+# Modules that must only be imported when a client or chain is built
+DEFERRED_MODULES = (
+    "openai",
+    "langchain_openai",
+    "langchain_core.prompts",
+    "langchain_core.output_parsers",
+    "langchain_core.runnables",
+)
+
+# Generous so slow machines pass; importing the OpenAI SDK eagerly costs more than this
+IMPORT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", "2.0"))
+
+
+def import_profile(module: str = "rag_server") -> dict[str, tuple[int, int]]:
+    """Import a module in a fresh interpreter and return {name: (self_us, cumulative_us)}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=RAG_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # Header row
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def test_heavy_modules_are_deferred():
+    """Importing the server doesn't pull in the OpenAI SDK or LangChain chain modules."""
+    imported = set(import_profile())
+    assert "rag_server" in imported
+    assert not imported & set(DEFERRED_MODULES)
+
+
+def test_import_time_budget():
+    """Importing the server stays within the startup budget."""
+    _, cumulative_us = import_profile()["rag_server"]
+    assert cumulative_us / 1e6 < IMPORT_BUDGET_SECONDS
+
+
+if __name__ == "__main__":
+    module = sys.argv[1] if len(sys.argv) > 1 else "rag_server"
+    profile = import_profile(module)
+    print(f"import {module}: {profile[module][1] / 1e6:.3f}s cumulative")
+    print(f"{'self ms':>9} {'cum ms':>9}  module")
+    for name, (self_us, cumulative_us) in sorted(
+        profile.items(), key=lambda item: item[1][0], reverse=True
+    )[:25]:
+        print(f"{self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}  {name}")
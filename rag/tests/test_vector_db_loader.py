@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+Tests for the production vector database loader.
+Builds a tiny database with fake embeddings so no Azure credentials are needed.
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import metadata_filters
+from ann_index import unwrap_index
+from embedding_providers import hashed_embedding_provider
+from vector_db_builder import HierarchicalHTMLSplitter, ProductionVectorDB
+from vector_db_loader import SAVE_MARKER, ProductionVectorLoader, read_build_version
+
+DIMENSION = 32
+
+TEXTS = [
+    "CS 124 is the introductory programming course at the University of Illinois.",
+    "Teaching large courses requires a strong course staff and good tooling.",
+    "Computerized testing lets students take frequent quizzes in a proctored lab.",
+    "Kotlin and Java are both supported in the introductory course.",
+]
+
+
+class FakeEmbeddings:
+    """Deterministic embeddings derived from a hash of the text."""
+
+    def __init__(self):
+        self.query_calls = 0
+        self.document_calls = 0
+
+    def _embed(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(DIMENSION).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.document_calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.query_calls += 1
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self.embed_query(text)
+
+
+class SlowFakeEmbeddings(FakeEmbeddings):
+    """Fake embeddings whose async API simulates a slow network round trip."""
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(0.2)
+        return self.embed_query(text)
+
+
+def build_db(tmp_path, texts=TEXTS, name="vector_db", **builder_kwargs):
+    """Build a small vector database on disk and return its path."""
+    html_path = tmp_path / "page.html"
+    html_path.write_text(
+        '<html><head><meta name="title" content="Test Page"><meta name="url" content="essays/test">'
+        "</head><body></body></html>"
+    )
+
+    builder = ProductionVectorDB(FakeEmbeddings(), **builder_kwargs)
+    docs = [
+        (Document(page_content=text, metadata={"source": str(html_path)}), {"source_file": str(html_path)})
+        for text in texts
+    ]
+    builder.add_documents_incremental(docs)
+    builder.build_embeddings_incremental()
+    builder.rebuild_faiss_index()
+    builder.save_to_disk(str(tmp_path / name))
+    return tmp_path / name
+
+
+@pytest.fixture
+def vector_db_path(tmp_path):
+    return build_db(tmp_path)
+
+
+def load(path, **kwargs) -> ProductionVectorLoader:
+    # The offline provider needs no credentials; its client is replaced with FakeEmbeddings
+    loader = ProductionVectorLoader(str(path), embedding_provider=hashed_embedding_provider(), **kwargs)
+    loader.embeddings_model = FakeEmbeddings()
+    return loader
+
+
+def test_mmap_matches_private_load(vector_db_path):
+    """Memory-mapped and private loads return identical search results."""
+    private = load(vector_db_path)
+    mapped = load(vector_db_path, use_mmap=True, prefault=True)
+
+    for text in TEXTS:
+        expected = private.search(text, k=2, use_adaptive_threshold=False)
+        actual = mapped.search(text, k=2, use_adaptive_threshold=False)
+        assert [r["content"] for r in actual] == [r["content"] for r in expected]
+        assert actual[0]["content"] == text
+
+
+def test_mmap_stats(vector_db_path):
+    """get_stats reports mapped vs private bytes."""
+    # vectors.npy is memory-mapped either way
+    store_size = (
+        os.path.getsize(vector_db_path / "documents.bin")
+        + os.path.getsize(vector_db_path / "lexical.bin")
+        + os.path.getsize(vector_db_path / "filters.bin")
+        + os.path.getsize(vector_db_path / "vectors.npy")
+    )
+
+    private = load(vector_db_path).get_stats()
+    assert private["mmap_enabled"] is False
+    assert private["mapped_bytes"] == store_size
+    assert private["private_bytes"] == os.path.getsize(vector_db_path / "vector.index")
+
+    mapped_loader = load(vector_db_path, use_mmap=True)
+    mapped = mapped_loader.get_stats()
+    assert mapped["mmap_enabled"] is True
+    assert mapped["private_bytes"] == 0
+    assert mapped["mapped_bytes"] == store_size + os.path.getsize(vector_db_path / "vector.index")
+    assert isinstance(mapped_loader.vectors, np.memmap)
+    assert mapped_loader.vectors.shape == (len(TEXTS), DIMENSION)
+
+
+def test_document_store_is_lazy(vector_db_path):
+    """Chunks are served from the binary store and match what the builder wrote."""
+    loader = load(vector_db_path)
+    assert not (vector_db_path / "documents.pkl").exists()
+    assert not (vector_db_path / "metadata.json").exists()
+    assert loader.document_store is not None
+    assert len(loader.documents) == len(TEXTS)
+    assert list(loader.documents) == TEXTS
+    assert loader.metadata[0]["citation_url"] == "/essays/test"
+    assert loader.metadata[-1]["chunk_id"] == len(TEXTS) - 1
+
+
+def test_builder_reloads_document_store(vector_db_path):
+    """Incremental builds read the binary store back and skip unchanged chunks."""
+    builder = ProductionVectorDB(FakeEmbeddings())
+    assert builder.load_existing_database(str(vector_db_path))
+    assert builder.documents == TEXTS
+
+    docs = [(Document(page_content=text, metadata={}), {}) for text in TEXTS]
+    added, skipped = builder.add_documents_incremental(docs)
+    assert (added, skipped) == (0, len(TEXTS))
+
+
+def test_each_page_parsed_once_per_build(tmp_path, monkeypatch):
+    """Chunks of one page share a single metadata parse, or none after the splitter's parse."""
+    import vector_db_builder
+
+    html_path = tmp_path / "essay.html"
+    paragraphs = "".join(f"<p>{text} Paragraph {i} of the essay.</p>" for i, text in enumerate(TEXTS * 5))
+    html_path.write_text(
+        '<html><head><title>Essay</title><meta name="url" content="essays/essay">'
+        '<meta name="published" content="2024-01-15"></head>'
+        f"<body><h2>Heading</h2>{paragraphs}</body></html>"
+    )
+
+    parses = []
+    extract = vector_db_builder.extract_page_metadata
+    monkeypatch.setattr(
+        vector_db_builder, "extract_page_metadata", lambda path: parses.append(path) or extract(path)
+    )
+
+    splitter = HierarchicalHTMLSplitter(min_paragraph_length=10, max_paragraphs_per_chunk=2)
+    chunks = splitter.split_html_file(str(html_path))
+    docs = [(chunk, {"source_file": str(html_path)}) for chunk in chunks]
+    assert len(docs) > 5
+
+    builder = ProductionVectorDB(FakeEmbeddings())
+    builder.add_documents_incremental(docs)
+    assert parses == [str(html_path)]
+
+    reused = ProductionVectorDB(FakeEmbeddings())
+    reused.page_metadata.update(splitter.page_metadata)
+    reused.add_documents_incremental(docs)
+    assert parses == [str(html_path)]
+    assert reused.metadata == builder.metadata
+    assert builder.metadata[0]["citation_url"] == "/essays/essay"
+    assert builder.metadata[0]["page_title"] == "Essay"
+    assert builder.metadata[0]["published"] == "2024-01-15"
+
+
+def test_parallel_split_matches_serial_order(tmp_path):
+    """Worker processes return the same chunks in path order, with each file's log."""
+    from vector_db_builder import benchmark_parsing, split_html_files
+
+    html_files = []
+    for i in range(6):
+        html_path = tmp_path / f"page{i}.html"
+        paragraphs = "".join(f"<p>Page {i}: {text}</p>" for text in TEXTS)
+        html_path.write_text(f'<html><head><meta name="url" content="p{i}"></head><body>{paragraphs}</body></html>')
+        html_files.append(html_path)
+    html_files.append(tmp_path / "missing.html")
+
+    splitter = HierarchicalHTMLSplitter(min_paragraph_length=10, max_paragraphs_per_chunk=2)
+    serial = list(split_html_files(html_files, splitter, jobs=1))
+    parallel = list(split_html_files(html_files, splitter, jobs=3))
+
+    assert [row[0] for row in parallel] == html_files
+    for (_, serial_chunks, serial_meta, serial_log, _), (_, chunks, meta, log, _) in zip(serial, parallel):
+        assert [c.page_content for c in chunks] == [c.page_content for c in serial_chunks]
+        assert [c.metadata for c in chunks] == [c.metadata for c in serial_chunks]
+        assert meta == serial_meta
+        assert log == serial_log
+    assert parallel[0][2] == {"url": "p0"}
+    assert "Total chunks created" in parallel[0][3]
+    assert parallel[-1][4] is not None and serial[-1][4] is not None
+
+    report = benchmark_parsing(html_files[:-1], splitter, jobs_counts=(1, 2))
+    assert [row["jobs"] for row in report["results"]] == [1, 2]
+    assert all(row["chunks"] == sum(len(r[1]) for r in serial) for row in report["results"])
+
+
+def test_query_embedding_cache(vector_db_path, tmp_path):
+    """Repeated queries skip the embedding call, including across loaders sharing a SQLite file."""
+    cache_path = str(tmp_path / "query_cache.sqlite")
+    loader = load(vector_db_path, query_cache_path=cache_path)
+
+    first = loader.search(TEXTS[0], k=2)
+    second = loader.search(f"  {TEXTS[0]}  ", k=2)
+    assert first == second
+    assert loader.embeddings_model.query_calls == 1
+
+    stats = loader.get_stats()
+    assert stats["query_cache_hits"] == 1
+    assert stats["query_cache_misses"] == 1
+
+    # A second worker finds the embedding in the shared persistent tier
+    other = load(vector_db_path, query_cache_path=cache_path)
+    other.search(TEXTS[0], k=2)
+    assert other.embeddings_model.query_calls == 0
+    assert other.get_stats()["query_cache_persistent_hits"] == 1
+
+
+def test_query_embedding_cache_eviction_and_ttl(vector_db_path):
+    """The in-memory tier is bounded and honours the TTL."""
+    loader = load(vector_db_path, query_cache_size=2)
+    for text in TEXTS[:3]:
+        loader.embed_query(text)
+    assert loader.get_stats()["query_cache_entries"] == 2
+
+    loader.embed_query(TEXTS[0])  # evicted as least recently used
+    assert loader.embeddings_model.query_calls == 4
+
+    expired = load(vector_db_path, query_cache_ttl=0)
+    expired.embed_query(TEXTS[0])
+    expired.embed_query(TEXTS[0])
+    assert expired.embeddings_model.query_calls == 2
+
+
+def test_search_batch_matches_search(vector_db_path):
+    """Batch search embeds uncached queries in one call and matches per-query search."""
+    loader = load(vector_db_path)
+    loader.embed_query(TEXTS[1])  # cached queries are not re-embedded
+
+    queries = [TEXTS[0], TEXTS[1], TEXTS[2], TEXTS[0]]
+    batch = loader.search_batch(queries, k=3)
+    assert loader.embeddings_model.document_calls == 1
+    assert loader.embeddings_model.query_calls == 1
+
+    assert len(batch) == len(queries)
+    for query, results in zip(queries, batch, strict=True):
+        assert results == loader.search(query, k=3)
+    assert loader.search_batch([], k=3) == []
+
+
+@pytest.mark.asyncio
+async def test_asearch_matches_search(vector_db_path):
+    """The async path returns the same results as the blocking one."""
+    loader = load(vector_db_path, query_cache_size=0)
+    for text in TEXTS:
+        assert await loader.asearch(text, k=3) == loader.search(text, k=3)
+    assert await loader.asearch_batch(TEXTS, k=3) == loader.search_batch(TEXTS, k=3)
+
+
+@pytest.mark.asyncio
+async def test_asearch_does_not_block_event_loop(vector_db_path):
+    """Concurrent searches overlap their embedding round trips."""
+    loader = load(vector_db_path, query_cache_size=0)
+    loader.embeddings_model = SlowFakeEmbeddings()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(loader.asearch(text, k=2) for text in TEXTS))
+    elapsed = time.perf_counter() - start
+
+    assert [r[0]["content"] for r in results] == TEXTS
+    assert elapsed < 0.2 * len(TEXTS) / 2
+
+
+
+@pytest.mark.asyncio
+async def test_retired_loader_drains_before_closing(tmp_path):
+    """A retired loader finishes in-flight searches on its own files, then closes."""
+    path = build_db(tmp_path)
+    loader = load(path, query_cache_size=0)
+    loader.embeddings_model = SlowFakeEmbeddings()
+
+    search = asyncio.create_task(loader.asearch(TEXTS[0], k=1))
+    await asyncio.sleep(0.05)
+
+    # A new build replaces the files while the search is still embedding its query
+    build_db(tmp_path, texts=["A completely different corpus."] * 4)
+    loader.retire()
+    assert not loader.closed
+
+    results = await search
+    assert results[0]["content"] == TEXTS[0]
+    assert loader.closed and loader.index is None
+    with pytest.raises(RuntimeError):
+        loader.search(TEXTS[0])
+
+    # An idle loader closes as soon as it is retired
+    idle = load(path)
+    idle.retire()
+    assert idle.closed
+
+
+def test_build_version_ignores_partial_saves(vector_db_path):
+    """read_build_version() hides builds that are still being saved."""
+    loader = load(vector_db_path)
+    assert read_build_version(vector_db_path) == loader.build_version is not None
+
+    marker = vector_db_path / SAVE_MARKER
+    marker.touch()
+    try:
+        assert read_build_version(vector_db_path) is None
+    finally:
+        marker.unlink()
+    assert read_build_version(vector_db_path / "missing") is None
+
+def test_loader_picks_up_index_type(tmp_path):
+    """An HNSW build is loaded with its query-time parameters and matches exact search."""
+    texts = [f"Essay paragraph {i} about teaching introductory computer science." for i in range(300)]
+    flat = load(build_db(tmp_path, texts, name="flat"))
+    hnsw_path = build_db(
+        tmp_path, texts, name="hnsw", index_type="hnsw", index_params={"ef_search": 64}
+    )
+
+    for loader in (load(hnsw_path), load(hnsw_path, use_mmap=True)):
+        assert loader.get_stats()["index_type"] == "hnsw"
+        assert unwrap_index(loader.index).hnsw.efSearch == 64
+        for text in texts[:20]:
+            assert loader.search(text, k=3) == flat.search(text, k=3)
+
+    # Switching the index type forces a rebuild even when no chunks changed
+    builder = ProductionVectorDB(FakeEmbeddings(), index_type="flat")
+    builder.load_existing_database(str(hnsw_path))
+    assert builder.index_config_changed()
+
+
+@pytest.mark.parametrize("index_type", ["sq-fp16", "sq-int8", "binary"])
+def test_quantized_index_reranks_to_exact_order(tmp_path, index_type):
+    """Quantized builds re-rank candidates against vectors.npy and match flat search."""
+    texts = [f"Essay paragraph {i} about teaching introductory computer science." for i in range(300)]
+    flat = load(build_db(tmp_path, texts, name="flat"))
+    path = build_db(tmp_path, texts, name=index_type, index_type=index_type)
+
+    loader = load(path)
+    assert loader.rerank_factor is not None
+    assert loader.vectors is not None and isinstance(loader.vectors, np.memmap)
+    assert (path / "vector.index").stat().st_size < (tmp_path / "flat" / "vector.index").stat().st_size
+    for text in texts[:20]:
+        results, expected = loader.search(text, k=3), flat.search(text, k=3)
+        assert [r["content"] for r in results] == [r["content"] for r in expected]
+        assert [r["score"] for r in results] == pytest.approx([r["score"] for r in expected])
+
+
+def test_reduced_build_projects_queries(tmp_path):
+    """A PCA build stores short vectors and the loader projects queries to match."""
+    texts = [f"Essay paragraph {i} about teaching introductory computer science." for i in range(300)]
+    path = build_db(tmp_path, texts, name="pca", reduction="pca", dimensions=16)
+
+    loader = load(path)
+    assert loader.reducer is not None
+    assert loader.get_stats()["embedding_dimension"] == 16
+    assert np.load(path / "vectors.npy").shape == (300, 16)
+    for text in texts[:20]:
+        assert loader.search(text, k=3)[0]["content"] == text
+
+    # Reloading keeps full-width embeddings and the fitted projection
+    builder = ProductionVectorDB(FakeEmbeddings(), reduction="pca", dimensions=16)
+    builder.load_existing_database(str(path))
+    assert builder.embeddings.shape == (300, DIMENSION)
+    assert not builder.index_config_changed()
+    builder.save_to_disk(str(path))
+    assert np.load(path / "vectors.npy").shape == (300, 16)
+
+    # Dropping the reduction forces a full-width rebuild and removes the projection
+    builder = ProductionVectorDB(FakeEmbeddings())
+    builder.load_existing_database(str(path))
+    assert builder.index_config_changed()
+    builder.rebuild_faiss_index()
+    builder.save_to_disk(str(path))
+    assert not (path / "projection.npz").exists()
+    assert load(path).get_stats()["embedding_dimension"] == DIMENSION
+
+
+def test_lexical_search_skips_embedding(vector_db_path):
+    """Lexical mode answers exact-name queries from BM25 without embedding the query."""
+    loader = load(vector_db_path)
+    results = loader.search("CS 124", k=3, mode="lexical")
+    assert results[0]["content"] == TEXTS[0]
+    assert loader.embeddings_model.query_calls == 0
+
+    assert [r[0]["content"] for r in loader.search_batch(["Kotlin", "CS 124"], mode="lexical")] == [
+        TEXTS[3],
+        TEXTS[0],
+    ]
+    assert loader.embeddings_model.document_calls == 0
+    assert loader.get_stats()["lexical_terms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_fuses_rankings(vector_db_path):
+    """Hybrid mode ranks chunks found by both retrievers first and keeps lexical-only hits."""
+    loader = load(vector_db_path)
+
+    # Top of both rankings: 1 / (RRF_K + 1) from each side
+    hybrid = await loader.asearch(TEXTS[1], k=3, mode="hybrid")
+    assert hybrid[0]["content"] == TEXTS[1]
+    assert hybrid[0]["score"] == pytest.approx(2 / 61)
+    assert [r["score"] for r in hybrid] == sorted((r["score"] for r in hybrid), reverse=True)
+
+    # An exact name the vector side scores poorly still comes back through BM25
+    contents = [r["content"] for r in await loader.asearch("CS 124", k=3, mode="hybrid")]
+    assert TEXTS[0] in contents
+    assert len(contents) == len(set(contents))
+
+    with pytest.raises(ValueError):
+        loader.search("CS 124", mode="fuzzy")
+
+
+def test_hybrid_search_needs_lexical_index(vector_db_path):
+    (vector_db_path / "lexical.bin").unlink()
+    loader = load(vector_db_path)
+    assert loader.search(TEXTS[0], k=1)[0]["content"] == TEXTS[0]
+    with pytest.raises(ValueError, match="lexical.bin"):
+        loader.search("CS 124", mode="hybrid")
+
+
+def build_paged_db(tmp_path, index_type="flat", count=200):
+    """Build a database whose chunks come from several pages with different metadata."""
+    pages = [("essays/2024-testing", "2024-03-01"), ("essays/2020-lectures", "2020-09-15"), ("teaching", None)]
+    paths = []
+    for url, published in pages:
+        html_path = tmp_path / f"{url.replace('/', '_')}.html"
+        published_tag = f'<meta name="published" content="{published}">' if published else ""
+        html_path.write_text(
+            f'<html><head><meta name="title" content="{url}"><meta name="url" content="{url}">'
+            f"{published_tag}</head><body></body></html>"
+        )
+        paths.append(html_path)
+
+    builder = ProductionVectorDB(FakeEmbeddings(), index_type=index_type)
+    docs = []
+    for i in range(count):
+        html_path = paths[i % len(paths)]
+        metadata = {"source": str(html_path), "section_level": 2 + i % 2}
+        docs.append((Document(page_content=f"Chunk {i} about course design.", metadata=metadata), {"source_file": str(html_path)}))
+    builder.add_documents_incremental(docs)
+    builder.build_embeddings_incremental()
+    builder.rebuild_faiss_index()
+    builder.save_to_disk(str(tmp_path / index_type))
+    return tmp_path / index_type
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "sq-int8", "binary"])
+def test_filtered_search(tmp_path, index_type):
+    """Filters restrict the scan itself and match exact search over the allowed chunks."""
+    loader = load(build_paged_db(tmp_path, index_type))
+    filters = {"citation_url_prefix": "/essays/", "published_after": "2024-01-01", "section_level": 3}
+    allowed = [
+        i
+        for i, meta in enumerate(loader.metadata)
+        if meta["citation_url"] == "/essays/2024-testing" and meta["section_level"] == 3
+    ]
+    assert allowed
+
+    vectors = np.load(loader.db_path / "vectors.npy")
+    for i in range(5):
+        query = f"Chunk {i} about course design."
+        results = loader.search(query, k=5, use_adaptive_threshold=False, min_threshold=-1, filters=filters)
+        assert results
+        assert {loader.metadata.index(r["metadata"]) for r in results} <= set(allowed)
+
+        # Same ranking as brute force over the allowed rows
+        query_vector = np.array(loader.embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector)
+        expected = sorted(allowed, key=lambda j: -float(vectors[j] @ query_vector))[:5]
+        assert [r["content"] for r in results] == [loader.documents[j] for j in expected]
+
+    # Filters apply to lexical search, and an empty selection short-circuits
+    lexical = loader.search("chunk design", k=50, mode="lexical", use_adaptive_threshold=False, filters=filters)
+    assert {r["citation_url"] for r in lexical} == {"/essays/2024-testing"}
+    assert loader.search("Chunk 1", filters={"citation_url_prefix": "/talks/"}) == []
+
+
+def test_filters_load_without_decoding_metadata(tmp_path, monkeypatch):
+    """Filter columns are mapped from filters.bin; only older builds decode the metadata."""
+    db_path = build_paged_db(tmp_path)
+
+    def decode(cls, metadata):
+        raise AssertionError("metadata decoded at load")
+
+    filters = {"citation_url_prefix": "/essays/", "published_after": "2024-01-01", "section_level": 3}
+    with monkeypatch.context() as patched:
+        patched.setattr(metadata_filters.FilterColumns, "from_metadata", classmethod(decode))
+        loader = load(db_path)
+        results = loader.search(TEXTS[0], k=5, use_adaptive_threshold=False, min_threshold=-1, filters=filters)
+    assert results
+    assert {r["citation_url"] for r in results} == {"/essays/2024-testing"}
+
+    (db_path / "filters.bin").unlink()
+    legacy = load(db_path)
+    assert legacy.filter_index.select(filters).ids.tolist() == loader.filter_index.select(filters).ids.tolist()
+
+
+class BagOfWordsEmbeddings(FakeEmbeddings):
+    """Embeddings where texts sharing words are similar, like real overlapping chunks."""
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(256)
+        for word in text.split():
+            seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:4], "little")
+            vector += np.random.default_rng(seed).standard_normal(256)
+        return vector.tolist()
+
+
+def topic_paragraphs(topics):
+    return [" ".join(f"{topic}{j}" for j in range(20)) for topic in topics]
+
+
+def add_overlapping_page(builder, tmp_path, paragraphs):
+    """Split one section whose chunks overlap by one paragraph and add it to builder."""
+    html_path = tmp_path / "essay.html"
+    html_path.write_text(
+        '<html><head><meta name="url" content="essays/overlap"></head><body>'
+        "<h2>Course Design</h2>" + "".join(f"<p>{p}</p>" for p in paragraphs) + "</body></html>"
+    )
+
+    splitter = HierarchicalHTMLSplitter(min_paragraph_length=10, max_paragraphs_per_chunk=3, overlap_paragraphs=1)
+    chunks = splitter.split_html_file(str(html_path))
+    builder.add_documents_incremental([(chunk, {"source_file": str(html_path)}) for chunk in chunks])
+    builder.mark_stale({builder.compute_content_hash(chunk.page_content) for chunk in chunks})
+    builder.build_embeddings_incremental()
+    builder.rebuild_faiss_index()
+    builder.save_to_disk(str(tmp_path / "overlap"))
+
+    loader = ProductionVectorLoader(str(tmp_path / "overlap"), embedding_provider=hashed_embedding_provider())
+    loader.embeddings_model = BagOfWordsEmbeddings()
+    return loader
+
+
+def build_overlapping_db(tmp_path):
+    """Build a database from one section whose chunks overlap by one paragraph."""
+    paragraphs = topic_paragraphs(["testing", "lectures", "kotlin", "staffing", "quizzes", "grading"])
+    return add_overlapping_page(ProductionVectorDB(BagOfWordsEmbeddings()), tmp_path, paragraphs), paragraphs
+
+
+def test_mmr_and_merge_adjacent(tmp_path):
+    """Overlapping chunks are diversified away or merged into one passage."""
+    loader, paragraphs = build_overlapping_db(tmp_path)
+    chunks = [loader.documents[i] for i in range(len(loader.documents))]
+    assert [len(text.split("\n\n")) for text in chunks] == [3, 3, 2]
+
+    # Mostly paragraph 2, which the first two chunks share, with a little of paragraph 5
+    query = " ".join([paragraphs[2], paragraphs[5][:80], "lectures0"])
+    options = {"k": 2, "use_adaptive_threshold": False, "min_threshold": -1.0}
+
+    plain = loader.search(query, **options)
+    assert [r["content"] for r in plain] == chunks[:2]
+
+    # MMR swaps the near-duplicate second chunk for the one with new paragraphs
+    diverse = loader.search(query, mmr_lambda=0.3, **options)
+    assert [r["content"] for r in diverse] == [chunks[0], chunks[2]]
+    assert loader.search(query, mmr_lambda=1.0, **options) == plain
+
+    # Merging turns the adjacent chunks into one passage without the repeated paragraphs
+    merged = loader.search(query, merge_adjacent=True, **options)
+    assert len(merged) == 1
+    assert merged[0]["content"] == "\n\n".join(paragraphs)
+    assert merged[0]["merged_chunk_ids"] == [0, 1, 2]
+
+
+def test_merge_follows_section_order_after_incremental_build(tmp_path):
+    """Chunks appended by an incremental build merge by their place in the section, not by id."""
+    builder = ProductionVectorDB(BagOfWordsEmbeddings())
+    paragraphs = topic_paragraphs(["testing", "lectures", "kotlin", "staffing", "quizzes", "grading"])
+    add_overlapping_page(builder, tmp_path, paragraphs)
+
+    # Editing the first and last paragraphs replaces the first and last chunks, which get
+    # the consecutive ids 3 and 4 although the unchanged middle chunk separates them
+    edited = topic_paragraphs(["exams", *["lectures", "kotlin", "staffing", "quizzes"], "labs"])
+    loader = add_overlapping_page(builder, tmp_path, edited)
+    assert [meta["section_chunk"] for meta in loader.metadata[3:]] == [0, 2]
+
+    query = " ".join([edited[0], edited[5]])
+    options = {"k": 2, "use_adaptive_threshold": False, "min_threshold": 0.2}
+    results = loader.search(query, merge_adjacent=True, **options)
+    assert sorted(r["content"] for r in results) == sorted(loader.documents[i] for i in (3, 4))
+    assert not any("merged_chunk_ids" in r for r in results)
+
+    # With the middle chunk retrieved too, the section is joined in text order
+    query = " ".join([edited[0], edited[2], edited[3], edited[5]])
+    merged = loader.search(query, merge_adjacent=True, k=2, use_adaptive_threshold=False, min_threshold=-1.0)
+    assert merged[0]["merged_chunk_ids"] == [3, 1, 4]
+    assert merged[0]["content"] == "\n\n".join(edited)
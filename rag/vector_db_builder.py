@@ -5,26 +5,78 @@ Builds embeddings from HTML files and saves to production vector database.
 """
 
 import argparse
+import contextlib
 import hashlib
+import io
 import json
 import os
 import pickle
 import re
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
 from datetime import datetime
+from functools import partial
 from pathlib import Path
+from typing import Any
 
 import faiss
 import numpy as np
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from langchain_core.documents import Document
-from langchain_openai import AzureOpenAIEmbeddings
 
-from citation_utils import enrich_chunk_metadata
+from ann_index import (
+    DEFAULT_INDEX_PARAMS,
+    INDEX_TYPES,
+    build_faiss_index,
+    evaluate_index_configs,
+    format_index_report,
+    indexed_ids,
+    resolve_index_params,
+)
+from build_manifest import MANIFEST_FILE, BuildManifest
+from citation_utils import enrich_chunk_metadata, extract_page_metadata, page_metadata_from_soup
+from dimension_reduction import (
+    REDUCTION_METHODS,
+    DimensionReducer,
+    evaluate_reduction,
+    format_reduction_report,
+)
+from document_store import DocumentStore, write_document_store
+from embedding_pipeline import (
+    DEFAULT_BATCH_TOKENS,
+    DEFAULT_MAX_IN_FLIGHT,
+    EmbeddingStats,
+    embed_texts,
+)
+from embedding_providers import EMBEDDING_PROVIDERS, EmbeddingProvider, get_embedding_provider
+from embedding_store import DEFAULT_EMBEDDING_STORE, EmbeddingStore
+from lexical_index import write_lexical_index
+from metadata_filters import write_filter_columns
+from vector_db_loader import SAVE_MARKER
 
 load_dotenv()
 
 
+@contextmanager
+def replacing(path: Path):
+    """
+    Yield a temporary path to write, then move it over path in one rename.
+
+    A running server memory-maps the database files, so they are never rewritten in
+    place: its mappings keep the old contents until it reloads.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        yield tmp_path
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.replace(path)
+
+
 class HierarchicalHTMLSplitter:
     """Hierarchical splitter that respects HTML document structure."""
 
@@ -45,6 +97,15 @@ class HierarchicalHTMLSplitter:
         self.min_paragraph_length = min_paragraph_length
         self.max_paragraphs_per_chunk = max_paragraphs_per_chunk
         self.overlap_paragraphs = overlap_paragraphs
+        self.page_metadata = {}  # Head metadata of each split file, from the same parse
+
+    def config(self) -> dict[str, Any]:
+        """Settings that determine the chunks, recorded in the build manifest."""
+        return {
+            "min_paragraph_length": self.min_paragraph_length,
+            "max_paragraphs_per_chunk": self.max_paragraphs_per_chunk,
+            "overlap_paragraphs": self.overlap_paragraphs,
+        }
 
     def split_html_file(self, html_file_path: str) -> list[Document]:
         """Load and split an HTML file hierarchically: first by sections, then by paragraphs."""
@@ -56,6 +117,7 @@ class HierarchicalHTMLSplitter:
 
         # Parse HTML with BeautifulSoup
         soup = BeautifulSoup(html_content, "html.parser")
+        self.page_metadata[str(html_file_path)] = page_metadata_from_soup(soup)
 
         # Find body content
         body = soup.find("body")
@@ -153,11 +215,14 @@ class HierarchicalHTMLSplitter:
                 # Create a Document object for this chunk
                 chunk_text = "\n\n".join(chunk_paragraphs)
 
-                # Add section context to metadata
+                # Add section context to metadata; the section and chunk ordinals place the
+                # chunk in the page even after incremental builds give it an unrelated id
                 metadata = {
                     "source": str(html_file_path),
                     "section": section_name,
                     "section_level": section["heading_level"] or "none",
+                    "section_index": section_idx,
+                    "section_chunk": chunk_num,
                 }
 
                 doc = Document(page_content=chunk_text, metadata=metadata)
@@ -173,55 +238,206 @@ class HierarchicalHTMLSplitter:
         return chunks
 
 
+def _split_html_file(splitter: HierarchicalHTMLSplitter, html_file: Path):
+    """Split one file, capturing its log so parallel workers' output prints in file order."""
+    log = io.StringIO()
+    error = None
+    with redirect_stdout(log):
+        try:
+            chunks = splitter.split_html_file(str(html_file))
+        except Exception as e:
+            chunks, error = [], str(e)
+    return chunks, splitter.page_metadata.get(str(html_file)), log.getvalue(), error
+
+
+def split_html_files(
+    html_files: list[Path], splitter: HierarchicalHTMLSplitter, jobs: int = 1
+) -> Iterator[tuple[Path, list[Document], dict[str, str] | None, str, str | None]]:
+    """
+    Split HTML files, across a pool of worker processes when jobs > 1.
+
+    Yields (html_file, chunks, page_metadata, log, error) in the order of html_files, so
+    chunk ids don't depend on which worker finishes first.
+    """
+    if jobs <= 1:
+        for html_file in html_files:
+            yield html_file, *_split_html_file(splitter, html_file)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Several files per task amortize pickling the splitter; map() keeps input order
+        chunksize = max(1, len(html_files) // (jobs * 4))
+        results = executor.map(partial(_split_html_file, splitter), html_files, chunksize=chunksize)
+        for html_file, result in zip(html_files, results, strict=True):
+            yield html_file, *result
+
+
+def benchmark_parsing(
+    html_files: list[Path], splitter: HierarchicalHTMLSplitter, jobs_counts=(1, 2, 4, 8)
+) -> dict[str, Any]:
+    """Measure parse throughput in files/sec for each worker count, pool startup included."""
+    results = []
+    for jobs in jobs_counts:
+        start = time.perf_counter()
+        chunks = sum(len(result[1]) for result in split_html_files(html_files, splitter, jobs))
+        seconds = time.perf_counter() - start
+        results.append(
+            {
+                "jobs": jobs,
+                "seconds": round(seconds, 3),
+                "files_per_second": round(len(html_files) / seconds, 1) if seconds else 0.0,
+                "chunks": chunks,
+            }
+        )
+    return {"num_files": len(html_files), "cpu_count": os.cpu_count(), "results": results}
+
+
+def format_parse_report(report: dict[str, Any]) -> str:
+    """Format a parse benchmark as a table for the build log."""
+    baseline = report["results"][0]["files_per_second"] or 1.0
+    lines = [
+        f"Parse throughput over {report['num_files']} files ({report['cpu_count']} CPUs)",
+        f"   {'jobs':>4} {'seconds':>9} {'files/sec':>10} {'speedup':>8} {'chunks':>8}",
+    ]
+    for row in report["results"]:
+        lines.append(
+            f"   {row['jobs']:>4} {row['seconds']:>9.3f} {row['files_per_second']:>10.1f} "
+            f"{row['files_per_second'] / baseline:>7.2f}x {row['chunks']:>8}"
+        )
+    return "\n".join(lines)
+
+
 class ProductionVectorDB:
     """Production vector database builder with incremental updates."""
 
-    def __init__(self, embeddings_model):
-        self.embeddings_model = embeddings_model
+    def __init__(
+        self,
+        embeddings_model=None,
+        index_type: str = "flat",
+        index_params: dict[str, Any] | None = None,
+        reduction: str = "none",
+        dimensions: int | None = None,
+        embedding_provider: EmbeddingProvider | None = None,
+        embedding_store: EmbeddingStore | None = None,
+    ):
+        """
+        Initialize the builder.
+
+        Args:
+            embeddings_model: Model used to embed new chunks; defaults to the client of
+                embedding_provider, built only once there are chunks to embed
+            index_type: FAISS index to build (see ann_index.INDEX_TYPES)
+            index_params: Overrides for the index type's default parameters
+            reduction: Shorten indexed vectors by "truncate" or "pca", or "none"
+            dimensions: Indexed vector width when a reduction is used
+            embedding_provider: Provider of embeddings_model, recorded in build_info.json so
+                chunks embedded by a different model are never mixed into one index
+            embedding_store: Store of every chunk embedded before, under the provider's
+                namespace; only chunks it doesn't have are sent to the model
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+        if reduction not in REDUCTION_METHODS:
+            raise ValueError(
+                f"Unknown reduction method: {reduction} (expected one of {REDUCTION_METHODS})"
+            )
+        if reduction != "none" and not dimensions:
+            raise ValueError(f"Reduction {reduction} needs a target number of dimensions")
+
+        self._embeddings_model = embeddings_model
+        self.embedding_provider = embedding_provider
+        self.embedding_store = embedding_store
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.reduction = reduction
+        self.dimensions = dimensions if reduction != "none" else None
+        self.reducer: DimensionReducer | None = None  # Fitted for the current index
         self.documents = []  # Store document chunks
-        self.embeddings = []  # Store embeddings
+        self.embeddings: np.ndarray = np.empty((0, 0), dtype=np.float32)  # Store embeddings
         self.metadata = []  # Store metadata for each chunk
         self.content_hashes = {}  # Map content_hash -> chunk_index for deduplication
-        self.index = None  # FAISS index
+        self.index: faiss.Index | None = None  # FAISS index
+        self.resolved_index_params = {}  # Parameters the current index was built with
+        self.build_info = {}  # build_info.json of the loaded database
+        self.page_metadata = {}  # Head metadata per source file, so each page is parsed once
+        self.embedding_stats: EmbeddingStats | None = None  # Throughput of the last embedding run
+        self.reused_embeddings = 0  # New chunks whose embeddings came from the store
+
+    @property
+    def embeddings_model(self):
+        """Model used to embed new chunks."""
+        if self._embeddings_model is None and self.embedding_provider is not None:
+            self._embeddings_model = self.embedding_provider.client
+        return self._embeddings_model
 
     def compute_content_hash(self, content: str) -> str:
         """Compute SHA-256 hash of document content."""
         return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
-    def load_existing_database(self, base_path: str) -> bool:
+    def load_existing_database(self, base_path: str | Path) -> bool:
         """Load existing database if it exists."""
         base_path = Path(base_path)
 
-        if not (
-            base_path.exists()
-            and (base_path / "vector.index").exists()
-            and (base_path / "metadata.json").exists()
-            and (base_path / "documents.pkl").exists()
+        has_store = (base_path / "documents.bin").exists()
+        has_legacy = (base_path / "metadata.json").exists() and (
+            base_path / "documents.pkl"
+        ).exists()
+        if not (base_path.exists() and (base_path / "vector.index").exists()) or not (
+            has_store or has_legacy
         ):
             print(f"📂 No existing database found at {base_path}")
             return False
 
+        # Load build info to know how the existing index was built
+        info_path = base_path / "build_info.json"
+        build_info = {}
+        if info_path.exists():
+            with open(info_path) as f:
+                build_info = json.load(f)
+        if not self.embeddings_match(build_info):
+            print(
+                f"📂 Existing database at {base_path} was built with different embeddings "
+                f"({build_info.get('embeddings', 'azure')}), starting fresh"
+            )
+            return False
+
         print(f"📂 Loading existing database from {base_path}")
+        self.build_info = build_info
+        self.resolved_index_params = build_info.get("index_params", {})
 
         # Load FAISS index
         index_path = base_path / "vector.index"
         self.index = faiss.read_index(str(index_path))
 
-        # Load metadata
-        metadata_path = base_path / "metadata.json"
-        with open(metadata_path) as f:
-            self.metadata = json.load(f)
-
-        # Load documents
-        docs_path = base_path / "documents.pkl"
-        with open(docs_path, "rb") as f:
-            self.documents = pickle.load(f)
-
-        # Reconstruct embeddings from FAISS index
-        if self.index.ntotal > 0:
+        # Load documents and metadata
+        if has_store:
+            store = DocumentStore(base_path / "documents.bin")
+            self.documents = list(store.texts)
+            self.metadata = list(store.metadata)
+        else:
+            # Legacy format from before the binary document store
+            with open(base_path / "metadata.json") as f:
+                self.metadata = json.load(f)
+            with open(base_path / "documents.pkl", "rb") as f:
+                self.documents = pickle.load(f)
+
+        # Prefer the saved vectors: approximate indexes can't reconstruct them exactly.
+        # Reduced builds keep the full-width embeddings separately from the indexed vectors.
+        embeddings_path = base_path / "embeddings.npy"
+        vectors_path = base_path / "vectors.npy"
+        if embeddings_path.exists():
+            self.embeddings = np.load(embeddings_path)
+        elif vectors_path.exists():
+            self.embeddings = np.load(vectors_path)
+        elif self.index.ntotal > 0:
+            # Legacy builds saved only the index
             self.embeddings = np.zeros((self.index.ntotal, self.index.d), dtype=np.float32)
             self.index.reconstruct_n(0, self.index.ntotal, self.embeddings)
 
+        projection_path = base_path / "projection.npz"
+        if projection_path.exists():
+            self.reducer = DimensionReducer.load(projection_path)
+
         # Build content hash lookup
         self.content_hashes = {}
         for i, metadata in enumerate(self.metadata):
@@ -234,6 +450,16 @@ class ProductionVectorDB:
         print(f"   {self.index.ntotal if self.index else 0} vectors in index")
         return True
 
+    def embeddings_match(self, build_info: dict[str, Any]) -> bool:
+        """Whether a database's vectors come from the embeddings used for new chunks."""
+        if self.embedding_provider is None or not build_info:
+            return True
+        built_with: str | None = build_info.get("embeddings")
+        if built_with is None:
+            # Builds from before embedding providers always used Azure
+            return self.embedding_provider.name == "azure"
+        return built_with == self.embedding_provider.namespace
+
     def add_documents_incremental(self, docs_with_metadata) -> tuple[int, int]:
         """Add documents, skipping those that already exist."""
         new_docs = []
@@ -259,8 +485,11 @@ class ProductionVectorDB:
             }
 
             # Enrich with citation information
+            source_file = meta.get("source_file", meta.get("source", ""))
+            if source_file not in self.page_metadata:
+                self.page_metadata[source_file] = extract_page_metadata(source_file)
             chunk_metadata = enrich_chunk_metadata(
-                base_metadata, meta.get("source_file", meta.get("source", ""))
+                base_metadata, source_file, self.page_metadata[source_file]
             )
 
             new_docs.append(doc.page_content)
@@ -277,8 +506,78 @@ class ProductionVectorDB:
 
         return len(new_docs), skipped_count
 
-    def build_embeddings_incremental(self) -> int:
-        """Generate embeddings only for new documents."""
+    @property
+    def stale_count(self) -> int:
+        """Number of tombstoned chunks still stored in the database."""
+        return sum(1 for meta in self.metadata if meta.get("stale"))
+
+    def mark_stale(self, live_hashes: set[str]) -> int:
+        """
+        Tombstone chunks the current HTML no longer produces, and revive tombstoned chunks
+        it produces again. Tombstoned chunks stay stored until compact() but are never
+        returned by searches.
+
+        Returns:
+            Number of chunks whose state changed
+        """
+        changed = 0
+        for meta in self.metadata:
+            stale = meta.get("content_hash") not in live_hashes
+            if stale != bool(meta.get("stale")):
+                changed += 1
+                if stale:
+                    meta["stale"] = True
+                else:
+                    del meta["stale"]
+        return changed
+
+    def compact(self) -> tuple[int, int]:
+        """
+        Drop tombstoned chunks with their vectors and renumber the rest. The index is
+        rebuilt by the next rebuild_faiss_index().
+
+        Returns:
+            (chunks, bytes) reclaimed, counting texts, metadata and stored vectors
+        """
+        keep = [i for i, meta in enumerate(self.metadata) if not meta.get("stale")]
+        dead = [i for i, meta in enumerate(self.metadata) if meta.get("stale")]
+        if not dead:
+            return 0, 0
+
+        # Each chunk has a full-width embedding; reduced builds also store the indexed vector
+        row_bytes = self.embeddings.shape[1] * 4
+        if self.reducer is not None and self.index is not None:
+            row_bytes += self.index.d * 4
+        reclaimed_bytes = sum(
+            len(self.documents[i].encode("utf-8"))
+            + len(json.dumps(self.metadata[i]).encode("utf-8"))
+            + row_bytes
+            for i in dead
+        )
+
+        self.documents = [self.documents[i] for i in keep]
+        self.metadata = [
+            {**self.metadata[i], "chunk_id": chunk_id} for chunk_id, i in enumerate(keep)
+        ]
+        self.embeddings = np.asarray(self.embeddings)[keep]
+        self.content_hashes = {
+            meta["content_hash"]: i
+            for i, meta in enumerate(self.metadata)
+            if "content_hash" in meta
+        }
+        self.index = None
+        return len(dead), reclaimed_bytes
+
+    def build_embeddings_incremental(
+        self, batch_tokens: int = DEFAULT_BATCH_TOKENS, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    ) -> int:
+        """
+        Generate embeddings only for new documents.
+
+        Args:
+            batch_tokens: Token budget per embeddings request
+            max_in_flight: Most concurrent requests; rate limiting lowers the limit below this
+        """
         existing_count = len(self.embeddings) if self.embeddings is not None else 0
         new_doc_count = len(self.documents) - existing_count
 
@@ -291,89 +590,288 @@ class ProductionVectorDB:
         # Get only the new documents
         new_documents = self.documents[existing_count:]
 
-        # Generate embeddings in batches
-        batch_size = 20  # Larger batches for production efficiency
-        new_embeddings = []
-
-        for i in range(0, len(new_documents), batch_size):
-            batch = new_documents[i : i + batch_size]
-            batch_num = i // batch_size + 1
-            total_batches = (len(new_documents) + batch_size - 1) // batch_size
-            print(f"   Processing batch {batch_num}/{total_batches}")
-
-            batch_embeddings = self.embeddings_model.embed_documents(batch)
-            new_embeddings.extend(batch_embeddings)
+        # Reuse embeddings of any text embedded before with the same model and width
+        namespace = self.embedding_provider.namespace if self.embedding_provider else None
+        new_embeddings: list[np.ndarray | None] = [None] * new_doc_count
+        if self.embedding_store is not None and namespace:
+            width = self.embeddings.shape[1] if existing_count else None
+            new_embeddings = self.embedding_store.get(namespace, new_documents, width)
+        missing = [i for i, vector in enumerate(new_embeddings) if vector is None]
+        self.reused_embeddings = new_doc_count - len(missing)
+        if self.reused_embeddings:
+            print(f"♻️  Reused {self.reused_embeddings} embeddings from the embedding store")
+
+        if missing:
+            # Send batches concurrently, backing off when the service rate limits us
+            texts = [new_documents[i] for i in missing]
+            vectors, self.embedding_stats = embed_texts(
+                self.embeddings_model,
+                texts,
+                batch_tokens=batch_tokens,
+                max_in_flight=max_in_flight,
+            )
+            print(f"⚡ Embedded {self.embedding_stats.summary()}")
+            if self.embedding_store is not None and namespace:
+                self.embedding_store.put(namespace, texts, vectors)
+            for i, vector in zip(missing, vectors):
+                new_embeddings[i] = np.asarray(vector, dtype=np.float32)
 
         # Convert to numpy and combine with existing
-        new_embeddings = np.array(new_embeddings, dtype=np.float32)
+        added = np.array(new_embeddings, dtype=np.float32)
 
         if self.embeddings is not None and len(self.embeddings) > 0:
-            self.embeddings = np.vstack([self.embeddings, new_embeddings])
+            self.embeddings = np.vstack([self.embeddings, added])
         else:
-            self.embeddings = new_embeddings
+            self.embeddings = added
 
         print(f"✅ Total embeddings shape: {self.embeddings.shape}")
-        return len(new_embeddings)
+        return len(added)
+
+    def index_config_changed(self) -> bool:
+        """Check whether the loaded index was built with a different type or parameters."""
+        if not self.build_info:
+            return self.index_type != "flat"
+        built_type = self.build_info.get("index_type", "flat")
+        built_params = self.build_info.get("index_params", {})
+        built_reduction = self.build_info.get("reduction")
+        requested = resolve_index_params(self.index_type, len(self.embeddings), self.index_params)
+        if "nlist" not in self.index_params:
+            # The default nlist grows with the corpus; new chunks join the existing lists
+            requested.pop("nlist", None)
+            built_params = {key: value for key, value in built_params.items() if key != "nlist"}
+        requested_reduction = self.reduction_config()
+        return (
+            built_type != self.index_type
+            or built_params != requested
+            or built_reduction != requested_reduction
+        )
+
+    def reduction_config(self) -> dict[str, Any] | None:
+        """Requested reduction settings as recorded in build_info.json."""
+        if self.reduction == "none":
+            return None
+        return {"method": self.reduction, "dimensions": self.dimensions}
+
+    def normalized_embeddings(self, ids: np.ndarray | None = None) -> np.ndarray:
+        """Return a normalized float32 copy of all embeddings, or of the given chunk ids."""
+        embeddings = self.embeddings if ids is None else np.asarray(self.embeddings)[ids]
+        embeddings_normalized = np.array(embeddings, dtype=np.float32)
+        faiss.normalize_L2(embeddings_normalized)
+        return embeddings_normalized
+
+    def index_vectors(self, ids: np.ndarray | None = None) -> np.ndarray:
+        """Return the normalized vectors as stored in the index, reduced if configured."""
+        embeddings_normalized = self.normalized_embeddings(ids)
+        if self.reducer is None:
+            return embeddings_normalized
+        return self.reducer.transform(embeddings_normalized)
+
+    def live_ids(self) -> np.ndarray:
+        """Chunk ids that belong in the index: every chunk that isn't tombstoned."""
+        return np.array(
+            [i for i, meta in enumerate(self.metadata) if not meta.get("stale")], dtype=np.int64
+        )
 
     def rebuild_faiss_index(self):
         """Rebuild FAISS index with all embeddings."""
         if self.embeddings is None or len(self.embeddings) == 0:
             raise ValueError("No embeddings to index")
 
-        print("🏗️ Building FAISS index...")
+        print(f"🏗️ Building FAISS index ({self.index_type})...")
 
-        # Create new index
-        dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)
+        # Normalize embeddings for cosine similarity, fitting the reduction on the full corpus
+        self.reducer = None
+        if self.reduction != "none":
+            self.reducer = DimensionReducer.fit(
+                self.normalized_embeddings(), self.reduction, self.dimensions
+            )
+            print(
+                f"   Reducing {self.embeddings.shape[1]} -> {self.dimensions} dims ({self.reduction})"
+            )
+        # Index every live chunk under its chunk id, so later builds can update it in place
+        live = self.live_ids()
+        if len(live) == 0:
+            raise ValueError("No embeddings to index")
+        embeddings_normalized = self.index_vectors(live)
+        self.resolved_index_params = resolve_index_params(
+            self.index_type, len(embeddings_normalized), self.index_params
+        )
+        self.index = build_faiss_index(
+            embeddings_normalized, self.index_type, self.resolved_index_params, ids=live
+        )
 
-        # Normalize embeddings for cosine similarity
-        embeddings_normalized = self.embeddings.copy()
-        faiss.normalize_L2(embeddings_normalized)
+        print(f"✅ FAISS index built with {self.index.ntotal} vectors")
 
-        # Add all embeddings to index
-        self.index.add(embeddings_normalized)
+    def update_faiss_index(self) -> tuple[int, int] | None:
+        """
+        Add new chunks to the index and remove tombstoned ones in place, by chunk id.
+        The reduction and IVF lists of the existing index are kept.
 
-        print(f"✅ FAISS index built with {self.index.ntotal} vectors")
+        Returns:
+            (added, removed) vector counts, or None if there is no index or it predates
+            chunk ids, and it must be rebuilt
+        """
+        if self.index is None:
+            return None
+        indexed = indexed_ids(self.index)
+        if indexed is None:
+            return None
+
+        live = self.live_ids()
+        to_add = np.setdiff1d(live, indexed)
+        to_remove = np.setdiff1d(indexed, live)
+
+        if len(to_add):
+            self.index.add_with_ids(self.index_vectors(to_add), to_add)
+        removed = 0
+        if len(to_remove):
+            # HNSW can't delete; searches skip tombstoned chunks by their metadata
+            with contextlib.suppress(RuntimeError):
+                removed = int(self.index.remove_ids(faiss.IDSelectorBatch(to_remove)))
+
+        print(
+            f"✅ FAISS index updated in place: {len(to_add)} added, {removed} removed "
+            f"({self.index.ntotal} vectors)"
+        )
+        return len(to_add), removed
+
+    def evaluate_index(
+        self,
+        queries: np.ndarray | list[list[float]] | None = None,
+        k: int = 10,
+        compare_all: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Compare the configured index type against exact flat search.
 
-    def save_to_disk(self, base_path: str):
+        Args:
+            queries: Optional query embeddings; defaults to a held-out sample of chunks
+            k: Number of neighbors for recall@k
+            compare_all: Evaluate every supported index type with default parameters too
+        """
+        configs: list[tuple[str, dict[str, Any]]] = [("flat", {})]
+        if self.index_type != "flat":
+            configs.append((self.index_type, self.index_params))
+        if compare_all:
+            configs.extend((t, {}) for t in INDEX_TYPES if t not in ("flat", self.index_type))
+
+        if queries is not None:
+            queries = np.array(queries, dtype=np.float32)
+            faiss.normalize_L2(queries)
+            if self.reducer is not None:
+                queries = self.reducer.transform(queries)
+
+        # Skip configurations the corpus is too small to train
+        runnable = []
+        for index_type, params in configs:
+            try:
+                resolved = resolve_index_params(index_type, len(self.embeddings), params)
+                if index_type == "ivf-pq" and len(self.embeddings) < 2 ** resolved["pq_bits"]:
+                    raise ValueError(f"needs at least {2 ** resolved['pq_bits']} vectors")
+                runnable.append((index_type, params))
+            except ValueError as e:
+                print(f"   ⚠️ Skipping {index_type} in index report: {e}")
+
+        return evaluate_index_configs(self.index_vectors(), runnable, k=k, queries=queries)
+
+    def evaluate_reduction(
+        self, queries: np.ndarray | list[list[float]] | None = None, k: int = 10
+    ) -> dict[str, Any]:
+        """Measure the recall lost by searching reduced vectors instead of full-width ones."""
+        if self.reducer is None:
+            raise ValueError("No dimension reduction configured")
+        if queries is not None:
+            queries = np.array(queries, dtype=np.float32)
+            faiss.normalize_L2(queries)
+        return evaluate_reduction(self.normalized_embeddings(), self.reducer, k=k, queries=queries)
+
+    def save_to_disk(self, base_path: str | Path):
         """Save index and metadata to disk."""
+        if self.index is None:
+            raise ValueError("No index to save; call rebuild_faiss_index() first")
         base_path = Path(base_path)
         base_path.mkdir(parents=True, exist_ok=True)
 
         print(f"💾 Saving production vector database to {base_path}")
 
+        # Servers don't reload while the marker exists; a failed save leaves it in place
+        marker_path = base_path / SAVE_MARKER
+        marker_path.touch()
+
         # Save FAISS index
         index_path = base_path / "vector.index"
-        faiss.write_index(self.index, str(index_path))
+        with replacing(index_path) as tmp_path:
+            faiss.write_index(self.index, str(tmp_path))
+
+        # Save normalized vectors so the loader can memory-map them read-only
+        vectors_path = base_path / "vectors.npy"
+        with replacing(vectors_path) as tmp_path, open(tmp_path, "wb") as f:
+            np.save(f, self.index_vectors())
+
+        # Reduced builds also keep full-width embeddings for later builds and the
+        # projection the loader applies to query vectors
+        embeddings_path = base_path / "embeddings.npy"
+        projection_path = base_path / "projection.npz"
+        if self.reducer is not None:
+            with replacing(embeddings_path) as tmp_path, open(tmp_path, "wb") as f:
+                np.save(f, self.normalized_embeddings())
+            with replacing(projection_path) as tmp_path, open(tmp_path, "wb") as f:
+                self.reducer.save(f)
+        else:
+            embeddings_path.unlink(missing_ok=True)
+            projection_path.unlink(missing_ok=True)
 
-        # Save metadata
-        metadata_path = base_path / "metadata.json"
-        with open(metadata_path, "w") as f:
-            json.dump(self.metadata, f, indent=2)
+        # Save document texts and metadata
+        docs_path = base_path / "documents.bin"
+        write_document_store(docs_path, self.documents, self.metadata)
 
-        # Save document texts
-        docs_path = base_path / "documents.pkl"
-        with open(docs_path, "wb") as f:
-            pickle.dump(self.documents, f)
+        # Save the BM25 index used by lexical and hybrid search
+        lexical_path = base_path / "lexical.bin"
+        write_lexical_index(lexical_path, self.documents)
 
-        # Save build info
+        # Save the filterable metadata fields as columns the loader maps without decoding
+        write_filter_columns(base_path / "filters.bin", self.metadata)
+
+        # Remove files from the legacy pickle/JSON format
+        for legacy_name in ("metadata.json", "documents.pkl"):
+            (base_path / legacy_name).unlink(missing_ok=True)
+
+        # Save build info last: a new build_timestamp tells running servers to reload
         info_path = base_path / "build_info.json"
-        with open(info_path, "w") as f:
+        with replacing(info_path) as tmp_path, open(tmp_path, "w") as f:
             json.dump(
                 {
                     "total_documents": len(self.documents),
                     "total_chunks": len(self.metadata),
-                    "embedding_dimension": self.embeddings.shape[1],
+                    "embedding_dimension": self.index.d,
+                    "source_dimension": self.embeddings.shape[1],
+                    "reduction": self.reducer.config() if self.reducer else None,
+                    "index_type": self.index_type,
+                    "index_params": self.resolved_index_params,
+                    "stale_chunks": self.stale_count,
+                    "embedding_throughput": (
+                        self.embedding_stats.to_dict() if self.embedding_stats else None
+                    ),
+                    "embeddings": (
+                        self.embedding_provider.namespace
+                        if self.embedding_provider
+                        else self.build_info.get("embeddings")
+                    ),
                     "build_timestamp": datetime.now().isoformat(),
                 },
                 f,
                 indent=2,
             )
 
+        marker_path.unlink()
+
         print("✅ Saved production database:")
         print(f"   Index: {index_path} ({index_path.stat().st_size:,} bytes)")
-        print(f"   Metadata: {metadata_path} ({metadata_path.stat().st_size:,} bytes)")
+        print(f"   Vectors: {vectors_path} ({vectors_path.stat().st_size:,} bytes)")
+        if self.reducer is not None:
+            print(f"   Projection: {projection_path} ({self.reducer.method}, {self.index.d} dims)")
         print(f"   Documents: {docs_path} ({docs_path.stat().st_size:,} bytes)")
+        print(f"   Lexical index: {lexical_path} ({lexical_path.stat().st_size:,} bytes)")
 
 
 def build_production_database(
@@ -382,46 +880,46 @@ def build_production_database(
     min_paragraph_length: int = 100,
     max_paragraphs_per_chunk: int = 3,
     overlap_paragraphs: int = 1,
+    index_type: str = "flat",
+    index_params: dict[str, Any] | None = None,
+    index_report: bool = False,
+    eval_queries_file: str | None = None,
+    eval_k: int = 10,
+    reduction: str = "none",
+    dimensions: int | None = None,
+    embeddings_provider: str | None = None,
+    jobs: int = 1,
+    compact_threshold: float = 0.1,
+    embed_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+    embed_concurrency: int = DEFAULT_MAX_IN_FLIGHT,
+    embedding_store: str | None = None,
 ):
     """Build production vector database from HTML files."""
 
     print("🏭 Building Production Vector Database")
     print("=" * 50)
 
-    # Setup embeddings model
-    print("1️⃣ Setting up Azure OpenAI embeddings...")
-    embeddings_endpoint = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
-    embeddings_api_key = os.getenv("AZURE_OPENAI_EMBEDDINGS_API_KEY")
-
-    if not embeddings_endpoint or not embeddings_api_key:
-        raise ValueError("Missing Azure OpenAI embeddings credentials in .env")
-
-    # Extract deployment info
-    import re
-
-    match = re.search(r"/deployments/([^/]+)/", embeddings_endpoint)
-    deployment_name = match.group(1) if match else "text-embedding-3-large"
-    base_url = embeddings_endpoint.split("/openai/")[0]
-    api_version_match = re.search(r"api-version=([^&]+)", embeddings_endpoint)
-    api_version = api_version_match.group(1) if api_version_match else "2023-05-15"
-
-    embeddings = AzureOpenAIEmbeddings(
-        azure_endpoint=base_url,
-        azure_deployment=deployment_name,
-        api_key=embeddings_api_key,
-        api_version=api_version,
-    )
-
-    print("✅ Embeddings model configured")
+    # Setup embeddings; the client is only built if there are new chunks to embed
+    # The client doesn't retry on its own: the pipeline retries 429s through its rate limiter
+    # and 5xx, timeout and connection errors with backoff
+    provider = get_embedding_provider(embeddings_provider, max_retries=0)
+    print(f"1️⃣ Using {provider.description} embeddings")
 
     # Create vector database
-    vector_db = ProductionVectorDB(embeddings)
+    vector_db = ProductionVectorDB(
+        index_type=index_type,
+        index_params=index_params,
+        reduction=reduction,
+        dimensions=dimensions,
+        embedding_provider=provider,
+        embedding_store=EmbeddingStore(embedding_store) if embedding_store else None,
+    )
 
     # Try to load existing database for incremental updates
     vector_db.load_existing_database(output_dir)
 
-    # Find all HTML files
-    html_files = list(Path(html_dir).rglob("*.html"))
+    # Find all HTML files, sorted so chunk ids are stable between runs
+    html_files = sorted(Path(html_dir).rglob("*.html"))
     print(f"📁 Found {len(html_files)} HTML files")
 
     # Set up hierarchical HTML splitter
@@ -431,23 +929,42 @@ def build_production_database(
         overlap_paragraphs=overlap_paragraphs,
     )
 
-    # Process files
+    # Skip files whose bytes are unchanged since the last build; their chunks stay as they are
+    manifest = BuildManifest.load(output_dir, html_splitter.config())
+    manifest.retain(html_files)
+    changed_files = [
+        html_file
+        for html_file in html_files
+        if not manifest.unchanged(html_file, vector_db.content_hashes)
+    ]
+    unchanged_files = len(html_files) - len(changed_files)
+    print(f"📋 Unchanged files: {unchanged_files}, to parse: {len(changed_files)}")
+
+    # Process files, in parallel with jobs > 1; results arrive in path order either way
+    if jobs > 1 and changed_files:
+        print(f"⚙️ Parsing with {jobs} worker processes")
     all_docs_with_meta = []
-    for html_file in html_files:
+    for html_file, chunks, page_metadata, log, error in split_html_files(
+        changed_files, html_splitter, jobs
+    ):
         print(f"   Processing {html_file.relative_to(html_dir)}")
+        print(log, end="")
 
-        try:
-            # Use HTML-aware splitter to load and split the document
-            chunks = html_splitter.split_html_file(str(html_file))
+        if error is not None:
+            print(f"   ⚠️ Error processing {html_file}: {error}")
+            continue
 
-            # Add source info to metadata and prepare for processing
-            for chunk in chunks:
-                chunk.metadata["source_file"] = str(html_file)
-                all_docs_with_meta.append((chunk, chunk.metadata))
+        # Reuse the head metadata from the splitter's parse instead of parsing the page again
+        if page_metadata is not None:
+            vector_db.page_metadata[str(html_file)] = page_metadata
 
-        except Exception as e:
-            print(f"   ⚠️ Error processing {html_file}: {e}")
-            continue
+        # Add source info to metadata and prepare for processing
+        for chunk in chunks:
+            chunk.metadata["source_file"] = str(html_file)
+            all_docs_with_meta.append((chunk, chunk.metadata))
+        manifest.record(
+            html_file, [vector_db.compute_content_hash(chunk.page_content) for chunk in chunks]
+        )
 
     print(f"📄 Total chunks: {len(all_docs_with_meta)}")
 
@@ -456,20 +973,94 @@ def build_production_database(
     print(f"📊 Added: {new_added}, Skipped: {skipped}")
 
     # Build embeddings (incremental)
-    new_embeddings = vector_db.build_embeddings_incremental()
+    new_embeddings = vector_db.build_embeddings_incremental(
+        batch_tokens=embed_batch_tokens, max_in_flight=embed_concurrency
+    )
 
-    # Rebuild index if we have new embeddings
-    if new_embeddings > 0 or not hasattr(vector_db, "index") or vector_db.index is None:
+    # Tombstone chunks that no current file produces; compact once enough of them pile up
+    stale_changed = 0
+    compacted, reclaimed_bytes = 0, 0
+    if html_files:
+        live_hashes = {h for entry in manifest.files.values() for h in entry["chunk_hashes"]}
+        stale_changed = vector_db.mark_stale(live_hashes)
+        stale = vector_db.stale_count
+        if stale:
+            print(f"🪦 Stale chunks: {stale} of {len(vector_db.metadata)}")
+        if stale and stale / len(vector_db.metadata) > compact_threshold:
+            compacted, reclaimed_bytes = vector_db.compact()
+            print(f"🧹 Compacted: reclaimed {compacted} chunks, {reclaimed_bytes:,} bytes")
+    else:
+        print("⚠️ No HTML files found, keeping every existing chunk")
+
+    # Update the index in place; rebuild only for a new configuration or after compaction
+    index_changed = True
+    if vector_db.index is None or vector_db.index_config_changed():
         vector_db.rebuild_faiss_index()
+    else:
+        update = vector_db.update_faiss_index()
+        if update is None:
+            vector_db.rebuild_faiss_index()
+        else:
+            index_changed = any(update)
+
+    # Save to disk, unless nothing changed: a save would make running servers reload
+    up_to_date = (
+        not index_changed
+        and new_added == 0
+        and stale_changed == 0
+        and vector_db.build_info.get("embeddings") == provider.namespace
+        and all(
+            (Path(output_dir) / name).exists()
+            for name in ("documents.bin", "lexical.bin", "filters.bin", "vectors.npy")
+        )
+    )
+    if up_to_date:
+        print("✅ Database is up to date, nothing to save")
+    else:
+        vector_db.save_to_disk(output_dir)
+    with replacing(Path(output_dir) / MANIFEST_FILE) as tmp_path:
+        manifest.save(tmp_path)
+
+    # Compare recall and latency against exact search before shipping
+    if index_report or (not up_to_date and (index_type != "flat" or reduction != "none")):
+        print("📏 Evaluating index against exact search...")
+        queries = None
+        if eval_queries_file:
+            with open(eval_queries_file, encoding="utf-8") as f:
+                query_texts = [line.strip() for line in f if line.strip()]
+            queries, _ = embed_texts(
+                vector_db.embeddings_model,
+                query_texts,
+                batch_tokens=embed_batch_tokens,
+                max_in_flight=embed_concurrency,
+            )
+        report = vector_db.evaluate_index(queries=queries, k=eval_k, compare_all=index_report)
+        print(format_index_report(report))
+        if vector_db.reducer is not None:
+            report["reduction"] = vector_db.evaluate_reduction(queries=queries, k=eval_k)
+            print(format_reduction_report(report["reduction"]))
 
-    # Save to disk
-    vector_db.save_to_disk(output_dir)
+        report_path = Path(output_dir) / "index_report.json"
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"   Report: {report_path}")
 
     print("\n✅ Production vector database built successfully!")
     print("📊 Final stats:")
     print(f"   Total documents: {len(vector_db.documents)}")
     print(f"   New embeddings: {new_embeddings}")
-    print(f"   Skipped (unchanged): {skipped}")
+    if vector_db.reused_embeddings:
+        print(f"   Reused from embedding store: {vector_db.reused_embeddings}")
+    if vector_db.embedding_stats:
+        stats = vector_db.embedding_stats
+        print(
+            f"   Embedding throughput: {stats.chunks_per_second:.1f} chunks/s, "
+            f"{stats.tokens_per_second:,.0f} tokens/s"
+        )
+    print(f"   Skipped (unchanged): {skipped} chunks, {unchanged_files} files")
+    print(f"   Stale (tombstoned): {vector_db.stale_count}")
+    if compacted:
+        print(f"   Reclaimed: {compacted} chunks, {reclaimed_bytes:,} bytes")
     print(f"   Database location: {output_dir}")
 
 
@@ -503,9 +1094,126 @@ def main():
         action="store_true",
         help="Start with clean database (ignore existing)",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for HTML parsing and chunking (default: 1)",
+    )
+    parser.add_argument(
+        "--embedding-store",
+        default=os.getenv("EMBEDDING_STORE", DEFAULT_EMBEDDING_STORE),
+        help="Directory of embeddings shared with essay_similarity.py and kept across --clean; "
+        "'' to disable (default: EMBEDDING_STORE, else embedding_store)",
+    )
+    parser.add_argument(
+        "--embed-concurrency",
+        type=int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help="Most embeddings requests in flight; lowered automatically on rate limits "
+        f"(default: {DEFAULT_MAX_IN_FLIGHT})",
+    )
+    parser.add_argument(
+        "--embed-batch-tokens",
+        type=int,
+        default=DEFAULT_BATCH_TOKENS,
+        help=f"Token budget per embeddings request (default: {DEFAULT_BATCH_TOKENS})",
+    )
+    parser.add_argument(
+        "--parse-benchmark",
+        action="store_true",
+        help="Measure parse throughput with 1, 2, 4 and 8 workers and exit",
+    )
+    parser.add_argument(
+        "--compact-threshold",
+        type=float,
+        default=0.1,
+        help="Drop stale chunks and rebuild the index once they exceed this fraction of the "
+        "database (default: 0.1; 0 compacts on every build with stale chunks)",
+    )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default="flat",
+        help="FAISS index type (default: flat, exact search). sq-fp16, sq-int8 and binary "
+        "store compressed codes and re-rank candidates against vectors.npy",
+    )
+    parser.add_argument("--hnsw-m", type=int, help="HNSW graph degree (default: 32)")
+    parser.add_argument(
+        "--hnsw-ef-construction", type=int, help="HNSW build-time search depth (default: 200)"
+    )
+    parser.add_argument(
+        "--hnsw-ef-search", type=int, help="HNSW query-time search depth (default: 128)"
+    )
+    parser.add_argument(
+        "--ivf-nlist", type=int, help="Number of IVF lists (default: ~4 * sqrt(chunks))"
+    )
+    parser.add_argument("--ivf-nprobe", type=int, help="IVF lists scanned per query (default: 16)")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (default: 64)")
+    parser.add_argument("--pq-bits", type=int, help="Bits per PQ code (default: 8)")
+    parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        help="Candidates per result re-ranked at full precision for sq-fp16/sq-int8/binary "
+        "(default: 2/4/10)",
+    )
+    parser.add_argument(
+        "--reduction",
+        choices=REDUCTION_METHODS,
+        help="Shorten indexed vectors by truncation or a corpus PCA projection "
+        "(default: truncate when --dimensions is given, else none)",
+    )
+    parser.add_argument("--dimensions", type=int, help="Indexed vector width after reduction")
+    parser.add_argument(
+        "--embeddings",
+        choices=EMBEDDING_PROVIDERS,
+        help="Embeddings provider (default: EMBEDDINGS_PROVIDER, else azure). hashed computes "
+        "deterministic vectors locally, for offline builds and benchmarks",
+    )
+    parser.add_argument(
+        "--index-report",
+        action="store_true",
+        help="Write a recall/latency report comparing all index types against flat search",
+    )
+    parser.add_argument(
+        "--eval-queries",
+        help="File with one query per line for the index report (default: held-out chunks)",
+    )
+    parser.add_argument(
+        "--eval-k", type=int, default=10, help="k for recall@k in the index report (default: 10)"
+    )
 
     args = parser.parse_args()
 
+    index_params = {
+        "m": args.hnsw_m,
+        "ef_construction": args.hnsw_ef_construction,
+        "ef_search": args.hnsw_ef_search,
+        "nlist": args.ivf_nlist,
+        "nprobe": args.ivf_nprobe,
+        "pq_m": args.pq_m,
+        "pq_bits": args.pq_bits,
+        "rerank_factor": args.rerank_factor,
+    }
+    # Only pass parameters that apply to the selected index type
+    index_params = {
+        key: value
+        for key, value in index_params.items()
+        if value is not None and key in DEFAULT_INDEX_PARAMS[args.index_type]
+    }
+
+    reduction = args.reduction or ("truncate" if args.dimensions else "none")
+
+    if args.parse_benchmark:
+        splitter = HierarchicalHTMLSplitter(
+            min_paragraph_length=args.min_paragraph_length,
+            max_paragraphs_per_chunk=args.max_paragraphs,
+            overlap_paragraphs=args.overlap_paragraphs,
+        )
+        html_files = sorted(Path(args.html_dir).rglob("*.html"))
+        print(format_parse_report(benchmark_parsing(html_files, splitter)))
+        return
+
     # Clean existing database if requested
     if args.clean:
         import shutil
@@ -521,6 +1229,19 @@ def main():
         min_paragraph_length=args.min_paragraph_length,
         max_paragraphs_per_chunk=args.max_paragraphs,
         overlap_paragraphs=args.overlap_paragraphs,
+        index_type=args.index_type,
+        index_params=index_params,
+        index_report=args.index_report,
+        eval_queries_file=args.eval_queries,
+        eval_k=args.eval_k,
+        reduction=reduction,
+        dimensions=args.dimensions,
+        embeddings_provider=args.embeddings,
+        jobs=args.jobs,
+        compact_threshold=args.compact_threshold,
+        embed_batch_tokens=args.embed_batch_tokens,
+        embed_concurrency=args.embed_concurrency,
+        embedding_store=args.embedding_store,
     )
 
 
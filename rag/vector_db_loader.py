@@ -4,58 +4,178 @@ Production vector database loader for RAG system.
 Loads pre-built vector database for fast runtime queries.
 """
 
+import asyncio
 import json
 import os
 import pickle
+import threading
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 from typing import Any
 
 import faiss
 import numpy as np
 from dotenv import load_dotenv
-from langchain_openai import AzureOpenAIEmbeddings
+
+from ann_index import (
+    QUANTIZED_INDEX_TYPES,
+    apply_search_params,
+    filtered_search,
+    indexed_ids,
+    search_parameters,
+    search_with_rerank,
+)
+from dimension_reduction import DimensionReducer
+from diversification import merge_overlapping_texts, mmr_order, paragraph_overlap
+from document_store import DocumentStore
+from embedding_cache import QueryEmbeddingCache
+from embedding_providers import EmbeddingProvider, get_embedding_provider
+from lexical_index import LexicalIndex, tokenize
+from metadata_filters import FilterSelection, MetadataFilterIndex, read_filter_columns
+from result_cache import SemanticResultCache, search_key
 
 load_dotenv()
 
+# vector: embedding similarity only; lexical: BM25 only (no embedding call);
+# hybrid: reciprocal rank fusion of both rankings
+SEARCH_MODES = ("vector", "hybrid", "lexical")
+
+# Reciprocal rank fusion constant; larger values flatten the contribution of top ranks
+RRF_K = 60
+
+
+# Present in the database directory while the builder is replacing its files
+SAVE_MARKER = ".saving"
+
+
+def read_build_version(db_path: str | Path) -> str | None:
+    """
+    Build timestamp recorded in a database's build_info.json, or None if there is none
+    or a build is being saved over it.
+    """
+    if (Path(db_path) / SAVE_MARKER).exists():
+        return None
+    try:
+        with open(Path(db_path) / "build_info.json") as f:
+            build_info: dict[str, Any] = json.load(f)
+        return build_info.get("build_timestamp")
+    except (OSError, ValueError):
+        return None
+
 
 class ProductionVectorLoader:
     """Production vector database loader for runtime queries."""
 
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        use_mmap: bool = False,
+        prefault: bool = False,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 24 * 60 * 60,
+        query_cache_path: str | None = None,
+        search_threads: int = 4,
+        embedding_provider: EmbeddingProvider | None = None,
+        result_cache_size: int = 0,
+        result_cache_distance: float = 0.05,
+    ):
+        """
+        Initialize the loader.
+
+        Args:
+            db_path: Directory containing the pre-built vector database
+            use_mmap: Memory-map the index and raw vectors read-only so forked workers
+                share a single page-cache copy instead of each holding a private one
+            prefault: Ask the kernel to read the mapped files into the page cache at startup
+            query_cache_size: Number of query embeddings kept in memory (0 disables the cache)
+            query_cache_ttl: Seconds before a cached query embedding expires
+            query_cache_path: Optional SQLite file for a query cache shared across workers
+            search_threads: Size of the thread pool that runs FAISS scans for asearch()
+            embedding_provider: Embeddings backend for queries; defaults to the one selected
+                by EMBEDDINGS_PROVIDER (see embedding_providers)
+            result_cache_size: Number of recent searches whose ranked results are reused for
+                near-duplicate queries (0 disables the cache)
+            result_cache_distance: Largest cosine distance between query embeddings for a
+                cached result to be reused
+        """
         self.db_path = Path(db_path)
-        self.embeddings_model = None
+        self.use_mmap = use_mmap
+        self.prefault = prefault
+        self.embedding_provider = embedding_provider
+        self._embeddings_model = None  # Overrides the provider's client when set
+        self.query_cache = None
+        self.result_cache = (
+            SemanticResultCache(result_cache_size, result_cache_distance)
+            if result_cache_size > 0
+            else None
+        )
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=search_threads, thread_name_prefix="vector-search"
+        )
         self.documents = []
         self.metadata = []
-        self.index = None
+        self.index: faiss.Index | None = None
+        self.document_store = None
+        self.lexical_index = None  # BM25 index for lexical and hybrid search
+        self.filter_index: MetadataFilterIndex | None = (
+            None  # Per-field ID arrays for metadata filters
+        )
+        self.index_holds_stale = False  # Whether tombstoned chunks are still in the index
+        self.index_type = "flat"
+        self.vectors = None  # Normalized float32 vectors from vectors.npy, memory-mapped
         self.build_info = {}
+        self.rerank_factor = None  # Candidate multiplier when the index holds quantized codes
+        self.reducer = None  # Projection applied to query vectors for reduced builds
+        self.mapped_bytes = 0  # Bytes backed by shared read-only file mappings
+        self.private_bytes = 0  # Bytes copied into this process's private memory
+        self._active_searches = 0  # Searches in progress, so a retired loader can drain
+        self._retired = False
+        self._closed = False
+        self._state_lock = threading.Lock()
 
         # Auto-load on initialization
         self._load_database()
-        self._setup_embeddings()
-
-    def _setup_embeddings(self):
-        """Setup Azure OpenAI embeddings model."""
-        embeddings_endpoint = os.getenv("AZURE_OPENAI_EMBEDDINGS_ENDPOINT")
-        embeddings_api_key = os.getenv("AZURE_OPENAI_EMBEDDINGS_API_KEY")
-
-        if not embeddings_endpoint or not embeddings_api_key:
-            raise ValueError("Missing Azure OpenAI embeddings credentials")
-
-        # Extract deployment info
-        import re
-
-        match = re.search(r"/deployments/([^/]+)/", embeddings_endpoint)
-        deployment_name = match.group(1) if match else "text-embedding-3-large"
-        base_url = embeddings_endpoint.split("/openai/")[0]
-        api_version_match = re.search(r"api-version=([^&]+)", embeddings_endpoint)
-        api_version = api_version_match.group(1) if api_version_match else "2023-05-15"
-
-        self.embeddings_model = AzureOpenAIEmbeddings(
-            azure_endpoint=base_url,
-            azure_deployment=deployment_name,
-            api_key=embeddings_api_key,
-            api_version=api_version,
-        )
+        provider = self._setup_embeddings()
+
+        if query_cache_size > 0:
+            self.query_cache = QueryEmbeddingCache(
+                namespace=provider.namespace,
+                max_entries=query_cache_size,
+                ttl_seconds=query_cache_ttl,
+                persist_path=query_cache_path,
+            )
+
+    def _setup_embeddings(self) -> EmbeddingProvider:
+        """Select the embeddings provider and check it is the one the database was built with."""
+        provider = self.embedding_provider or get_embedding_provider()
+        self.embedding_provider = provider
+
+        built_with = self.build_info.get("embeddings")
+        if built_with and built_with != provider.namespace:
+            print(
+                f"⚠️ Database was built with {built_with} embeddings but queries use "
+                f"{provider.namespace}; vector scores will be meaningless"
+            )
+        return provider
+
+    @property
+    def embeddings_model(self):
+        """
+        Embeddings client, built on first use: importing the OpenAI SDK takes longer than
+        loading a memory-mapped database, and lexical searches never need it.
+        """
+        if self._embeddings_model is not None:
+            return self._embeddings_model
+        if self.embedding_provider is None:
+            return None
+        return self.embedding_provider.client
+
+    @embeddings_model.setter
+    def embeddings_model(self, model):
+        self._embeddings_model = model
 
     def _load_database(self):
         """Load the pre-built vector database."""
@@ -66,17 +186,32 @@ class ProductionVectorLoader:
         index_path = self.db_path / "vector.index"
         if not index_path.exists():
             raise FileNotFoundError(f"FAISS index not found at {index_path}")
-        self.index = faiss.read_index(str(index_path))
-
-        # Load metadata
-        metadata_path = self.db_path / "metadata.json"
-        with open(metadata_path) as f:
-            self.metadata = json.load(f)
-
-        # Load documents
-        docs_path = self.db_path / "documents.pkl"
-        with open(docs_path, "rb") as f:
-            self.documents = pickle.load(f)
+        self._load_index(index_path)
+
+        # Load documents and metadata
+        store_path = self.db_path / "documents.bin"
+        if store_path.exists():
+            # Texts and metadata are decoded lazily, only for chunks returned by search()
+            self.document_store = DocumentStore(store_path)
+            self.documents = self.document_store.texts
+            self.metadata = self.document_store.metadata
+            self.mapped_bytes += self.document_store.size_bytes
+        else:
+            # Legacy format: pickled texts plus JSON metadata, parsed eagerly
+            metadata_path = self.db_path / "metadata.json"
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+
+            docs_path = self.db_path / "documents.pkl"
+            with open(docs_path, "rb") as f:
+                self.documents = pickle.load(f)
+            self.private_bytes += metadata_path.stat().st_size + docs_path.stat().st_size
+
+        # BM25 index for lexical and hybrid search (older builds don't have one)
+        lexical_path = self.db_path / "lexical.bin"
+        if lexical_path.exists():
+            self.lexical_index = LexicalIndex(lexical_path)
+            self.mapped_bytes += self.lexical_index.size_bytes
 
         # Load build info if available
         info_path = self.db_path / "build_info.json"
@@ -84,10 +219,137 @@ class ProductionVectorLoader:
             with open(info_path) as f:
                 self.build_info = json.load(f)
 
+        # Query-time parameters (efSearch, nprobe) for approximate index types
+        index_type = self.index_type = self.build_info.get("index_type", "flat")
+        index_params = self.build_info.get("index_params", {})
+        apply_search_params(self.index, index_type, index_params)
+
+        # Filterable fields as columns, so loading doesn't decode every chunk's metadata.
+        # Older builds don't have them and fall back to the metadata.
+        filters_path = self.db_path / "filters.bin"
+        if filters_path.exists():
+            self.filter_index = MetadataFilterIndex(read_filter_columns(filters_path))
+            self.mapped_bytes += filters_path.stat().st_size
+        else:
+            self.filter_index = MetadataFilterIndex(self.metadata)
+        self.index_holds_stale = self._index_holds_stale()
+
+        # Reduced builds index shorter vectors, so queries need the same projection
+        projection_path = self.db_path / "projection.npz"
+        if self.build_info.get("reduction") and projection_path.exists():
+            self.reducer = DimensionReducer.load(projection_path)
+
+        # Memory-map raw vectors if the build produced them. Quantized indexes always
+        # need them to re-rank candidates at full precision.
+        vectors_path = self.db_path / "vectors.npy"
+        quantized = index_type in QUANTIZED_INDEX_TYPES
+        if vectors_path.exists():
+            # Map now even when only diversified searches read them, so a later build
+            # replacing the file can't change what this loader sees. Always a mapping, so
+            # counted as one with or without use_mmap.
+            self.vectors = np.load(vectors_path, mmap_mode="r")
+            self.mapped_bytes += vectors_path.stat().st_size
+            if self.use_mmap and self.prefault:
+                self._prefault(vectors_path, self.vectors)
+        if quantized:
+            if self.vectors is not None:
+                self.rerank_factor = int(index_params.get("rerank_factor", 1))
+            else:
+                print(f"Warning: {vectors_path} missing, {index_type} scores are not re-ranked")
+
         print("✅ Loaded production vector database:")
         print(f"   Documents: {len(self.documents)}")
         print(f"   Index vectors: {self.index.ntotal}")
         print(f"   Embedding dimension: {self.index.d}")
+        if self.reducer is not None:
+            print(f"   Reduction: {self.reducer.method} to {self.reducer.dimensions} dims")
+        print(f"   Index type: {index_type}")
+        if self.rerank_factor:
+            print(f"   Re-ranking: {self.rerank_factor}x candidates at full precision")
+        if self.lexical_index is not None:
+            print(f"   Lexical index: {self.lexical_index.term_count:,} terms")
+        if self.mapped_bytes:
+            print(f"   Memory-mapped: {self.mapped_bytes:,} bytes")
+
+    def _load_index(self, index_path: Path):
+        """Read the FAISS index, memory-mapping its storage when requested."""
+        index_size = index_path.stat().st_size
+
+        if self.use_mmap:
+            try:
+                self.index = faiss.read_index(
+                    str(index_path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+                )
+                self.mapped_bytes += index_size
+                if self.prefault:
+                    self._prefault(index_path)
+                return
+            except RuntimeError as e:
+                # Older FAISS builds or index types without mmap support
+                print(f"   Warning: Could not memory-map {index_path.name}, loading privately: {e}")
+
+        self.index = faiss.read_index(str(index_path))
+        self.private_bytes += index_size
+
+    def _index_holds_stale(self) -> bool:
+        """
+        Whether the index still contains tombstoned chunks: builds remove them in place,
+        except from HNSW, which can't delete, and from indexes numbered by position.
+        """
+        filter_index = self._loaded_filters()
+        if not filter_index.stale_count:
+            return False
+        stale = np.flatnonzero(~filter_index.live)
+        index = self._loaded_index()
+        ids = indexed_ids(index)
+        if ids is None:
+            return bool((stale < index.ntotal).any())
+        return bool(np.isin(stale, ids).any())
+
+    def _loaded_index(self) -> faiss.Index:
+        """The FAISS index, which close() releases."""
+        if self.index is None:
+            raise ValueError("Database not properly loaded")
+        return self.index
+
+    def _loaded_filters(self) -> MetadataFilterIndex:
+        """The metadata filter index, which close() releases."""
+        if self.filter_index is None:
+            raise ValueError("Database not properly loaded")
+        return self.filter_index
+
+    @staticmethod
+    def _prefault(path: Path, array: np.ndarray | None = None):
+        """Hint the kernel to read a mapped file into the shared page cache."""
+        if hasattr(os, "posix_fadvise"):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+
+        # np.load(mmap_mode=...) returns a memmap that exposes the underlying mmap object
+        mapping = getattr(array, "_mmap", None)
+        if mapping is not None and hasattr(mapping, "madvise"):
+            import mmap
+
+            mapping.madvise(mmap.MADV_WILLNEED)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, serving repeated queries from the query embedding cache."""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        return self._cache_query(query, self.embeddings_model.embed_query(query))
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Async version of embed_query() using the embeddings client's async API."""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        return self._cache_query(query, await self.embeddings_model.aembed_query(query))
 
     def search(
         self,
@@ -95,6 +357,10 @@ class ProductionVectorLoader:
         k: int = 10,
         use_adaptive_threshold: bool = True,
         min_threshold: float = 0.3,
+        mode: str = "vector",
+        filters: dict[str, Any] | None = None,
+        mmr_lambda: float | None = None,
+        merge_adjacent: bool = False,
     ) -> list[dict[str, Any]]:
         """
         Search for similar documents with adaptive filtering.
@@ -104,80 +370,574 @@ class ProductionVectorLoader:
             k: Maximum number of results to retrieve (default 10)
             use_adaptive_threshold: Use adaptive similarity filtering based on best result (default True)
             min_threshold: Minimum absolute threshold to prevent very low quality results (default 0.3)
+            mode: "vector", "hybrid" (vector and BM25 rankings fused) or "lexical" (BM25 only,
+                no embedding call). Hybrid and lexical results are scored by their fused or
+                BM25 score rather than cosine similarity.
+            filters: Optional metadata filters (see metadata_filters.FILTER_FIELDS), e.g.
+                {"citation_url_prefix": "/essays/", "published_after": "2024-01-01"}.
+                They restrict the scan itself, so top results are never crowded out.
+            mmr_lambda: Diversify results with maximal marginal relevance, weighting relevance
+                by this value (0-1) against similarity to results already chosen. None disables.
+            merge_adjacent: Merge results that are neighboring chunks of the same source and
+                section into one result, without the repeated overlap paragraphs
         """
-        if self.index is None or self.embeddings_model is None:
+        with self._in_flight():
+            self._check_mode(mode)
+
+            # Lexical search never needs the query embedding
+            query_embedding = self.embed_query(query) if mode != "lexical" else None
+
+            return self._search_rows(
+                [query],
+                [query_embedding],
+                k,
+                use_adaptive_threshold,
+                min_threshold,
+                mode,
+                filters,
+                mmr_lambda=mmr_lambda,
+                merge_adjacent=merge_adjacent,
+            )[0]
+
+    async def asearch(
+        self,
+        query: str,
+        k: int = 10,
+        use_adaptive_threshold: bool = True,
+        min_threshold: float = 0.3,
+        mode: str = "vector",
+        filters: dict[str, Any] | None = None,
+        mmr_lambda: float | None = None,
+        merge_adjacent: bool = False,
+    ) -> list[dict[str, Any]]:
+        """
+        Non-blocking version of search() for use from async request handlers.
+
+        The query is embedded with the embeddings client's async API and the FAISS scan runs
+        in the loader's bounded thread pool, so the event loop keeps serving other requests.
+        """
+        with self._in_flight():
+            self._check_mode(mode)
+
+            query_embedding = await self.aembed_query(query) if mode != "lexical" else None
+
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(
+                self._search_executor,
+                partial(
+                    self._search_rows,
+                    [query],
+                    [query_embedding],
+                    k,
+                    use_adaptive_threshold,
+                    min_threshold,
+                    mode,
+                    filters,
+                    mmr_lambda=mmr_lambda,
+                    merge_adjacent=merge_adjacent,
+                ),
+            )
+            return results[0]
+
+    def search_batch(
+        self,
+        queries: list[str],
+        k: int = 10,
+        use_adaptive_threshold: bool = True,
+        min_threshold: float = 0.3,
+        mode: str = "vector",
+        filters: dict[str, Any] | None = None,
+    ) -> list[list[dict[str, Any]]]:
+        """
+        Search for several queries at once.
+
+        Uncached queries are embedded in a single embed_documents call and all queries are
+        scanned with one FAISS search. Each row gets the same filtering as search().
+
+        Args:
+            queries: Search queries
+            k: Maximum number of results to retrieve per query (default 10)
+            use_adaptive_threshold: Use adaptive similarity filtering based on best result (default True)
+            min_threshold: Minimum absolute threshold to prevent very low quality results (default 0.3)
+            mode: "vector", "hybrid" or "lexical", as in search()
+            filters: Optional metadata filters applied to every query, as in search()
+        """
+        with self._in_flight():
+            self._check_mode(mode)
+            if not queries:
+                return []
+
+            query_embeddings = (
+                self.embed_queries(queries) if mode != "lexical" else [None] * len(queries)
+            )
+
+            return self._search_rows(
+                queries, query_embeddings, k, use_adaptive_threshold, min_threshold, mode, filters
+            )
+
+    async def asearch_batch(
+        self,
+        queries: list[str],
+        k: int = 10,
+        use_adaptive_threshold: bool = True,
+        min_threshold: float = 0.3,
+        mode: str = "vector",
+        filters: dict[str, Any] | None = None,
+    ) -> list[list[dict[str, Any]]]:
+        """Non-blocking version of search_batch() for use from async request handlers."""
+        with self._in_flight():
+            self._check_mode(mode)
+            if not queries:
+                return []
+
+            query_embeddings: Sequence[np.ndarray | None]
+            if mode != "lexical":
+                query_embeddings = await self.aembed_queries(queries)
+            else:
+                query_embeddings = [None] * len(queries)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._search_executor,
+                self._search_rows,
+                queries,
+                query_embeddings,
+                k,
+                use_adaptive_threshold,
+                min_threshold,
+                mode,
+                filters,
+            )
+
+    @property
+    def build_version(self) -> str | None:
+        """Build timestamp of the loaded database."""
+        return self.build_info.get("build_timestamp")
+
+    @contextmanager
+    def _in_flight(self):
+        """Count a search as in progress; the last search of a retired loader closes it."""
+        with self._state_lock:
+            if self._closed:
+                raise RuntimeError(f"Vector database {self.db_path} has been closed")
+            self._active_searches += 1
+        try:
+            yield
+        finally:
+            with self._state_lock:
+                self._active_searches -= 1
+                drained = self._retired and self._active_searches == 0
+            if drained:
+                self.close()
+
+    def retire(self):
+        """
+        Stop serving new searches once a replacement is live. Searches already running
+        finish on this copy, and it is closed when the last one returns.
+        """
+        with self._state_lock:
+            self._retired = True
+            drained = self._active_searches == 0
+        if drained:
+            self.close()
+
+    def close(self):
+        """Release the index, mappings and search threads."""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._search_executor.shutdown(wait=False)
+        # Mappings are unmapped once the last array viewing them is garbage collected
+        self.index = None
+        self.vectors = None
+        self.document_store = None
+        self.documents = []
+        self.metadata = []
+        self.lexical_index = None
+        self.filter_index = None
+        print(f"🗑️ Closed vector database {self.db_path} ({self.build_version})")
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _check_mode(self, mode: str):
+        """Validate a search mode against what the loaded database supports."""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} (expected one of {SEARCH_MODES})")
+        if mode != "lexical" and (self.index is None or self.embeddings_model is None):
             raise ValueError("Database not properly loaded")
+        if mode != "vector" and self.lexical_index is None:
+            raise ValueError(f"{mode} search needs lexical.bin; rebuild the vector database")
 
-        # Get query embedding
-        query_embedding = np.array([self.embeddings_model.embed_query(query)], dtype=np.float32)
-        faiss.normalize_L2(query_embedding)
+    def _search_rows(
+        self,
+        queries: list[str],
+        query_embeddings: Sequence[np.ndarray | None],
+        k: int,
+        use_adaptive_threshold: bool,
+        min_threshold: float,
+        mode: str,
+        filters: dict[str, Any] | None = None,
+        mmr_lambda: float | None = None,
+        merge_adjacent: bool = False,
+    ) -> list[list[dict[str, Any]]]:
+        """Search a batch of queries, reusing cached results for near-duplicate queries."""
+        search_args = (k, use_adaptive_threshold, min_threshold, mode, filters)
+        if self.result_cache is None or mode == "lexical":
+            return self._rank_rows(
+                queries,
+                query_embeddings,
+                *search_args,
+                mmr_lambda=mmr_lambda,
+                merge_adjacent=merge_adjacent,
+            )
+
+        options = {
+            "k": k,
+            "use_adaptive_threshold": use_adaptive_threshold,
+            "min_threshold": min_threshold,
+            "mode": mode,
+            "filters": filters,
+            "mmr_lambda": mmr_lambda,
+            "merge_adjacent": merge_adjacent,
+        }
+        # BM25 scores depend on the query's terms, so hybrid results are only reused for
+        # queries with the same terms: "CS 124" and "CS 125" embed alike but rank differently
+        keys = [
+            search_key(**options)
+            if mode == "vector"
+            else search_key(**options, query_terms=tokenize(query))
+            for query in queries
+        ]
+        results = [
+            self.result_cache.get(embedding, key, self.build_version)
+            for embedding, key in zip(query_embeddings, keys, strict=True)
+        ]
+        missing = [i for i, row in enumerate(results) if row is None]
+        searched: dict[int, list[dict[str, Any]]] = {}
+        if missing:
+            rows = self._rank_rows(
+                [queries[i] for i in missing],
+                [query_embeddings[i] for i in missing],
+                *search_args,
+                mmr_lambda=mmr_lambda,
+                merge_adjacent=merge_adjacent,
+            )
+            for i, row in zip(missing, rows, strict=True):
+                self.result_cache.put(query_embeddings[i], keys[i], self.build_version, row)
+                searched[i] = row
+        return [searched[i] if row is None else row for i, row in enumerate(results)]
+
+    def _rank_rows(
+        self,
+        queries: list[str],
+        query_embeddings: Sequence[np.ndarray | None],
+        k: int,
+        use_adaptive_threshold: bool,
+        min_threshold: float,
+        mode: str,
+        filters: dict[str, Any] | None = None,
+        mmr_lambda: float | None = None,
+        merge_adjacent: bool = False,
+    ) -> list[list[dict[str, Any]]]:
+        """Run one search mode for a batch of queries and format each row."""
+        filter_index = self._loaded_filters()
+        selection = filter_index.select(filters)
+        if selection is not None and selection.count == 0:
+            return [[] for _ in queries]
+
+        # Diversifying and merging choose k results from a larger pool of candidates
+        final_k = k
+        if mmr_lambda is not None or merge_adjacent:
+            k *= 3
+
+        # Unfiltered scans only need the live mask if the index still holds tombstoned
+        # chunks; otherwise it would make index types that can't filter while scanning
+        # (binary) rank every vector
+        vector_selection = selection
+        if selection is filter_index.live_selection and not self.index_holds_stale:
+            vector_selection = None
+
+        if mode == "vector":
+            rows = self._vector_candidates(
+                query_embeddings, k, use_adaptive_threshold, min_threshold, vector_selection
+            )
+        else:
+            rows = [
+                self._lexical_candidates(query, k, use_adaptive_threshold, selection)
+                for query in queries
+            ]
+            if mode == "hybrid":
+                vector_rows = self._vector_candidates(
+                    query_embeddings, k, use_adaptive_threshold, min_threshold, vector_selection
+                )
+                rows = [
+                    self._fuse_rankings([vector_row, lexical_row], k)
+                    for vector_row, lexical_row in zip(vector_rows, rows, strict=True)
+                ]
+
+        if mmr_lambda is not None:
+            rows = [self._diversify(row, mmr_lambda) for row in rows]
+        if merge_adjacent:
+            return [self._merge_adjacent(row, final_k) for row in rows]
+
+        # Only materialize text and metadata for the chunks we return
+        return [[self._format_result(score, idx) for score, idx in row[:final_k]] for row in rows]
+
+    def _candidate_vectors(self, ids: list[int]) -> np.ndarray:
+        """Normalized stored vectors for a few chunks, as indexed."""
+        if self.vectors is not None:
+            return np.asarray(self.vectors[ids], dtype=np.float32)
+        vectors: np.ndarray = self._loaded_index().reconstruct_batch(
+            np.asarray(ids, dtype=np.int64)
+        )
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _diversify(
+        self, row: list[tuple[float, int]], mmr_lambda: float
+    ) -> list[tuple[float, int]]:
+        """Re-order one row of candidates by maximal marginal relevance."""
+        if len(row) < 2:
+            return row
+        scores = np.array([score for score, _ in row], dtype=np.float32)
+        # Scale to the best score so lambda means the same for cosine, BM25 and fused scores
+        relevance = scores / scores.max() if scores.max() > 0 else scores
+        order = mmr_order(relevance, self._candidate_vectors([idx for _, idx in row]), mmr_lambda)
+        return [row[i] for i in order]
+
+    def _merge_adjacent(self, row: list[tuple[float, int]], k: int) -> list[dict[str, Any]]:
+        """Group neighboring chunks of the same section and format up to k merged results."""
+        groups: list[dict[str, Any]] = []  # Best first: {"key", "score", "chunks"}
+        for score, idx in row:
+            meta = self.metadata[idx]
+            # Chunks are neighbors by their order in the section, not by id: incremental
+            # builds give the new chunks of an edited section fresh ids. Databases built
+            # before the splitter recorded section_chunk fall back to ids.
+            key = (meta.get("source", ""), meta.get("section", ""), meta.get("section_index"))
+            position = meta.get("section_chunk", idx)
+            adjacent = [
+                group
+                for group in groups
+                if group["key"] == key and self._continues(group["chunks"], position, idx)
+            ]
+            if adjacent:
+                # Join every group this chunk touches into the best-ranked one
+                target = adjacent[0]
+                target["chunks"][position] = idx
+                for group in adjacent[1:]:
+                    target["chunks"].update(group["chunks"])
+                    groups.remove(group)
+            elif len(groups) < k:
+                groups.append({"key": key, "score": score, "chunks": {position: idx}})
+
+        results = []
+        for group in groups:
+            ids = [group["chunks"][position] for position in sorted(group["chunks"])]
+            result = self._format_result(group["score"], ids[0])
+            if len(ids) > 1:
+                result["content"] = merge_overlapping_texts([self.documents[i] for i in ids])
+                result["merged_chunk_ids"] = ids
+            results.append(result)
+        return results
+
+    def _continues(self, chunks: dict[int, int], position: int, idx: int) -> bool:
+        """Whether chunk idx directly precedes or follows a group, sharing overlap paragraphs."""
+        if position in chunks:
+            return False
+        before = chunks.get(position - 1)
+        after = chunks.get(position + 1)
+        return (
+            before is not None
+            and paragraph_overlap(self.documents[before], self.documents[idx]) > 0
+        ) or (
+            after is not None and paragraph_overlap(self.documents[idx], self.documents[after]) > 0
+        )
+
+    def _vector_candidates(
+        self,
+        query_embeddings: Sequence[np.ndarray | None],
+        k: int,
+        use_adaptive_threshold: bool,
+        min_threshold: float,
+        selection: FilterSelection | None = None,
+    ) -> list[list[tuple[float, int]]]:
+        """Scan the index for one or more query embeddings and filter each row."""
+        index = self._loaded_index()
+        query_matrix = np.array(query_embeddings, dtype=np.float32)
+        faiss.normalize_L2(query_matrix)
+        if self.reducer is not None:
+            query_matrix = self.reducer.transform(query_matrix)
 
         # Search with higher k to allow filtering
         search_k = min(k * 3, len(self.documents))  # Get more candidates for adaptive filtering
-        scores, indices = self.index.search(query_embedding, search_k)
-
-        # Format all candidate results
-        all_results = []
-        for score, idx in zip(scores[0], indices[0], strict=True):
-            if idx < len(self.documents) and idx >= 0:  # Valid index
-                # Apply minimum threshold to prevent very poor matches
-                if score < min_threshold:
-                    continue
-
-                result_meta = self.metadata[idx]
-
-                # Get proper title with fallback hierarchy
-                page_title = result_meta.get("page_title", "").strip()
-                if not page_title:
-                    # Try to extract from citation_url
-                    citation_url = result_meta.get("citation_url", "")
-                    if citation_url and citation_url != "/":
-                        # Convert URL to readable title
-                        url_parts = citation_url.strip("/").split("/")
-                        page_title = url_parts[-1].replace("-", " ").title()
-
-                # Final fallback
-                if not page_title:
-                    page_title = "Website Content"
-
-                all_results.append(
-                    {
-                        "score": float(score),
-                        "content": self.documents[idx],
-                        "metadata": result_meta,
-                        "citation_url": result_meta.get("citation_url", ""),
-                        "page_title": page_title,
-                        "citation": f"{page_title} ({result_meta.get('citation_url', '/')})",
-                    }
-                )
+        params = mask = None
+        if selection is not None:
+            # The selector restricts the scan itself, so no over-fetching is needed
+            search_k = min(search_k, selection.count)
+            params = search_parameters(index, self.index_type, selection.selector)
+            mask = selection.mask
+
+        if self.rerank_factor:
+            scores, indices = search_with_rerank(
+                index,
+                self.vectors,
+                query_matrix,
+                search_k,
+                self.rerank_factor,
+                params=params,
+                mask=mask,
+            )
+        else:
+            scores, indices = filtered_search(index, query_matrix, search_k, params, mask)
 
-        # Sort by score (higher is better)
-        all_results.sort(key=lambda x: x["score"], reverse=True)
+        return [
+            self._filter_results(row_scores, row_indices, k, use_adaptive_threshold, min_threshold)
+            for row_scores, row_indices in zip(scores, indices, strict=True)
+        ]
 
-        if not all_results:
+    def _lexical_candidates(
+        self,
+        query: str,
+        k: int,
+        use_adaptive_threshold: bool,
+        selection: FilterSelection | None = None,
+    ) -> list[tuple[float, int]]:
+        """Score a query against the BM25 index, with the same adaptive cutoff as vectors."""
+        if self.lexical_index is None:
+            raise ValueError("Lexical search needs lexical.bin; rebuild the vector database")
+        candidates = self.lexical_index.search(
+            query,
+            min(k * 3, len(self.documents)),
+            mask=selection.mask if selection is not None else None,
+        )
+        return self._select_candidates(candidates, k, use_adaptive_threshold)
+
+    @staticmethod
+    def _fuse_rankings(rankings: list[list[tuple[float, int]]], k: int) -> list[tuple[float, int]]:
+        """Combine ranked (score, index) lists with reciprocal rank fusion."""
+        fused: dict[int, float] = {}
+        for ranking in rankings:
+            for rank, (_, idx) in enumerate(ranking):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (RRF_K + rank + 1)
+        ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        return [(score, idx) for idx, score in ordered[:k]]
+
+    def embed_queries(self, queries: list[str]) -> list[np.ndarray]:
+        """Embed several queries, sending only cache misses to the embeddings API in one call."""
+        embeddings, missing = self._lookup_queries(queries)
+        if missing:
+            new_embeddings = self.embeddings_model.embed_documents(list(missing))
+            self._fill_queries(embeddings, missing, new_embeddings)
+        return embeddings
+
+    async def aembed_queries(self, queries: list[str]) -> list[np.ndarray]:
+        """Async version of embed_queries()."""
+        embeddings, missing = self._lookup_queries(queries)
+        if missing:
+            new_embeddings = await self.embeddings_model.aembed_documents(list(missing))
+            self._fill_queries(embeddings, missing, new_embeddings)
+        return embeddings
+
+    def _lookup_queries(self, queries: list[str]) -> tuple[list, dict[str, list[int]]]:
+        """Split queries into cached embeddings and positions of distinct cache misses."""
+        embeddings: list[np.ndarray | None] = [None] * len(queries)
+        missing: dict[str, list[int]] = {}
+
+        for i, query in enumerate(queries):
+            cached = self.query_cache.get(query) if self.query_cache is not None else None
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                missing.setdefault(query, []).append(i)
+
+        return embeddings, missing
+
+    def _fill_queries(self, embeddings: list, missing: dict[str, list[int]], new_embeddings):
+        """Store freshly computed embeddings in the cache and in their result positions."""
+        for (query, positions), embedding in zip(missing.items(), new_embeddings, strict=True):
+            vector = self._cache_query(query, embedding)
+            for i in positions:
+                embeddings[i] = vector
+
+    def _cache_query(self, query: str, embedding) -> np.ndarray:
+        if self.query_cache is not None:
+            return self.query_cache.put(query, embedding)
+        return np.asarray(embedding, dtype=np.float32)
+
+    def _filter_results(
+        self,
+        scores: np.ndarray,
+        indices: np.ndarray,
+        k: int,
+        use_adaptive_threshold: bool,
+        min_threshold: float,
+    ) -> list[tuple[float, int]]:
+        """Apply the minimum and adaptive thresholds to one row of FAISS results."""
+        # Keep valid candidates above the minimum threshold, best first
+        candidates = [
+            (float(score), int(idx))
+            for score, idx in zip(scores, indices, strict=True)
+            if 0 <= idx < len(self.documents) and score >= min_threshold
+        ]
+        candidates.sort(key=lambda x: x[0], reverse=True)
+        return self._select_candidates(candidates, k, use_adaptive_threshold)
+
+    @staticmethod
+    def _select_candidates(
+        candidates: list[tuple[float, int]], k: int, use_adaptive_threshold: bool
+    ) -> list[tuple[float, int]]:
+        """Cut a best-first candidate list at half the best score, keeping at most k."""
+        if not candidates:
             return []
 
         # Apply adaptive filtering if enabled
-        if use_adaptive_threshold and len(all_results) > 1:
-            best_score = all_results[0]["score"]
-            adaptive_threshold = best_score / 2.0  # Use half of the best score
-
-            # Filter results using adaptive threshold
-            filtered_results = []
-            for result in all_results:
-                if result["score"] >= adaptive_threshold:
-                    filtered_results.append(result)
-                else:
-                    # Stop adding results once we hit the threshold
+        if use_adaptive_threshold and len(candidates) > 1:
+            adaptive_threshold = candidates[0][0] / 2.0  # Use half of the best score
+
+            # Stop adding results once we hit the threshold
+            selected = []
+            for candidate in candidates:
+                if candidate[0] < adaptive_threshold:
                     break
+                selected.append(candidate)
 
             # Always include at least the best result, but cap at k results
-            results = filtered_results[:k] if filtered_results else [all_results[0]]
+            selected = selected[:k] if selected else [candidates[0]]
         else:
             # No adaptive filtering, just return top k
-            results = all_results[:k]
+            selected = candidates[:k]
 
-        return results
+        return selected
+
+    def _format_result(self, score: float, idx: int) -> dict[str, Any]:
+        """Build a search result for one chunk."""
+        result_meta = self.metadata[idx]
+
+        # Get proper title with fallback hierarchy
+        page_title = result_meta.get("page_title", "").strip()
+        if not page_title:
+            # Try to extract from citation_url
+            citation_url = result_meta.get("citation_url", "")
+            if citation_url and citation_url != "/":
+                # Convert URL to readable title
+                url_parts = citation_url.strip("/").split("/")
+                page_title = url_parts[-1].replace("-", " ").title()
+
+        # Final fallback
+        if not page_title:
+            page_title = "Website Content"
+
+        return {
+            "score": score,
+            "content": self.documents[idx],
+            "metadata": result_meta,
+            "citation_url": result_meta.get("citation_url", ""),
+            "page_title": page_title,
+            "citation": f"{page_title} ({result_meta.get('citation_url', '/')})",
+        }
 
     def get_stats(self) -> dict[str, Any]:
         """Get database statistics."""
@@ -186,6 +946,13 @@ class ProductionVectorLoader:
             "total_vectors": self.index.ntotal if self.index else 0,
             "embedding_dimension": self.index.d if self.index else 0,
             "database_path": str(self.db_path),
+            "mmap_enabled": self.use_mmap,
+            "mapped_bytes": self.mapped_bytes,
+            "private_bytes": self.private_bytes,
+            "lexical_terms": self.lexical_index.term_count if self.lexical_index else 0,
+            "stale_chunks": self.filter_index.stale_count if self.filter_index else 0,
+            **(self.query_cache.get_stats() if self.query_cache else {}),
+            **(self.result_cache.get_stats() if self.result_cache else {}),
             **self.build_info,
         }
 
@@ -193,9 +960,11 @@ class ProductionVectorLoader:
 # Convenience functions for easy integration
 
 
-def load_vector_db(db_path: str = "vector_db") -> ProductionVectorLoader:
+def load_vector_db(
+    db_path: str = "vector_db", use_mmap: bool = False, prefault: bool = False
+) -> ProductionVectorLoader:
     """Load production vector database."""
-    return ProductionVectorLoader(db_path)
+    return ProductionVectorLoader(db_path, use_mmap=use_mmap, prefault=prefault)
 
 
 def search_documents(